@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cost of loading LTIUserProfile rows with lazily decoded custom_attributes.
+
+    python benchmarks/bench_custom_attributes.py [profiles [lazy|eager]]
+
+Loads every profile as the code does now (custom_attributes left as JSON
+text until read), and with a post_init receiver that reads the field, which
+is what decoding on instantiation used to cost. Each mode runs in its own
+process so peak memory figures don't bleed into each other. Reports wall
+and CPU time and peak memory.
+"""
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.utils import Timer, peak_memory, setup_django  # noqa: E402
+
+ATTRIBUTES = json.dumps(dict(
+    ('custom_field_{}'.format(i), 'value {}'.format(i)) for i in range(10)))
+
+
+def populate(count):
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+
+    user = User.objects.create(username='bench')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO dj_pylti_baseltiobject (id, custom_attributes) '
+            'VALUES (%s, %s)', [(i, ATTRIBUTES) for i in range(1, count + 1)])
+        cursor.executemany(
+            'INSERT INTO dj_pylti_ltiuserprofile (baseltiobject_ptr_id, '
+            'user_id_int, lti_user_id, lis_person_contact_email_primary, '
+            'lis_person_name_family, lis_person_name_full, '
+            'lis_person_name_given) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            [(i, user.pk, 'user-{}'.format(i), 'u{}@example.edu'.format(i),
+              'Family', 'Given Family', 'Given')
+             for i in range(1, count + 1)])
+
+
+def load_all():
+    from dj_pylti.models import LTIUserProfile
+    return list(LTIUserProfile.objects.all())
+
+
+def eager_decode(sender, instance, **kwargs):
+    instance.custom_attributes  # pylint: disable=pointless-statement
+
+
+def run(label):
+    with Timer() as timer:
+        profiles, peak = peak_memory(load_all)
+    print('{:<6} {:>8} profiles  wall {:6.2f}s  cpu {:6.2f}s  '
+          'peak {:8.1f} MiB'.format(
+              label, len(profiles), timer.wall, timer.cpu,
+              peak / 1024.0 / 1024))
+
+
+def main(count, mode):
+    setup_django()
+    from django.db.models.signals import post_init
+    from dj_pylti.models import LTIUserProfile
+
+    populate(count)
+    if mode == 'eager':
+        post_init.connect(eager_decode, sender=LTIUserProfile)
+    run(mode)
+
+
+if __name__ == '__main__':
+    total = sys.argv[1] if len(sys.argv) > 1 else '100000'
+    if len(sys.argv) > 2:
+        main(int(total), sys.argv[2])
+    else:
+        for name in ('lazy', 'eager'):
+            subprocess.check_call([sys.executable, __file__, total, name])
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-launch overhead of the nonce replay check.
+
+    python benchmarks/bench_nonces.py [launches]
+
+Times ``check_nonce`` with the local TTL set and with the Django cache
+backend (locmem here; point CACHES at memcached/redis to measure those),
+while launches arrive fast enough for the local set to fill up with live
+nonces and then expire the oldest ones as new ones come in.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa: E402
+
+settings.configure(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}},
+    PYLTI_CONFIG={'nonce_window': 300},
+)
+
+from dj_pylti import nonces  # noqa: E402
+
+
+def bench(backend, launches):
+    settings.PYLTI_CONFIG['nonce_backend'] = backend
+    settings.PYLTI_CONFIG['nonce_cache_size'] = launches // 2
+    nonces.reset_nonce_store()
+    keys = [uuid.uuid4().hex for _ in range(launches)]
+    # the set holds a nonce for 600 seconds: spread the launches so that
+    # it is full of live nonces halfway through
+    step = 1.01 * 600 / (launches // 2)
+    start = time.time()
+    times = [start + index * step for index in range(launches)]
+    started = time.time()
+    for key, now in zip(keys, times):
+        assert nonces.check_nonce('1', key, now, now=now) is None
+    elapsed = time.time() - started
+    # replays are rejected at the same cost
+    now = times[-1]
+    started = time.time()
+    for key in keys[-1000:]:
+        assert nonces.check_nonce('1', key, now, now=now) is not None
+    replay = time.time() - started
+    print('{:<6} {:>9} launches  {:6.2f} us/launch  {:6.2f} us/replay'.format(
+        backend, launches, elapsed / launches * 1e6, replay / 1000 * 1e6))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for name in ('local', 'cache'):
+        bench(name, count)
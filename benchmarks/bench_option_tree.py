@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rendering large OptionList trees for the configuration cartridge.
+
+    python benchmarks/bench_option_tree.py [nodes [fanout]]
+
+Builds one configuration with ``nodes`` OptionLists (each node has
+``fanout`` children, two properties per node) and compares
+``Configuration.options_xml`` (one query for the tree, one for the
+properties) with walking ``children`` and ``properties`` node by node,
+which is what nested template loops do. Also times the migration backfill
+of the materialized paths.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.utils import Timer, setup_django  # noqa: E402
+
+
+def populate(count, fanout):
+    from dj_pylti.models import (Configuration, OptionList, OptionProperty,
+                                 PropertyName)
+
+    config = Configuration.objects.create(launch_url='/launch')
+    names = [PropertyName.objects.create(name=name) for name in ('url', 'text')]
+    level = [OptionList.objects.create(name='course_navigation',
+                                       config=config)]
+    created = 1
+    while created < count:
+        next_level = []
+        for parent in level:
+            for _ in range(fanout):
+                if created == count:
+                    break
+                next_level.append(OptionList.objects.create(name='labels',
+                                                            parent=parent))
+                created += 1
+        level = next_level
+    OptionProperty.objects.bulk_create(
+        OptionProperty(option=name, value='value', option_list=node)
+        for node in OptionList.objects.all() for name in names)
+    return config
+
+
+def walk(nodes, lines):
+    # what {% for %} over options.all / children.all / properties.all does
+    for node in nodes:
+        lines.append(node.name)
+        for prop in node.properties.all():
+            lines.append('{} {}'.format(prop.option.name, prop.value))
+        walk(node.children.all(), lines)
+    return lines
+
+
+def main(count, fanout):
+    setup_django()
+    from django.apps import apps
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    config = populate(count, fanout)
+    connection.queries_log.clear()
+
+    with CaptureQueriesContext(connection) as queries, Timer() as timer:
+        config.options_xml()
+    print('materialized path  {:>6} nodes  {:5} queries  {:8.3f}s'.format(
+        count, len(queries), timer.wall))
+
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries, Timer() as timer:
+        walk(config.options.all(), [])
+    print('node by node       {:>6} nodes  {:5} queries  {:8.3f}s'.format(
+        count, len(queries), timer.wall))
+
+    backfill = __import__('dj_pylti.migrations.0004_optionlist_path',
+                          fromlist=['backfill_paths']).backfill_paths
+    with Timer() as timer:
+        backfill(apps, None)
+    print('backfill           {:>6} nodes  {:>13}  {:8.3f}s'.format(
+        count, '', timer.wall))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4)
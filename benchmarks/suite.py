@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the launch, session, role, configuration and grade
+passback paths.
+
+    python benchmarks/suite.py [--iterations N] [--only CASE ...]
+                               [--output results.json] [--compare old.json]
+
+Every case runs against the test settings (in-memory SQLite, locmem cache)
+with requests signed like the test suite's. It reports throughput, latency
+percentiles and database queries per operation, prints a table and writes
+the results as JSON, so that runs of different releases can be compared
+with ``--compare``.
+
+Cases:
+
+launch_first        verify_request for a user seen for the first time
+launch_repeat       verify_request for a user relaunching the same link
+session_view        a view reached through the Django session
+session_view_token  the same view reached with a signed launch token
+is_role             LTI.is_role on a fresh LTI object
+config_cold         ConfigurationView with an empty cache
+config_warm         ConfigurationView served from the cache
+post_grade          LTI.post_grade against a local stub outcome service
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.utils import ROOT, setup_django  # noqa: E402
+
+CASES = OrderedDict()
+
+PERSON = {
+    'lis_person_name_family': 'Pile',
+    'lis_person_name_given': 'Gomer',
+    'lis_person_contact_email_primary': 'gomer@example.com',
+    'context_label': 'Reading Ancient Greek',
+    'resource_link_title': 'Week 1',
+}
+
+POX_SUCCESS = (b'<?xml version="1.0" encoding="UTF-8"?>'
+               b'<imsx_POXEnvelopeResponse><imsx_POXHeader>'
+               b'<imsx_POXResponseHeaderInfo><imsx_statusInfo>'
+               b'<imsx_codeMajor>success</imsx_codeMajor>'
+               b'</imsx_statusInfo></imsx_POXResponseHeaderInfo>'
+               b'</imsx_POXHeader></imsx_POXEnvelopeResponse>')
+
+
+def case(func):
+    """
+    Register a case: a context manager that takes the number of operations
+    to prepare and yields ``op(i)``
+    """
+    CASES[func.__name__] = contextmanager(func)
+    return func
+
+
+def launch_url():
+    return 'http://testserver/lti/initial/?'
+
+
+def signed_launches(consumer, count, **params):
+    from dj_pylti.tests import generate_launch_request
+    return [generate_launch_request(
+        consumer, launch_url(),
+        add_params=dict(PERSON, **dict((k, v(i)) if callable(v) else (k, v)
+                                       for k, v in params.items())))
+            for i in range(count)]
+
+
+def post_launch(client, launch):
+    response = client.post(*launch)
+    assert response.status_code == 200, response.content
+    return response
+
+
+@case
+def launch_first(env, count):
+    from django.test import Client
+    launches = signed_launches(env.consumer, count,
+                               user_id=lambda i: uuid.uuid4().hex)
+    yield lambda i: post_launch(Client(), launches[i])
+
+
+@case
+def launch_repeat(env, count):
+    from django.test import Client
+    client = Client()
+    user_id = uuid.uuid4().hex
+    launches = signed_launches(env.consumer, count + 1, user_id=user_id)
+    post_launch(client, launches[-1])
+    yield lambda i: post_launch(client, launches[i])
+
+
+def session_client(env):
+    from django.test import Client
+    client = Client()
+    post_launch(client, signed_launches(env.consumer, 1,
+                                        user_id=uuid.uuid4().hex)[0])
+    return client
+
+
+def get_name(client, **extra):
+    response = client.get('/lti/name/', **extra)
+    assert response.status_code == 200, response.content
+    return response
+
+
+@case
+def session_view(env, count):
+    client = session_client(env)
+    yield lambda i: get_name(client)
+
+
+@case
+def session_view_token(env, count):
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+    with override_settings(PYLTI_CONFIG=dict(settings.PYLTI_CONFIG,
+                                             launch_token=True)):
+        token = session_client(env).cookies['dj_pylti_token'].value
+        client = Client()
+        yield lambda i: get_name(client, HTTP_X_LTI_TOKEN=token)
+
+
+@case
+def is_role(env, count):
+    from django.test import RequestFactory
+    from dj_pylti.claims import store_claims
+    from dj_pylti.models import LTI
+    request = RequestFactory().get('/')
+    request.session = {}
+    store_claims(request.session, {
+        'roles': 'Instructor,urn:lti:instrole:ims/lis/Administrator'})
+
+    def op(i):
+        the_lti = LTI((), {}, request)
+        assert the_lti.is_instructor() and not the_lti.is_student()
+    yield op
+
+
+def configuration(env):
+    from dj_pylti.models import (Configuration, OptionList, OptionProperty,
+                                 PropertyName)
+    config = Configuration.objects.create(
+        launch_url='/launch', title='Tool', description='A tool',
+        properties_privacy_level='public')
+    url = PropertyName.objects.create(name='url')
+    text = PropertyName.objects.create(name='text')
+    for name in ('course_navigation', 'editor_button', 'resource_selection'):
+        option = OptionList.objects.create(name=name, config=config)
+        OptionProperty.objects.create(option=url, value='/' + name,
+                                      option_list=option)
+        for lang in range(5):
+            labels = OptionList.objects.create(name='labels', parent=option)
+            OptionProperty.objects.create(option=text, value=str(lang),
+                                          option_list=labels)
+    return '/config/{}'.format(config.pk)
+
+
+def get_config(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return response
+
+
+@case
+def config_cold(env, count):
+    from django.core.cache import cache
+    from django.test import Client
+    url, client = configuration(env), Client()
+
+    def op(i):
+        cache.clear()
+        get_config(client, url)
+    yield op
+
+
+@case
+def config_warm(env, count):
+    from django.test import Client
+    url, client = configuration(env), Client()
+    get_config(client, url)
+    yield lambda i: get_config(client, url)
+
+
+@contextmanager
+def stub_outcome_service():
+    """
+    A local HTTP server answering every request with a POX success
+    """
+    from django.utils.six.moves import BaseHTTPServer, socketserver
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body go out as separate writes; without this every
+        # response waits for the client's delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_POST(self):  # noqa: N802
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(POX_SUCCESS)))
+            self.end_headers()
+            self.wfile.write(POX_SUCCESS)
+
+        do_PUT = do_POST  # noqa: N815
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        # keep-alive connections of the outcome transport's pool are
+        # served on their own threads
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}/grade_handler'.format(server.server_port)
+    finally:
+        from dj_pylti.transport import reset_transport
+        reset_transport()
+        server.shutdown()
+        server.server_close()
+
+
+@case
+def post_grade(env, count):
+    from django.test import RequestFactory
+    from dj_pylti.claims import store_claims
+    from dj_pylti.models import LTI
+    with stub_outcome_service() as url:
+        request = RequestFactory().get('/')
+        request.session = {}
+        store_claims(request.session, {
+            'oauth_consumer_key': env.consumer.key,
+            'lis_result_sourcedid': 'sourcedid',
+            'lis_outcome_service_url': url})
+
+        def op(i):
+            assert LTI((), {}, request).post_grade(0.5)
+        yield op
+
+
+def run_case(env, name, iterations, warmup):
+    from django.db import connection
+    from dj_pylti.loadgen import percentile
+    latencies, queries = [], 0
+    with CASES[name](env, warmup + iterations) as op:
+        for i in range(warmup):
+            op(i)
+        for i in range(warmup, warmup + iterations):
+            connection.queries_log.clear()
+            started = time.time()
+            op(i)
+            latencies.append(time.time() - started)
+            queries += len(connection.queries_log)
+    total = sum(latencies)
+    latencies.sort()
+    return OrderedDict([
+        ('iterations', iterations),
+        ('seconds', round(total, 6)),
+        ('ops_per_sec', round(iterations / total, 2) if total else None),
+        ('mean_ms', round(total / iterations * 1e3, 4)),
+        ('p50_ms', round(percentile(latencies, 0.50) * 1e3, 4)),
+        ('p90_ms', round(percentile(latencies, 0.90) * 1e3, 4)),
+        ('p99_ms', round(percentile(latencies, 0.99) * 1e3, 4)),
+        ('max_ms', round(latencies[-1] * 1e3, 4)),
+        ('queries_per_op', round(queries / iterations, 2)),
+    ])
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+            stderr=open(os.devnull, 'w')).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Environment(object):
+    """
+    Objects shared by the cases
+    """
+
+    def __init__(self):
+        from dj_pylti.models import LTIConsumer
+        self.consumer = LTIConsumer.objects.create(name='bench')
+
+
+def run(names, iterations, warmup):
+    setup_django()
+    import django
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    import dj_pylti
+
+    setup_test_environment()
+    connection.force_debug_cursor = True
+    env = Environment()
+    results = OrderedDict()
+    for name in names:
+        results[name] = run_case(env, name, iterations, warmup)
+        print_row(name, results[name], file=sys.stderr)
+    return OrderedDict([
+        ('meta', OrderedDict([
+            ('dj_pylti', dj_pylti.__version__),
+            ('revision', git_revision()),
+            ('python', platform.python_version()),
+            ('implementation', platform.python_implementation()),
+            ('django', django.get_version()),
+            ('platform', platform.platform()),
+            ('database', connection.vendor),
+            ('timestamp', int(time.time())),
+            ('warmup', warmup),
+        ])),
+        ('results', results),
+    ])
+
+
+def print_row(name, result, file=sys.stdout):
+    print('{:<20} {:>10.1f} ops/s  p50 {:>8.3f} ms  p90 {:>8.3f} ms  '
+          'p99 {:>8.3f} ms  {:>5.1f} queries'.format(
+              name, result['ops_per_sec'], result['p50_ms'],
+              result['p90_ms'], result['p99_ms'],
+              result['queries_per_op']), file=file)
+
+
+def compare(baseline, current):
+    """
+    Print the change of throughput and p99 latency against a previous run
+    """
+    print('{:<20} {:>12} {:>12} {:>10}'.format('case', 'ops/s', 'p99',
+                                               'queries'))
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        print('{:<20} {:>+11.1f}% {:>+11.1f}% {:>+10.2f}'.format(
+            name,
+            (result['ops_per_sec'] / before['ops_per_sec'] - 1) * 100,
+            (result['p99_ms'] / before['p99_ms'] - 1) * 100,
+            result['queries_per_op'] - before['queries_per_op']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--only', nargs='+', choices=list(CASES),
+                        default=list(CASES))
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run')
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.iterations, args.warmup)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(json.load(baseline), results)
+
+
+if __name__ == '__main__':
+    main()
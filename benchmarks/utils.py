@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the benchmark scripts.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(settings_module='tests.settings'):
+    """
+    Configure Django with the test settings and create a fresh test
+    database (in memory by default)
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0, keepdb=False)
+
+
+class Timer(object):
+    """
+    Context manager measuring wall clock and CPU seconds
+    """
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = time.clock() if hasattr(time, 'clock') else time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.time() - self.wall
+        cpu = time.clock() if hasattr(time, 'clock') else time.process_time()
+        self.cpu = cpu - self.cpu
+
+
+def peak_memory(func):
+    """
+    Run ``func`` and return (result, peak bytes allocated while it ran)
+
+    Uses tracemalloc where available (Python 3), otherwise reports the
+    growth of the process' maximum RSS.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        import resource
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = func()
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return result, (after - before) * 1024
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
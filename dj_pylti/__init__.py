@@ -1 +1,2 @@
 __version__ = '0.0.2'
+default_app_config = 'dj_pylti.apps.DjPyltiConfig'
@@ -1,8 +1,27 @@
 from django.contrib import admin
-from .models import LTIConsumer, OptionProperty, OptionList, PropertyName, Configuration, LTIUserProfile
+from django.db.models import Count, Q
+from .models import (LTIConsumer, OptionProperty, OptionList, PropertyName,
+    Configuration, LTIUserProfile, LTIResource, LTIContext, OutcomeMessage)
+from .pagination import EstimatedCountPaginator
 
 # Register your models here.
 
+class LargeTableAdmin(admin.ModelAdmin):
+  """Changelists that stay fast on large tables: estimated counts, no
+  second COUNT(*) for filtered results, and exact-match search over
+  ``search_fields`` so that lookups can use their indexes"""
+  paginator = EstimatedCountPaginator
+  show_full_result_count = False
+
+  def get_search_results(self, request, queryset, search_term):
+    search_term = search_term.strip()
+    if not search_term or not self.search_fields:
+      return queryset, False
+    query = Q()
+    for field in self.search_fields:
+      query |= Q(**{field: search_term})
+    return queryset.filter(query), False
+
 class LTIConsumerAdmin(admin.ModelAdmin):
   readonly_fields = ('secret',)
   list_display = ('id', 'name', 'concat_secret')
@@ -13,28 +32,75 @@ class LTIConsumerAdmin(admin.ModelAdmin):
     return instance.concat_secret()
   concat_secret.short_description = 'secret'
 
+class LTIUserProfileAdmin(LargeTableAdmin):
+  list_display = ('lti_user_id', 'user', 'lis_person_name_full',
+      'lis_person_contact_email_primary')
+  list_select_related = ('user',)
+  raw_id_fields = ('user',)
+  search_fields = ('lti_user_id', 'user__username')
+
+class LTIResourceAdmin(LargeTableAdmin):
+  list_display = ('resource_link_id', 'resource_link_title')
+  search_fields = ('resource_link_id',)
+
+class LTIContextAdmin(LargeTableAdmin):
+  list_display = ('context_id', 'context_label')
+  search_fields = ('context_id',)
+
 admin.site.register(LTIConsumer, LTIConsumerAdmin)
-admin.site.register(LTIUserProfile)
+admin.site.register(LTIUserProfile, LTIUserProfileAdmin)
+admin.site.register(LTIResource, LTIResourceAdmin)
+admin.site.register(LTIContext, LTIContextAdmin)
 
 class OptionPropertyInlineAdmin(admin.TabularInline):
   model = OptionProperty
   extra = 1
+  raw_id_fields = ('option',)
 
 class OptionListInlineAdmin(admin.TabularInline):
   model = OptionList
+  fk_name = 'config'
   extra = 1
   show_change_link = True
+  raw_id_fields = ('parent',)
   inlines = (OptionPropertyInlineAdmin,)
 
+class OptionListChildInlineAdmin(OptionListInlineAdmin):
+  fk_name = 'parent'
+  raw_id_fields = ('config',)
+
 class OptionListAdmin(admin.ModelAdmin):
   list_display = ('name', 'config', 'parent', 'num_properties')
-  inlines = (OptionPropertyInlineAdmin,OptionListInlineAdmin, )
+  list_select_related = ('config', 'parent')
+  raw_id_fields = ('parent', 'config')
+  inlines = (OptionPropertyInlineAdmin,OptionListChildInlineAdmin, )
+
+  def get_queryset(self, request):
+    return super(OptionListAdmin, self).get_queryset(request).annotate(
+        _num_properties=Count('properties'))
+
+  def num_properties(self, instance):
+    return instance._num_properties
+  num_properties.admin_order_field = '_num_properties'
+
+class OptionPropertyAdmin(LargeTableAdmin):
+  list_display = ('option', 'value', 'option_list')
+  list_select_related = ('option', 'option_list')
+  raw_id_fields = ('option', 'option_list')
 
 class ConfigAdmin(admin.ModelAdmin):
   inlines = (OptionListInlineAdmin,)
 
 class PropertyNameAdmin(admin.ModelAdmin):
   list_display = ('name', 'default', 'choices')
+
+class OutcomeMessageAdmin(LargeTableAdmin):
+  list_display = ('id', 'consumer_key', 'status', 'attempts', 'available_at',
+      'sent_at')
+  list_filter = ('status',)
+  readonly_fields = ('created', 'sent_at', 'lease_owner', 'lease_expires')
 admin.site.register(Configuration, ConfigAdmin)
 admin.site.register(OptionList, OptionListAdmin)
+admin.site.register(OptionProperty, OptionPropertyAdmin)
 admin.site.register(PropertyName, PropertyNameAdmin)
+admin.site.register(OutcomeMessage, OutcomeMessageAdmin)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Support for ``async def`` views protected by ``@lti``.
+
+On Python 3 the decorator recognises coroutine functions and returns a
+wrapper that is itself a coroutine function, so an ASGI server can run many
+launches and grade posts on one event loop. The blocking parts (OAuth
+verification, nonce and ORM work, grade passback over the pooled keep-alive
+transport) run in worker threads through ``run_sync``; the event loop only
+waits on futures.
+
+``run_sync`` uses ``asgiref.sync.sync_to_async`` when asgiref is installed
+and otherwise a thread pool of ``PYLTI_CONFIG['async_threads']`` threads
+(default 10). Either way Django's stale database connections are closed
+around each call, like a request would.
+
+Nothing here uses ``async``/``await`` syntax, so the module still imports
+on Python 2. ``async def`` and the coroutine helpers used here
+(``inspect.iscoroutinefunction``, ``inspect.isawaitable``,
+``loop.create_future``) arrived in Python 3.5, so before that ``asyncio`` is
+``None`` and ``@lti`` wraps every view as a plain function.
+"""
+from __future__ import unicode_literals
+
+import functools
+import inspect
+import sys
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .cache import pylti_config
+
+if sys.version_info >= (3, 5):
+    import asyncio
+else:  # Python 2 and 3.4: no async def views
+    asyncio = None
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_async_view(function):
+    """
+    True for ``async def`` views and functions marked as coroutine
+    functions
+    """
+    if asyncio is None:
+        return False
+    return (asyncio.iscoroutinefunction(function) or
+            inspect.iscoroutinefunction(function))
+
+
+def mark_coroutine_function(function):
+    """
+    Make ``function``, which returns an awaitable, pass for a coroutine
+    function (what Django's ASGI handler checks for)
+    """
+    mark = getattr(inspect, 'markcoroutinefunction', None)
+    if mark is not None:  # Python 3.12+
+        return mark(function)
+    function._is_coroutine = asyncio.coroutines._is_coroutine  # pylint: disable=protected-access
+    return function
+
+
+def get_executor():
+    """
+    The process-wide thread pool used when asgiref is not installed
+    """
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(
+                    max_workers=pylti_config().get('async_threads', 10))
+    return _executor
+
+
+def reset_executor():
+    global _executor  # pylint: disable=global-statement
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(sender, setting, **kwargs):
+    if setting == 'PYLTI_CONFIG':
+        reset_executor()
+
+
+def _with_connections(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_sync(func, *args, **kwargs):
+    """
+    Awaitable result of ``func(*args, **kwargs)`` run in a worker thread
+    """
+    if asyncio is None:
+        raise ImproperlyConfigured('async views need Python 3.5+')
+    call = functools.partial(_with_connections, func, *args, **kwargs)
+    if sync_to_async is not None:
+        return sync_to_async(call, thread_sensitive=False)()
+    return asyncio.get_event_loop().run_in_executor(get_executor(), call)
+
+
+def then(awaitable, callback, errback=None):
+    """
+    Future for ``callback(result of awaitable)``, or ``errback(exception)``
+    when the awaitable raised. Either may return another awaitable, which
+    is waited for in turn.
+    """
+    loop = asyncio.get_event_loop()
+    outcome = loop.create_future()
+
+    def settle(future):
+        if outcome.cancelled():
+            return
+        if future.cancelled():
+            outcome.cancel()
+        elif future.exception() is not None:
+            outcome.set_exception(future.exception())
+        else:
+            outcome.set_result(future.result())
+
+    def step(future):
+        if outcome.cancelled():
+            return
+        try:
+            if future.cancelled():
+                outcome.cancel()
+                return
+            exception = future.exception()
+            if exception is None:
+                value = callback(future.result())
+            elif errback is not None:
+                value = errback(exception)
+            else:
+                raise exception
+        except BaseException as exception:  # pylint: disable=broad-except
+            outcome.set_exception(exception)
+            return
+        if inspect.isawaitable(value):
+            asyncio.ensure_future(value).add_done_callback(settle)
+        else:
+            outcome.set_result(value)
+
+    asyncio.ensure_future(awaitable).add_done_callback(step)
+    return outcome
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 
 class DjPyltiConfig(AppConfig):
     name = 'dj_pylti'
+
+    def ready(self):
+        from .models import compile_roles
+        from .urlfix import reload_url_fix
+        compile_roles()
+        reload_url_fix()
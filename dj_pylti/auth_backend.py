@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
 from django.views.decorators.clickjacking import xframe_options_exempt
 
-from models import *
+from .models import *
 import json
 import logging
+import uuid
 
 from django.contrib.auth import authenticate
 from django.contrib.auth import logout
@@ -17,6 +20,11 @@ from functools import wraps
 
 from pylti.common import LTIException
 
+from . import aio
+from .metrics import PhaseTimer, time_session_save
+from .middleware import get_lti
+from .tokens import set_token_cookie, token_cookie_name
+
 log = logging.getLogger('django_lti')  # pylint: disable=invalid-name
 
 def default_error(exception=None):
@@ -25,6 +33,27 @@ def default_error(exception=None):
     return HttpResponse("There was an LTI communication error: {}".format(exception), status=500)# , mimetype='application/json')
     #return , 500
 
+# (User field, launch parameter)
+USER_PARAMS = (
+    ('first_name', 'lis_person_name_given'),
+    ('last_name', 'lis_person_name_family'),
+    ('email', 'lis_person_contact_email_primary'),
+)
+
+def is_provisioned_user(user):
+    """
+    True for a User that LTI provisioning could have created: no usable
+    password, no staff or superuser flag and no LTI profile
+    """
+    return (not user.has_usable_password() and not user.is_staff and
+            not user.is_superuser and
+            not LTIUserProfile.objects.filter(user=user).exists())
+
+def generated_username():
+    """A random username for LTI users whose user_id is a local username"""
+    max_length = User._meta.get_field('username').max_length
+    return 'lti-{}'.format(uuid.uuid4().hex)[:max_length]
+
 class DjangoLTIAuthBackend(object):
 
   def authenticate(self, params=None):
@@ -34,27 +63,95 @@ class DjangoLTIAuthBackend(object):
 
     if params and params.get('user_id'):
 
-      # do the lti authentication here
-      lti_user_id = params.get('user_id')
+      with PhaseTimer('authenticate', outcome='existing',
+          consumer=params.get('oauth_consumer_key', '')) as timer:
+        # do the lti authentication here
+        lti_user_id = params.get('user_id')
+
+        try:
+          user_profile = LTIUserProfile.objects.select_related('user').get(lti_user_id=lti_user_id)
+          self.update_user(user_profile.user, params)
+        except LTIUserProfile.DoesNotExist:
+          timer.outcome = 'created'
+          user_profile = self.provision(params)
+
+        # LTI.verify_request updates this profile; save it a lookup
+        user = user_profile.user
+        user.lti_profile = user_profile
+        return user
 
-      try:
-        user_profile = LTIUserProfile.objects.get(lti_user_id=lti_user_id)
-      except LTIUserProfile.DoesNotExist:
-        user, created = User.objects.get_or_create(username=params['user_id'],
-            first_name=params.get('lis_person_name_given'),
-            last_name=params.get('lis_person_name_family'),
-            email=params.get('lis_person_contact_email_primary'),
-            )
-        user_profile = LTIUserProfile.objects.create(lti_user_id=params['user_id'], user=user)
+  @staticmethod
+  def user_fields(params):
+    """User fields taken from the launch; the LTI user_id is the identity"""
+    return dict((field, params[param]) for field, param in USER_PARAMS
+        if params.get(param) is not None)
 
+  def update_user(self, user, params):
+    """Copy changed names and email from the launch; no write otherwise"""
+    fields = self.user_fields(params)
+    changed = [field for field, value in fields.items()
+        if getattr(user, field) != value]
+    if changed:
+      for field in changed:
+        setattr(user, field, fields[field])
+      user.save(update_fields=changed)
 
-      return user_profile.user
+  def provision(self, params):
+    """Create the User and LTIUserProfile of a first launch
+
+    Both are keyed on the LTI user_id only. The common case is two inserts;
+    when a concurrent first launch got there first, the rows it created are
+    used instead. A User that merely has the LTI user_id as its username is
+    only taken over when LTI provisioning created it (see
+    is_provisioned_user); a local account gets a new user next to it.
+
+    :raises: IntegrityError when the rows that caused the conflict are not
+        visible in the current transaction; retry it as a whole
+    """
+    lti_user_id = params['user_id']
+    fields = dict(dict.fromkeys([field for field, _ in USER_PARAMS], ''),
+        **self.user_fields(params))
+    profile = profile_fields(params)
+    try:
+      return self.create_profile(lti_user_id, lti_user_id, fields, profile)
+    except IntegrityError as exc:
+      conflict = exc
+    try:
+      user_profile = LTIUserProfile.objects.select_related('user').get(
+          lti_user_id=lti_user_id)
+      self.update_user(user_profile.user, params)
+      return user_profile
+    except LTIUserProfile.DoesNotExist:
+      pass
+    user = User.objects.filter(username=lti_user_id).first()
+    if user is None:
+      raise conflict
+    if is_provisioned_user(user):
+      # left without a profile by an older release
+      self.update_user(user, params)
+      return LTIUserProfile.objects.select_related('user').create(
+          lti_user_id=lti_user_id, user=user, **profile)
+    log.warning('LTI user %s is not the local user with that username',
+        lti_user_id)
+    return self.create_profile(lti_user_id, generated_username(), fields,
+        profile)
+
+  @staticmethod
+  def create_profile(lti_user_id, username, user_fields, profile_values):
+    """A new User, without a usable password, and its LTIUserProfile, with
+    their fields already set so that the launch does not update them"""
+    with transaction.atomic():
+      user = User.objects.create(username=username,
+          password=make_password(None), **user_fields)
+      return LTIUserProfile.objects.create(lti_user_id=lti_user_id,
+          user=user, **profile_values)
 
   def get_user(self, user_id): #user_id is the primary key for a user
     """The get_user method takes a user_id – which could be a username,
     database ID or whatever, but has to be the primary key of your User object
     – and returns a User object."""
-    return User.objects.get(pk=user_id)
+    # cached briefly, with the LTI profile as user.lti_profile
+    return cached_user(user_id)
 
   #def has_perm(self, user_obj, perm, obj,  **kwargs):
   #  print 'user', user_obj
@@ -65,6 +162,43 @@ class DjangoLTIAuthBackend(object):
 
 
 
+def check_lti(request, request_type='any', role='any'):
+    """
+    The request's shared LTI object (see dj_pylti.middleware), once it
+    passes the request type and role checks; checks it already passed are
+    not repeated
+
+    :raises: LTIException
+    """
+    the_lti = get_lti(request)
+    time_session_save(request, consumer=the_lti._consumer_label,
+                      request_type=request_type)
+    the_lti.verify(request_type)
+    the_lti._check_role(role)  # pylint: disable=protected-access
+    if 'lti' not in request.__dict__:
+        request.lti = the_lti
+    return the_lti
+
+
+def finish_response(request, the_lti, response):
+    """
+    Hand the launch token to the browser, or remove it
+    """
+    if the_lti.token:
+        set_token_cookie(response, the_lti.token, secure=request.is_secure())
+    elif the_lti.token == '':
+        response.delete_cookie(token_cookie_name())
+    return response
+
+
+def error_response(error, lti_exception, args, kwargs):
+    exception = dict()
+    exception['exception'] = lti_exception
+    exception['kwargs'] = kwargs
+    exception['args'] = args
+    return error(exception=exception)
+
+
 def lti( request='any', error=default_error, role='any',
         *lti_args, **lti_kwargs):
     """
@@ -93,9 +227,8 @@ def lti( request='any', error=default_error, role='any',
             """
             request = args[0]
             try:
-                the_lti = LTI(lti_args, lti_kwargs, args[0])
-                the_lti.verify()
-                the_lti._check_role()  # pylint: disable=protected-access
+                the_lti = check_lti(request, lti_kwargs['request'],
+                                    lti_kwargs['role'])
                 kwargs['lti'] = the_lti
 
                 # All good to go, store all of the LTI params in a
@@ -103,16 +236,46 @@ def lti( request='any', error=default_error, role='any',
                 #if request.method == 'POST':
                 #  request.session['lti_vals'] = request.POST
 
-                return function(*args, **kwargs)
+                response = function(*args, **kwargs)
+                return finish_response(request, the_lti, response)
             except LTIException as lti_exception:
-                error = lti_kwargs.get('error')
-                exception = dict()
-                exception['exception'] = lti_exception
-                exception['kwargs'] = kwargs
-                exception['args'] = args
-                return error(exception=exception)
+                return error_response(lti_kwargs.get('error'), lti_exception,
+                                      args, kwargs)
 
+        @wraps(function)
+        def async_wrapper(*args, **kwargs):
+            """
+            ``wrapper`` for ``async def`` views: returns an awaitable, and
+            the blocking checks run in a worker thread
+            """
+            request = args[0]
+            the_lti = get_lti(request)
+            time_session_save(request, consumer=the_lti._consumer_label,
+                              request_type=lti_kwargs['request'])
 
+            def call_view(_):
+                if 'lti' not in request.__dict__:
+                    request.lti = the_lti
+                kwargs['lti'] = the_lti
+                return function(*args, **kwargs)
+
+            def rejected(exception):
+                if isinstance(exception, LTIException):
+                    return error_response(lti_kwargs.get('error'), exception,
+                                          args, kwargs)
+                raise exception
+
+            # pylint: disable=protected-access
+            checked = aio.then(the_lti.averify(lti_kwargs['request']),
+                               lambda _: the_lti._acheck_role(
+                                   lti_kwargs['role']))
+            return aio.then(aio.then(checked, call_view),
+                            lambda response: finish_response(
+                                request, the_lti, response),
+                            rejected)
+
+        if aio.is_async_view(function):
+            return aio.mark_coroutine_function(async_wrapper)
         return wrapper
 
     lti_kwargs['request'] = request
@@ -121,3 +284,24 @@ def lti( request='any', error=default_error, role='any',
 
     return _lti
 
+
+
+class LTIMixin(object):
+    """
+    Class-based view counterpart of the ``lti`` decorator: set
+    ``lti_request``, ``lti_role`` and ``lti_error`` like the decorator's
+    arguments. The view finds the LTI object in ``self.lti``.
+    """
+    lti_request = 'any'
+    lti_role = 'any'
+    lti_error = staticmethod(default_error)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.lti = check_lti(request, self.lti_request, self.lti_role)
+            response = super(LTIMixin, self).dispatch(request, *args,
+                                                      **kwargs)
+        except LTIException as lti_exception:
+            return error_response(self.lti_error, lti_exception,
+                                  (request,) + args, kwargs)
+        return finish_response(request, self.lti, response)
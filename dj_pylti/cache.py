@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Caching helpers shared by dj_pylti.
+
+``TieredCache`` puts a small per-process LRU in front of a Django cache,
+which in turn sits in front of a loader function (usually a database
+lookup). Local entries expire after a short TTL so that invalidations made
+by other processes are picked up without a round trip on every read.
+"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+def pylti_config():
+    """
+    PYLTI_CONFIG from settings, or an empty dict when it is not set
+    """
+    return getattr(settings, 'PYLTI_CONFIG', {}) or {}
+
+
+def shared_cache():
+    """
+    The Django cache named by PYLTI_CONFIG['cache_alias'] (default
+    'default')
+    """
+    return caches[pylti_config().get('cache_alias', 'default')]
+
+
+class LRUCache(object):
+    """
+    Thread-safe, bounded, least-recently-used mapping with an optional TTL
+    per entry.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                return default
+            self._data[key] = (value, expires)
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+
+class TieredCache(object):
+    """
+    Read-through cache: per-process LRU, then the Django cache, then
+    ``loader(key)``.
+
+    ``None`` returned by the loader is treated as "not found" and is not
+    cached, so a missing row is looked up again on the next call.
+    """
+
+    def __init__(self, prefix, loader, maxsize=128, local_ttl=60,
+                 timeout=300, cache_alias=None):
+        self.prefix = prefix
+        self.loader = loader
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.local = LRUCache(maxsize=maxsize, ttl=local_ttl)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def shared(self):
+        if self.cache_alias:
+            return caches[self.cache_alias]
+        return shared_cache()
+
+    def make_key(self, key):
+        return 'dj_pylti:{}:{}'.format(self.prefix, key)
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def get(self, key):
+        """
+        Return the cached value for ``key``, loading it on a miss
+        """
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count('local_hits')
+            return value
+
+        value = self.shared.get(self.make_key(key), _MISSING)
+        if value is not _MISSING:
+            self._count('shared_hits')
+            self.local.set(key, value)
+            return value
+
+        self._count('misses')
+        value = self.loader(key)
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.shared.set(self.make_key(key), value, self.timeout)
+        self.local.set(key, value)
+
+    def invalidate(self, key):
+        """
+        Drop ``key`` from both tiers
+        """
+        self.local.delete(key)
+        self.shared.delete(self.make_key(key))
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self):
+        """
+        Hit/miss counters since the last ``reset_stats``
+
+        :return: dict with local_hits, shared_hits and misses
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
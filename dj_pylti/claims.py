@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Launch claims kept in the Django session.
+
+The launch parameters that are read back after the launch (``SESSION_CLAIMS``
+and ``PYLTI_CONFIG['lti_properties']``) are stored as one versioned session
+entry instead of one session key each::
+
+    request.session['dj_pylti'] = {'v': 1, 'c': {'user_id': ..., ...}}
+
+Names, email addresses, labels and titles go to the profile, context and
+resource rows and are not repeated in every session. Only parameters that
+were sent are kept, and the entry is rewritten only when the claims differ
+from what the session already holds, so relaunching the same link does not
+mark the session as modified.
+"""
+from __future__ import unicode_literals
+
+from pylti.common import LTI_PROPERTY_LIST
+
+from .cache import pylti_config
+
+SESSION_KEY = 'dj_pylti'
+CLAIMS_VERSION = 1
+
+# launch parameters that change on every request and are not claims
+VOLATILE_PARAMS = frozenset(['oauth_nonce'])
+
+# who launched, with which roles, from where, and where grades go
+SESSION_CLAIMS = (
+    'oauth_consumer_key',
+    'user_id',
+    'lis_person_sourcedid',
+    'roles',
+    'ext_roles',
+    'context_id',
+    'resource_link_id',
+    'lis_result_sourcedid',
+    'lis_outcome_service_url',
+)
+
+
+def claims_from_params(params):
+    """
+    The claims of a launch: its non-empty ``LTI_PROPERTY_LIST`` parameters
+    """
+    return dict((prop, params[prop]) for prop in LTI_PROPERTY_LIST
+                if params.get(prop) and prop not in VOLATILE_PARAMS)
+
+
+def session_claims():
+    """
+    Names of the claims kept in the session
+    """
+    return frozenset(SESSION_CLAIMS).union(
+        pylti_config().get('lti_properties') or ())
+
+
+def get_claims(session):
+    """
+    Claims of the current launch, or an empty dict
+
+    Sessions written one key per parameter, by earlier versions, are read
+    as well.
+    """
+    payload = session.get(SESSION_KEY)
+    if payload and payload.get('v') == CLAIMS_VERSION:
+        return payload['c']
+    return dict((prop, session[prop]) for prop in LTI_PROPERTY_LIST
+                if prop in session)
+
+
+def store_claims(session, claims):
+    """
+    Save the ``session_claims()`` of ``claims`` in the session, touching
+    it only if they changed
+
+    :return: True if the session was modified
+    """
+    kept = session_claims()
+    claims = dict((name, value) for name, value in claims.items()
+                  if name in kept)
+    modified = False
+    for prop in LTI_PROPERTY_LIST:
+        if prop in session:
+            # upgrade a session written one key per parameter
+            del session[prop]
+            modified = True
+    payload = {'v': CLAIMS_VERSION, 'c': claims}
+    if session.get(SESSION_KEY) != payload:
+        session[SESSION_KEY] = payload
+        modified = True
+    return modified
+
+
+def clear_claims(session):
+    """
+    Remove the launch claims from the session
+    """
+    session.pop(SESSION_KEY, None)
+    for prop in LTI_PROPERTY_LIST:
+        session.pop(prop, None)
@@ -2,3 +2,9 @@ from django.conf import settings
 
 def settings_context(request):
   return {'settings': settings}
+
+def lti_context(request):
+  """
+  ``lti``: the request's LTI object, see dj_pylti.middleware
+  """
+  return {'lti': getattr(request, 'lti', None)}
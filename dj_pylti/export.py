@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming CSV and JSONL export of LTI profiles, contexts and resources.
+
+Rows are read in primary key order, ``PYLTI_CONFIG['export_chunk_size']``
+(default 2000) at a time, each chunk starting after the last key of the
+previous one. No chunk needs an OFFSET or a server-side cursor, and only
+one chunk is held in memory, so the size of a table does not matter.
+``export_lines`` yields the output chunk by chunk; the ``lti_export``
+command and ``export_view`` write it to a file or a StreamingHttpResponse.
+"""
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (HttpResponseBadRequest, HttpResponseForbidden,
+                         StreamingHttpResponse)
+from django.utils import six
+
+from pylti.common import LTIException
+
+from .cache import pylti_config
+from .models import LTIContext, LTIMembership, LTIResource, LTIUserProfile
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class ExportError(LTIException):
+    """
+    The export or its filters are not known
+    """
+    pass
+
+
+def _consumer_id(key):
+    try:
+        return int(key)
+    except ValueError:
+        raise ExportError('Unknown consumer {}'.format(key))
+
+
+def _members(**lookups):
+    return {'pk__in': LTIMembership.objects.filter(**lookups).values(
+        'profile_id')}
+
+
+class Export(object):
+    """
+    What to export of a model: ``columns`` are (name, values_list lookup)
+    pairs, ``filters`` map a filter name to a function of its value
+    returning queryset lookups
+    """
+
+    def __init__(self, model, columns, filters, json_columns=()):
+        self.model = model
+        self.columns = columns
+        self.filters = filters
+        self.json_columns = json_columns
+
+    @property
+    def headers(self):
+        return [name for name, _ in self.columns]
+
+    def queryset(self, **filters):
+        """
+        :raises: ExportError for filters this export does not support
+        """
+        queryset = self.model.objects.all()
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name not in self.filters:
+                raise ExportError('{} cannot be filtered by {}'.format(
+                    self.model._meta.verbose_name_plural, name))
+            queryset = queryset.filter(**self.filters[name](value))
+        return queryset
+
+
+# profiles belong to a consumer or context through their memberships, see
+# dj_pylti.roster
+EXPORTS = {
+    'profiles': Export(LTIUserProfile, (
+        ('id', 'pk'),
+        ('lti_user_id', 'lti_user_id'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('lis_person_name_given', 'lis_person_name_given'),
+        ('lis_person_name_family', 'lis_person_name_family'),
+        ('lis_person_name_full', 'lis_person_name_full'),
+        ('lis_person_contact_email_primary',
+         'lis_person_contact_email_primary'),
+        ('custom_attributes', 'custom_attributes'),
+    ), {
+        'consumer': lambda key: _members(
+            context__consumer_id=_consumer_id(key)),
+        'context': lambda context_id: _members(
+            context__context_id=context_id),
+    }, json_columns=('custom_attributes',)),
+    'contexts': Export(LTIContext, (
+        ('id', 'pk'),
+        ('consumer', 'consumer_id'),
+        ('context_id', 'context_id'),
+        ('context_label', 'context_label'),
+        ('memberships_url', 'memberships_url'),
+        ('roster_synced_at', 'roster_synced_at'),
+        ('custom_attributes', 'custom_attributes'),
+    ), {
+        'consumer': lambda key: {'consumer_id': _consumer_id(key)},
+        'context': lambda context_id: {'context_id': context_id},
+    }, json_columns=('custom_attributes',)),
+    'resources': Export(LTIResource, (
+        ('id', 'pk'),
+        ('consumer', 'consumer_id'),
+        ('resource_link_id', 'resource_link_id'),
+        ('resource_link_title', 'resource_link_title'),
+        ('custom_attributes', 'custom_attributes'),
+    ), {
+        'consumer': lambda key: {'consumer_id': _consumer_id(key)},
+    }, json_columns=('custom_attributes',)),
+}
+
+
+def get_export(name):
+    try:
+        return EXPORTS[name]
+    except KeyError:
+        raise ExportError('Unknown export {}'.format(name))
+
+
+def iter_rows(queryset, lookups, chunk_size=None):
+    """
+    ``values_list(*lookups)`` tuples of ``queryset`` in primary key order,
+    one chunk of keys at a time; the first lookup must be ``pk``
+
+    :return: iterator of lists of tuples
+    """
+    chunk_size = chunk_size or pylti_config().get('export_chunk_size', 2000)
+    queryset = queryset.order_by('pk').values_list(*lookups)
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(chunk[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return six.text_type(value)
+
+
+class _Line(object):
+    """
+    File-like object handing back what csv.writer writes
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, chunks):
+    """
+    CSV text, one string per chunk of rows
+    """
+    writer = csv.writer(_Line())
+    if six.PY2:  # csv works on utf-8 byte strings
+        def line(row):
+            return writer.writerow([_text(value).encode('utf-8')
+                                    for value in row]).decode('utf-8')
+    else:
+        def line(row):
+            return writer.writerow([_text(value) for value in row])
+    yield line(headers)
+    for rows in chunks:
+        yield ''.join(line(row) for row in rows)
+
+
+def jsonl_lines(headers, chunks, json_columns=()):
+    """
+    JSON Lines text, one string per chunk of rows; ``json_columns`` hold
+    JSON text and are embedded as objects
+    """
+    decode = [name in json_columns for name in headers]
+    for rows in chunks:
+        yield ''.join(json.dumps(OrderedDict(
+            (name, json.loads(value) if decoded and value else value)
+            for name, value, decoded in zip(headers, row, decode)),
+            cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+
+def export_lines(name, output_format='csv', consumer=None, context=None,
+                 chunk_size=None):
+    """
+    The export ``name`` (profiles, contexts or resources) as CSV or JSONL
+    text chunks
+
+    :param: consumer: only rows of this consumer key
+    :param: context: only rows of this LTI context_id
+    :raises: ExportError
+    """
+    export = get_export(name)
+    if output_format not in FORMATS:
+        raise ExportError('Unknown format {}'.format(output_format))
+    queryset = export.queryset(consumer=consumer, context=context)
+    chunks = iter_rows(queryset, [lookup for _, lookup in export.columns],
+                       chunk_size=chunk_size)
+    if output_format == 'csv':
+        return csv_lines(export.headers, chunks)
+    return jsonl_lines(export.headers, chunks, export.json_columns)
+
+
+def export_view(request, name):
+    """
+    Download an export; staff only
+
+    Query parameters: ``format`` (csv or jsonl), ``consumer`` and
+    ``context``.
+    """
+    if not getattr(request.user, 'is_staff', False):
+        return HttpResponseForbidden()
+    output_format = request.GET.get('format', 'csv')
+    try:
+        lines = export_lines(name, output_format,
+                             consumer=request.GET.get('consumer'),
+                             context=request.GET.get('context'))
+    except ExportError as error:
+        return HttpResponseBadRequest(six.text_type(error))
+    response = StreamingHttpResponse(lines,
+                                     content_type=FORMATS[output_format])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+        name, output_format)
+    return response
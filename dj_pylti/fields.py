@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Model fields used by dj_pylti.
+"""
+from __future__ import unicode_literals
+
+import json
+
+from django.core import exceptions
+from django.db import models
+from django.utils import six
+
+import jsonfield
+
+
+class EncodedJSON(six.text_type):
+    """
+    JSON text as loaded from the database, written back as it is
+    """
+
+
+class LazyJSONDescriptor(object):
+    """
+    Keeps the JSON text loaded from the database and decodes it on first
+    access. Instances that never read the field never pay for json.loads.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        data = instance.__dict__
+        name = self.field.attname
+        if name not in data:
+            # deferred with only()/defer()
+            instance.refresh_from_db(fields=[name])
+        value = data[name]
+        if isinstance(value, EncodedJSON):
+            value = data[name] = self.field.decode(value)
+        return value
+
+    def __set__(self, instance, value):
+        # EncodedJSON is decoded on the next read; anything else, strings
+        # included, is a value
+        instance.__dict__[self.field.attname] = value
+
+
+class LazyJSONField(models.TextField):
+    """
+    Text column holding JSON, decoded lazily by ``LazyJSONDescriptor``.
+
+    A value that was never read is saved back as the original text, so
+    only values that were accessed (and possibly modified) are re-encoded.
+    """
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(LazyJSONField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, LazyJSONDescriptor(self))
+
+    def from_db_value(self, value, *args):
+        # kept as text, see LazyJSONDescriptor
+        if value is None:
+            return value
+        return EncodedJSON(value)
+
+    def to_python(self, value):
+        # strings from forms and fixtures are JSON text
+        if isinstance(value, EncodedJSON):
+            return self.decode(value)
+        if isinstance(value, six.string_types):
+            try:
+                return self.decode(value)
+            except ValueError:
+                raise exceptions.ValidationError(
+                    'Enter valid JSON', code='invalid', params={'value': value})
+        return value
+
+    def decode(self, value):
+        if not value:
+            return self.get_default()
+        return json.loads(value)
+
+    @staticmethod
+    def encode(value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def is_decoded(self, instance):
+        """
+        False while the instance still holds the text loaded from the
+        database
+        """
+        return not isinstance(instance.__dict__.get(self.attname),
+                              EncodedJSON)
+
+    def raw_value(self, instance):
+        """
+        The stored JSON text if the value was not decoded yet, otherwise
+        the current value encoded
+        """
+        value = instance.__dict__.get(self.attname)
+        if isinstance(value, EncodedJSON):
+            return value
+        return self.encode(value)
+
+    def pre_save(self, model_instance, add):
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
+        if value is None and self.null:
+            return None
+        if isinstance(value, EncodedJSON):
+            return six.text_type(value)
+        return self.encode(value)
+
+    def value_from_object(self, obj):
+        return self.raw_value(obj)
+
+    def value_to_string(self, obj):
+        return self.raw_value(obj)
+
+    def get_default(self):
+        if self.has_default():
+            if callable(self.default):
+                return self.default()
+            return json.loads(self.encode(self.default))
+        return super(LazyJSONField, self).get_default()
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': jsonfield.JSONField.form_class}
+        defaults.update(kwargs)
+        return super(LazyJSONField, self).formfield(**defaults)
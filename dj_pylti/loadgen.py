@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Load generation for LTI launches, used by the ``lti_loadgen`` command.
+
+Launches are described by their LTI parameters, either generated for a set
+of consumers, users, contexts and roles or read from a JSONL file. Every
+request is signed just before it is sent (each needs a fresh nonce) and
+goes through the real ``@lti`` launch path, either in-process through the
+Django test client or over HTTP to a running server.
+"""
+from __future__ import division, unicode_literals
+
+from collections import Counter, namedtuple
+import json
+import math
+import random
+import threading
+import time
+
+from django.db import connection
+from django.utils.six.moves import queue
+from django.utils.six.moves.urllib.parse import urlparse
+
+import httplib2
+import oauth2
+
+Launch = namedtuple('Launch', 'consumer_key params')
+
+
+def generate_launches(consumer_keys, count, users=100, contexts=10,
+                      roles=('Learner',), seed=None):
+    """
+    ``count`` launches by ``users`` users spread over ``contexts`` contexts
+    (one resource link each), from randomly chosen consumers and roles
+
+    :return: list of Launch
+    """
+    rand = random.Random(seed)
+    launches = []
+    for _ in range(count):
+        user = rand.randrange(users)
+        context = rand.randrange(contexts)
+        params = {
+            'lti_message_type': 'basic-lti-launch-request',
+            'lti_version': 'LTI-1p0',
+            'user_id': 'loadgen-user-{}'.format(user),
+            'lis_person_name_given': 'Load',
+            'lis_person_name_family': 'User {}'.format(user),
+            'lis_person_contact_email_primary':
+                'loadgen-user-{}@example.com'.format(user),
+            'roles': rand.choice(roles),
+            'context_id': 'loadgen-context-{}'.format(context),
+            'context_label': 'Load test course {}'.format(context),
+            'resource_link_id': 'loadgen-resource-{}'.format(context),
+            'resource_link_title': 'Load test link {}'.format(context),
+            'lis_result_sourcedid': 'loadgen-{}-{}'.format(context, user),
+        }
+        launches.append(Launch(rand.choice(consumer_keys), params))
+    return launches
+
+
+def read_launches(lines, default_consumer=None):
+    """
+    Launches from JSONL: one object of launch parameters per line, with
+    the consumer in ``oauth_consumer_key`` (OAuth fields are dropped and
+    signed again)
+    """
+    launches = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        params = json.loads(line)
+        key = params.pop('oauth_consumer_key', default_consumer)
+        params = dict((name, value) for name, value in params.items()
+                      if not name.startswith('oauth_'))
+        launches.append(Launch(key, params))
+    return launches
+
+
+def write_launches(launches, output):
+    for launch in launches:
+        output.write(json.dumps(dict(launch.params,
+                                     oauth_consumer_key=launch.consumer_key),
+                                sort_keys=True) + '\n')
+
+
+def sign_launch(url, key, secret, params):
+    """
+    OAuth 1.0a HMAC-SHA1 sign a launch POST to ``url``
+
+    :return: form-encoded body
+    """
+    consumer = oauth2.Consumer(key=key, secret=secret)
+    request = oauth2.Request.from_consumer_and_token(
+        consumer, token=None, http_method='POST', http_url=url,
+        parameters=dict(params))
+    request.sign_request(oauth2.SignatureMethod_HMAC_SHA1(), consumer, None)
+    return request.to_postdata()
+
+
+class ClientTarget(object):
+    """
+    Sends launches through the Django test client, in this process
+    """
+    FORM = 'application/x-www-form-urlencoded'
+
+    def __init__(self, url):
+        self.url = url
+        parsed = urlparse(url)
+        self.path = parsed.path
+        self.host = parsed.netloc
+        self.secure = parsed.scheme == 'https'
+
+    def __call__(self, body):
+        from django.test import Client
+        # a new client per launch: students arrive without a session
+        response = Client().post(self.path, body, content_type=self.FORM,
+                                 secure=self.secure, SERVER_NAME=self.host,
+                                 HTTP_HOST=self.host)
+        return response.status_code
+
+
+class HttpTarget(object):
+    """
+    Sends launches to a running server, one keep-alive connection per
+    thread
+    """
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self, body):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = httplib2.Http(timeout=self.timeout)
+            http.follow_redirects = False
+        response, content = http.request(
+            self.url, 'POST', body=body,
+            headers={'Content-Type': ClientTarget.FORM})
+        return response.status
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1,
+                       int(math.ceil(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LoadReport(object):
+    """
+    Outcome of a run: status counts and latencies
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.latencies = []
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, status, latency):
+        with self._lock:
+            self.statuses[status] += 1
+            self.latencies.append(latency)
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items()
+                   if not 200 <= status < 400)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        requests = self.requests
+        return {
+            'requests': requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / requests, 4) if requests else 0,
+            'elapsed': round(self.elapsed, 3),
+            'rps': round(requests / self.elapsed, 1) if self.elapsed else 0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1e3, 2),
+            'p90_ms': round(percentile(latencies, 0.90) * 1e3, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1e3, 2),
+            'max_ms': round(latencies[-1] * 1e3, 2) if latencies else 0,
+            # 0 stands for a request that raised
+            'statuses': dict((str(status), count)
+                             for status, count in self.statuses.items()),
+        }
+
+
+def run_load(launches, target, secrets, concurrency=1):
+    """
+    Sign and send every launch, ``concurrency`` at a time
+
+    :param: target: callable taking a signed body and returning the HTTP
+        status
+    :param: secrets: {consumer key: secret}
+    :return: LoadReport
+    """
+    report = LoadReport()
+    pending = queue.Queue()
+    for launch in launches:
+        pending.put(launch)
+
+    def work(close=True):
+        while True:
+            try:
+                launch = pending.get_nowait()
+            except queue.Empty:
+                break
+            body = sign_launch(target.url, launch.consumer_key,
+                               secrets[launch.consumer_key], launch.params)
+            started = time.time()
+            try:
+                status = target(body)
+            except Exception:  # pylint: disable=broad-except
+                status = 0
+            report.add(status, time.time() - started)
+        # worker threads own their database connection
+        if close:
+            connection.close()
+
+    started = time.time()
+    if concurrency <= 1:
+        work(close=False)
+    else:
+        threads = [threading.Thread(target=work) for _ in range(concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+    report.elapsed = time.time() - started
+    return report
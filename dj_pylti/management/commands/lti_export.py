@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Export LTI profiles, contexts or resources as CSV or JSON Lines.
+"""
+from __future__ import unicode_literals
+
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dj_pylti.export import EXPORTS, FORMATS, ExportError, export_lines
+
+
+class Command(BaseCommand):
+    help = ('Stream LTI profiles, contexts or resources to stdout or a '
+            'file, in constant memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS),
+                            help='What to export')
+        parser.add_argument('--format', dest='output_format', default='csv',
+                            choices=sorted(FORMATS))
+        parser.add_argument('--consumer', default=None,
+                            help='Only rows of this consumer key')
+        parser.add_argument('--context', default=None,
+                            help='Only rows of this LTI context_id')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows read per query')
+        parser.add_argument('--output', default=None,
+                            help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            lines = export_lines(options['export'], options['output_format'],
+                                 consumer=options['consumer'],
+                                 context=options['context'],
+                                 chunk_size=options['chunk_size'])
+        except ExportError as error:
+            raise CommandError(error)
+        if options['output'] is None:
+            for text in lines:
+                self.stdout.write(text, ending='')
+            return
+        with io.open(options['output'], 'w', encoding='utf-8',
+                     newline='') as output:
+            for text in lines:
+                output.write(text)
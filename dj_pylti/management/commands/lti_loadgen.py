@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Fire signed LTI launches at the tool and report throughput and latency.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.http.request import split_domain_port, validate_host
+from django.utils.six.moves.urllib.parse import urlparse
+
+from dj_pylti.loadgen import (ClientTarget, HttpTarget, generate_launches,
+                              read_launches, run_load, write_launches)
+from dj_pylti.models import LTIConsumer
+
+TARGETS = {'client': ClientTarget, 'http': HttpTarget}
+
+
+class Command(BaseCommand):
+    help = ('Send signed basic-lti-launch-requests, generated or replayed '
+            'from a JSONL file, through the @lti launch path and report '
+            'requests per second, errors and latency percentiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Launch URL the requests are signed for '
+                                 '(default: --view on a host from '
+                                 'ALLOWED_HOSTS; required with --target '
+                                 'http)')
+        parser.add_argument('--view', default='dj_pylti:initial',
+                            help='URL name of the launch view, when --url '
+                                 'is not given')
+        parser.add_argument('--target', choices=sorted(TARGETS),
+                            default='client',
+                            help='client: the Django test client in this '
+                                 'process; http: a running server at --url')
+        parser.add_argument('--consumers', nargs='+', metavar='KEY[:SECRET]',
+                            help='Consumers to launch from (default: every '
+                                 'LTIConsumer); secrets are looked up when '
+                                 'not given')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Launches to generate')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Distinct users')
+        parser.add_argument('--contexts', type=int, default=10,
+                            help='Distinct contexts, one resource link each')
+        parser.add_argument('--roles', default='Learner,Instructor',
+                            help='Comma separated roles to pick from')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for repeatable launches')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Launches in flight at once')
+        parser.add_argument('--replay', metavar='FILE',
+                            help='Send the launches in this JSONL file '
+                                 'instead of generating them')
+        parser.add_argument('--record', metavar='FILE',
+                            help='Write the launches to this JSONL file')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON')
+
+    def secrets(self, consumers):
+        if not consumers:
+            return dict((consumer.key, str(consumer.secret))
+                        for consumer in LTIConsumer.objects.all())
+        secrets = {}
+        for spec in consumers:
+            key, _, secret = spec.partition(':')
+            if not secret:
+                try:
+                    secret = str(LTIConsumer.objects.get(pk=key).secret)
+                except (LTIConsumer.DoesNotExist, ValueError):
+                    raise CommandError('Unknown consumer {}'.format(key))
+            secrets[key] = secret
+        return secrets
+
+    def allowed_hosts(self):
+        # what HttpRequest.get_host() accepts
+        if settings.DEBUG and not settings.ALLOWED_HOSTS:
+            return ['localhost', '127.0.0.1', '[::1]']
+        return settings.ALLOWED_HOSTS
+
+    def url(self, options):
+        if options['url']:
+            return options['url']
+        if options['target'] != 'client':
+            raise CommandError('--url is required with --target {}'.format(
+                options['target']))
+        hosts = [host.lstrip('.') for host in self.allowed_hosts()
+                 if host != '*']
+        if not hosts and '*' not in self.allowed_hosts():
+            raise CommandError('ALLOWED_HOSTS is empty: pass --url')
+        try:
+            path = reverse(options['view'])
+        except NoReverseMatch:
+            raise CommandError('Cannot reverse {}: pass --url or --view'
+                               .format(options['view']))
+        return 'http://{}{}'.format(hosts[0] if hosts else 'localhost', path)
+
+    def handle(self, *args, **options):
+        url = self.url(options)
+        if options['target'] == 'client':
+            # every launch would be a 400 from DisallowedHost
+            domain, port = split_domain_port(urlparse(url).netloc)
+            if not domain or not validate_host(domain, self.allowed_hosts()):
+                raise CommandError(
+                    'The host of {} is not in ALLOWED_HOSTS'.format(url))
+
+        secrets = self.secrets(options['consumers'])
+        if not secrets:
+            raise CommandError('No consumers to launch from')
+
+        if options['replay']:
+            with io.open(options['replay'], encoding='utf-8') as lines:
+                launches = read_launches(lines, default_consumer=sorted(
+                    secrets)[0])
+            unknown = set(launch.consumer_key for launch in launches
+                          if launch.consumer_key not in secrets)
+            if unknown:
+                raise CommandError('No secret for consumers {}'.format(
+                    ', '.join(sorted(unknown))))
+        else:
+            launches = generate_launches(
+                sorted(secrets), options['requests'], users=options['users'],
+                contexts=options['contexts'],
+                roles=[role.strip() for role in options['roles'].split(',')],
+                seed=options['seed'])
+        if options['record']:
+            with io.open(options['record'], 'w', encoding='utf-8') as output:
+                write_launches(launches, output)
+
+        target = TARGETS[options['target']](url)
+        report = run_load(launches, target, secrets,
+                          concurrency=max(options['concurrency'], 1))
+        summary = report.summary()
+        if options['json']:
+            self.stdout.write(json.dumps(summary, sort_keys=True))
+            return
+        self.stdout.write(
+            'requests={requests} errors={errors} error_rate={error_rate:.2%} '
+            'elapsed={elapsed:.2f}s throughput={rps:.1f} req/s '
+            'p50={p50_ms:.1f}ms p90={p90_ms:.1f}ms p99={p99_ms:.1f}ms '
+            'max={max_ms:.1f}ms'.format(**summary))
+        self.stdout.write('statuses: {}'.format(' '.join(
+            '{}={}'.format(status, count)
+            for status, count in sorted(summary['statuses'].items()))))
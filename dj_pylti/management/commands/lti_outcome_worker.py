@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Deliver queued grade passback messages from the outcome outbox.
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dj_pylti.outcomes import run_worker
+
+
+class Command(BaseCommand):
+    help = ('Deliver grade passback messages queued in the outbox. Run as '
+            'many copies as you like; messages are leased to one worker '
+            'at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker threads in this process')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Messages claimed per round trip')
+        parser.add_argument('--lease', type=int, default=None,
+                            help='Seconds a claimed message stays leased')
+        parser.add_argument('--max-attempts', type=int, default=None,
+                            help='Attempts before a message is marked failed')
+        parser.add_argument('--idle-sleep', type=float, default=1.0,
+                            help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when nothing is due instead of polling')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        results = []
+
+        def work(close=True):
+            try:
+                results.append(run_worker(
+                    batch_size=options['batch_size'],
+                    lease_seconds=options['lease'],
+                    max_attempts=options['max_attempts'],
+                    idle_sleep=options['idle_sleep'],
+                    once=options['once'],
+                    stop=stop.is_set))
+            finally:
+                # worker threads own their database connection
+                if close:
+                    connection.close()
+
+        started = time.time()
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            try:
+                work(close=False)
+            except KeyboardInterrupt:
+                pass
+        else:
+            threads = [threading.Thread(target=work) for _ in range(workers)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            try:
+                while any(thread.is_alive() for thread in threads):
+                    for thread in threads:
+                        thread.join(0.5)
+            except KeyboardInterrupt:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+        elapsed = time.time() - started
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        for result in results:
+            for name in totals:
+                totals[name] += result[name]
+        rate = totals['sent'] / elapsed if elapsed else 0.0
+        self.stdout.write(
+            'sent={sent} retried={retried} failed={failed} '.format(**totals) +
+            'elapsed={:.2f}s throughput={:.1f} msg/s'.format(elapsed, rate))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Sync course rosters from the LMS memberships service.
+"""
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dj_pylti.models import LTIContext
+from dj_pylti.roster import RosterError, sync_roster
+
+
+class Command(BaseCommand):
+    help = ('Create and update users and enrollments from the memberships '
+            'service of every context that sent one, or of the given ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--context', action='append', default=[],
+                            help='LTI context_id to sync (repeatable)')
+        parser.add_argument('--consumer', default=None,
+                            help='Only contexts of this consumer key')
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore ETags and rewrite every member')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Members upserted per round of bulk queries')
+
+    def handle(self, *args, **options):
+        contexts = LTIContext.objects.exclude(memberships_url='')
+        if options['consumer']:
+            contexts = contexts.filter(consumer_id=options['consumer'])
+        if options['context']:
+            contexts = contexts.filter(context_id__in=options['context'])
+        if not contexts.exists():
+            raise CommandError('No context with a memberships service')
+
+        failed = 0
+        for context in contexts.order_by('pk').iterator():
+            try:
+                stats = sync_roster(context, full=options['full'],
+                                    chunk_size=options['chunk_size'])
+            except RosterError as error:
+                failed += 1
+                self.stderr.write('{}: {}'.format(context.context_id, error))
+                continue
+            if stats['not_modified']:
+                self.stdout.write('{}: not modified'.format(
+                    context.context_id))
+                continue
+            self.stdout.write(
+                '{context}: pages={pages} members={members} '
+                'created={created} updated={updated} unchanged={unchanged} '
+                'removed={removed}'.format(context=context.context_id,
+                                           **stats))
+        if failed:
+            raise CommandError('{} context(s) could not be synced'.format(
+                failed))
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Per-phase timings of launches and grade passback.
+
+``PhaseTimer`` records how long one phase took (OAuth verification, the
+nonce check, persisting the resource and context, ``authenticate``,
+``login``, the profile update, the session save, posting grades) into a
+histogram labelled by phase, consumer, request type and outcome.
+``metrics_view`` exposes the histograms in the Prometheus text format.
+
+``PYLTI_CONFIG['metrics']`` picks the registry:
+
+* ``'local'`` (default): in-process histograms; every process reports its
+  own numbers
+* ``'cache'``: each process flushes its histograms to the shared Django
+  cache every ``metrics_flush_interval`` seconds (default 10) and a scrape
+  adds up every process, so any worker can answer for all of them
+* a dotted path to a registry class with the same interface
+* ``False`` or ``None``: timings are not recorded
+"""
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import threading
+import time
+from timeit import default_timer
+import uuid
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils import six
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+from pylti.common import LTIException, LTIPostMessageException
+
+from .cache import pylti_config, shared_cache
+
+METRIC_NAME = 'dj_pylti_phase_seconds'
+METRIC_HELP = ('Time spent in each phase of LTI launches and grade '
+               'passback')
+LABEL_NAMES = ('phase', 'consumer', 'request_type', 'outcome')
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class LocalRegistry(object):
+    """
+    Thread-safe in-process histograms
+
+    A series is keyed by its label values in ``LABEL_NAMES`` order and
+    holds ``[per-bucket counts (last one is +Inf), sum, count]``.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                return index
+        return len(self.buckets)
+
+    def observe(self, labels, value):
+        bucket = self._bucket(value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict((labels, [list(series[0]), series[1], series[2]])
+                        for labels, series in self._series.items())
+
+    def collect(self):
+        """
+        Series to expose: {label values: [bucket counts, sum, count]}
+        """
+        return self.snapshot()
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class CacheRegistry(LocalRegistry):
+    """
+    In-process histograms shared between processes through the Django
+    cache: each process stores its snapshot under its own key, and
+    ``collect`` adds up the snapshots of every process
+    """
+    INDEX_KEY = 'dj_pylti:metrics:processes'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, flush_interval=10):
+        super(CacheRegistry, self).__init__(buckets)
+        self.flush_interval = flush_interval
+        self.process_key = 'dj_pylti:metrics:{}'.format(uuid.uuid4().hex)
+        self._next_flush = 0
+
+    def observe(self, labels, value):
+        super(CacheRegistry, self).observe(labels, value)
+        if time.time() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        self._next_flush = time.time() + self.flush_interval
+        cache = shared_cache()
+        cache.set(self.process_key, (self.buckets, self.snapshot()), None)
+        index = cache.get(self.INDEX_KEY) or []
+        if self.process_key not in index:
+            # racing processes can drop each other here; the loser adds
+            # itself back on its next flush
+            cache.set(self.INDEX_KEY, index + [self.process_key], None)
+
+    def collect(self):
+        self.flush()
+        cache = shared_cache()
+        index = cache.get(self.INDEX_KEY) or []
+        snapshots = cache.get_many(index)
+        if len(snapshots) < len(index):
+            cache.set(self.INDEX_KEY, [key for key in index
+                                       if key in snapshots], None)
+        merged = {}
+        for buckets, snapshot in snapshots.values():
+            if tuple(buckets) != self.buckets:
+                continue
+            for labels, (counts, total, count) in snapshot.items():
+                series = merged.setdefault(
+                    labels, [[0] * len(counts), 0.0, 0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+        return merged
+
+    def clear(self):
+        super(CacheRegistry, self).clear()
+        cache = shared_cache()
+        cache.delete_many(cache.get(self.INDEX_KEY) or [])
+        cache.delete(self.INDEX_KEY)
+
+
+REGISTRIES = {
+    'local': LocalRegistry,
+    'cache': CacheRegistry,
+}
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    The configured registry, or None when metrics are disabled
+    """
+    global _registry  # pylint: disable=global-statement
+    if _registry is None:
+        config = pylti_config()
+        kind = config.get('metrics', 'local')
+        if not kind:
+            return None
+        with _registry_lock:
+            if _registry is None:
+                cls = REGISTRIES.get(kind) or import_string(kind)
+                kwargs = {'buckets': config.get('metrics_buckets',
+                                                DEFAULT_BUCKETS)}
+                if issubclass(cls, CacheRegistry):
+                    kwargs['flush_interval'] = config.get(
+                        'metrics_flush_interval', 10)
+                _registry = cls(**kwargs)
+    return _registry
+
+
+def reset_registry():
+    global _registry  # pylint: disable=global-statement
+    with _registry_lock:
+        _registry = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(sender, setting, **kwargs):
+    if setting == 'PYLTI_CONFIG':
+        reset_registry()
+
+
+def observe(seconds, **labels):
+    """
+    Record ``seconds`` for the series named by ``labels`` (see
+    ``LABEL_NAMES``; missing labels are empty)
+    """
+    registry = get_registry()
+    if registry is not None:
+        registry.observe(tuple(six.text_type(labels.get(name, ''))
+                               for name in LABEL_NAMES), seconds)
+
+
+class PhaseTimer(object):
+    """
+    Context manager timing one phase::
+
+        with PhaseTimer('nonce', consumer=key) as timer:
+            ...
+            timer.outcome = 'replay'
+
+    The outcome defaults to ``ok``; if an exception escapes it is
+    ``failed`` for LTIPostMessageException, ``rejected`` for other
+    LTIExceptions and ``error`` otherwise. ``consumer`` may be a
+    callable, evaluated when the phase ends.
+    """
+
+    def __init__(self, phase, consumer='', request_type='', outcome='ok'):
+        self.phase = phase
+        self.consumer = consumer
+        self.request_type = request_type
+        self.outcome = outcome
+        self.started = None
+
+    def __enter__(self):
+        self.started = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = default_timer() - self.started
+        if exc_type is None or self.outcome != 'ok':
+            pass
+        elif issubclass(exc_type, LTIPostMessageException):
+            self.outcome = 'failed'
+        elif issubclass(exc_type, LTIException):
+            self.outcome = 'rejected'
+        else:
+            self.outcome = 'error'
+        consumer = self.consumer() if callable(self.consumer) else self.consumer
+        observe(elapsed, phase=self.phase, consumer=consumer,
+                request_type=self.request_type, outcome=self.outcome)
+        return False
+
+
+def time_session_save(request, **labels):
+    """
+    Time the session save that SessionMiddleware makes after the view
+    """
+    session = getattr(request, 'session', None)
+    save = getattr(session, 'save', None)
+    if save is None or getattr(save, 'timed', False) or get_registry() is None:
+        return
+
+    def timed_save(*args, **kwargs):
+        with PhaseTimer('session_save', **labels):
+            return save(*args, **kwargs)
+    timed_save.timed = True
+    session.save = timed_save
+
+
+def _escape(value):
+    return (value.replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(series, buckets):
+    """
+    Render histograms in the Prometheus text exposition format
+    """
+    lines = ['# HELP {} {}'.format(METRIC_NAME, METRIC_HELP),
+             '# TYPE {} histogram'.format(METRIC_NAME)]
+    bounds = [_format_value(float(bound)) for bound in buckets] + ['+Inf']
+    for labels in sorted(series):
+        counts, total, count = series[labels]
+        label_text = ','.join('{}="{}"'.format(name, _escape(value))
+                              for name, value in zip(LABEL_NAMES, labels))
+        cumulative = 0
+        for bound, bucket_count in zip(bounds, counts):
+            cumulative += bucket_count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                METRIC_NAME, label_text, bound, cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(METRIC_NAME, label_text,
+                                              _format_value(total)))
+        lines.append('{}_count{{{}}} {}'.format(METRIC_NAME, label_text,
+                                                count))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Metrics in the Prometheus text format
+
+    Scrapers authenticate with ``Authorization: Bearer <metrics_token>``
+    when PYLTI_CONFIG['metrics_token'] is set; otherwise only staff users
+    may read the metrics.
+    """
+    token = pylti_config().get('metrics_token')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not constant_time_compare(header, 'Bearer {}'.format(token)):
+            return HttpResponseForbidden()
+    elif not getattr(request.user, 'is_staff', False):
+        return HttpResponseForbidden()
+    registry = get_registry()
+    if registry is None:
+        return HttpResponse('', content_type=CONTENT_TYPE)
+    return HttpResponse(exposition(registry.collect(), registry.buckets),
+                        content_type=CONTENT_TYPE)
+
+
+def phase_summary(registry=None):
+    """
+    {phase: (count, total seconds)} over every label combination; handy in
+    a shell or a benchmark
+    """
+    registry = registry or get_registry()
+    summary = defaultdict(lambda: [0, 0.0])
+    for labels, (counts, total, count) in (registry.collect().items()
+                                           if registry else []):
+        summary[labels[0]][0] += count
+        summary[labels[0]][1] += total
+    return dict((phase, tuple(value)) for phase, value in summary.items())
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+One LTI object per request.
+
+``LTIMiddleware`` gives every request a lazy ``request.lti``: the verified
+LTI object of a launch or an LTI session, or None. Nothing is checked until
+it is first read. The ``@lti`` decorator, ``LTIMixin`` and ``request.lti``
+share the object built by ``get_lti``, which remembers what it has already
+verified, so stacked decorators or a decorated helper called from a
+decorated view check a launch once.
+"""
+from __future__ import unicode_literals
+
+from django.utils.functional import SimpleLazyObject
+
+from pylti.common import LTIException
+
+from .models import LTI
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # Django < 1.10
+    MiddlewareMixin = object
+
+
+def get_lti(request):
+    """
+    The request's LTI object, built on first use but not verified
+    """
+    the_lti = request.__dict__.get('_lti')
+    if the_lti is None:
+        the_lti = request._lti = LTI((), {'request': 'any', 'role': 'any'},
+                                     request)
+    return the_lti
+
+
+def verified_lti(request):
+    """
+    The request's LTI object if it is a launch or has an LTI session,
+    otherwise None
+    """
+    the_lti = get_lti(request)
+    try:
+        the_lti.verify('any')
+    except LTIException:
+        return None
+    return the_lti
+
+
+class LTIMiddleware(MiddlewareMixin):
+    """
+    Attach a lazily verified ``request.lti``; place it after
+    AuthenticationMiddleware
+    """
+
+    def process_request(self, request):
+        request.lti = SimpleLazyObject(lambda: verified_lti(request))
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 10:18
+from __future__ import unicode_literals
+
+import dj_pylti.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0002_outcomemessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='baseltiobject',
+            name='custom_attributes',
+            field=dj_pylti.fields.LazyJSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 10:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from dj_pylti.trees import path_segment
+
+
+def backfill_paths(apps, schema_editor):
+    OptionList = apps.get_model('dj_pylti', 'OptionList')
+    nodes = dict((pk, (parent_id, config_id)) for pk, parent_id, config_id in
+                 OptionList.objects.values_list('pk', 'parent_id', 'config_id'))
+    computed = {}
+
+    def resolve(pk):
+        # walk up to the first resolved ancestor, then fill in downwards
+        chain = []
+        while pk is not None and pk not in computed:
+            chain.append(pk)
+            pk = nodes[pk][0]
+            if pk in chain:
+                raise ValueError('OptionList {} is its own ancestor'.format(pk))
+        path, depth, root = computed[pk] if pk is not None else ('', -1, None)
+        for node in reversed(chain):
+            parent_id, config_id = nodes[node]
+            if parent_id is None:
+                root = config_id
+            path, depth = path + path_segment(node), depth + 1
+            computed[node] = (path, depth, root)
+
+    for pk in nodes:
+        resolve(pk)
+    for pk, (path, depth, root) in computed.items():
+        OptionList.objects.filter(pk=pk).update(path=path, depth=depth,
+                                                root_config=root)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0003_lazy_custom_attributes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optionlist',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='optionlist',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='optionlist',
+            name='root_config',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tree_options', to='dj_pylti.Configuration'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='optionlist',
+            index_together=set([('root_config', 'path')]),
+        ),
+    ]
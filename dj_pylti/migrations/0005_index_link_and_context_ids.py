@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 10:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0004_optionlist_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lticontext',
+            name='context_id',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='ltiresource',
+            name='resource_link_id',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 10:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0005_index_link_and_context_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lticontext',
+            name='consumer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contexts', to='dj_pylti.LTIConsumer'),
+        ),
+        migrations.AddField(
+            model_name='ltiresource',
+            name='consumer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resources', to='dj_pylti.LTIConsumer'),
+        ),
+    ]
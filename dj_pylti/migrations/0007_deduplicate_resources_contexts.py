@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 10:40
+"""
+Prepare LTIResource and LTIContext for their (consumer, id) unique
+constraints.
+
+Duplicates of the same (consumer, id) are removed, keeping the oldest row.
+Rows written before the consumer column existed are then assigned to the
+consumer when the site has exactly one; otherwise they keep a NULL
+consumer. Each batch commits on its own so no table stays locked for
+the length of the migration.
+"""
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+from django.db.models import Count, Min
+
+BATCH_SIZE = 500
+
+
+def assign_single_consumer(model, consumer_id):
+    while True:
+        pks = list(model.objects.filter(consumer__isnull=True)
+                   .values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        with transaction.atomic():
+            model.objects.filter(pk__in=pks).update(consumer_id=consumer_id)
+
+
+def delete_duplicates(model, id_field):
+    groups = (model.objects.values('consumer', id_field).order_by()
+              .annotate(rows=Count('pk'), keep=Min('pk'))
+              .filter(rows__gt=1))
+    doomed = []
+    for group in list(groups):
+        doomed.extend(model.objects.filter(
+            consumer=group['consumer'], **{id_field: group[id_field]}
+        ).exclude(pk=group['keep']).values_list('pk', flat=True))
+    for start in range(0, len(doomed), BATCH_SIZE):
+        with transaction.atomic():
+            # also deletes the BaseLTIObject parent rows
+            model.objects.filter(
+                pk__in=doomed[start:start + BATCH_SIZE]).delete()
+
+
+def deduplicate(apps, schema_editor):
+    consumers = list(apps.get_model('dj_pylti', 'LTIConsumer')
+                     .objects.values_list('pk', flat=True)[:2])
+    for name, id_field in (('LTIResource', 'resource_link_id'),
+                           ('LTIContext', 'context_id')):
+        model = apps.get_model('dj_pylti', name)
+        delete_duplicates(model, id_field)
+        if len(consumers) == 1:
+            assign_single_consumer(model, consumers[0])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('dj_pylti', '0006_consumer_scoped_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 10:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0007_deduplicate_resources_contexts'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='lticontext',
+            unique_together=set([('consumer', 'context_id')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ltiresource',
+            unique_together=set([('consumer', 'resource_link_id')]),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 11:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0008_unique_consumer_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LTIMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('roles', models.TextField(blank=True)),
+                ('status', models.CharField(default='Active', max_length=10)),
+                ('digest', models.CharField(blank=True, max_length=40)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='lticontext',
+            name='memberships_url',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='lticontext',
+            name='roster_etag',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='lticontext',
+            name='roster_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ltimembership',
+            name='context',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='dj_pylti.LTIContext'),
+        ),
+        migrations.AddField(
+            model_name='ltimembership',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='dj_pylti.LTIUserProfile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ltimembership',
+            unique_together=set([('context', 'profile')]),
+        ),
+    ]
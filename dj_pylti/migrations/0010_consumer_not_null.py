@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 11:15
+"""
+Make the consumer of LTIResource and LTIContext required.
+
+Rows with a NULL consumer escape the (consumer, id) unique constraints.
+Migration 0007 assigns them when the site has a single consumer; with more
+than one they have to be assigned or deleted by hand first (see "Resources
+and contexts" in the usage docs), and this migration stops until they are.
+"""
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def check_consumers(apps, schema_editor):
+    orphans = []
+    for name in ('LTIResource', 'LTIContext'):
+        count = apps.get_model('dj_pylti', name).objects.filter(
+            consumer__isnull=True).count()
+        if count:
+            orphans.append('{} {} rows'.format(count, name))
+    if orphans:
+        raise RuntimeError(
+            '{} have no consumer. Assign them, e.g. with '
+            'LTIResource.objects.filter(consumer=None).update(consumer=...), '
+            'or delete them, then migrate again.'.format(' and '.join(orphans)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dj_pylti', '0009_memberships'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_consumers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='lticontext',
+            name='consumer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contexts', to='dj_pylti.LTIConsumer'),
+        ),
+        migrations.AlterField(
+            model_name='ltiresource',
+            name='consumer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resources', to='dj_pylti.LTIConsumer'),
+        ),
+    ]
@@ -1,27 +1,41 @@
 from __future__ import unicode_literals
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
 import jsonfield # https://github.com/bradjasper/django-jsonfield
 from django.dispatch import receiver
-from django.db.models.signals import post_init
+from django.db.models.signals import post_save, post_delete
 from django.conf import settings
+from django.utils import timezone
+from django.utils.six.moves import cPickle as pickle
+from django.contrib import auth
 from django.contrib.auth import authenticate
 from django.contrib.auth import logout
 from django.contrib.auth import login
+from django.contrib.auth.signals import user_logged_out
 
 import json
+import time
 import uuid
 import os
 
 import logging
+from .aio import run_sync
+from .claims import claims_from_params, clear_claims, get_claims, store_claims
+from .cache import LRUCache, TieredCache, pylti_config, shared_cache
+from .fields import LazyJSONField
+from .trees import PATH_MAX_LENGTH, path_segment, render_options
+from .metrics import PhaseTimer
+from .nonces import check_nonce
+from .tokens import make_token, read_token, request_token, tokens_enabled
+from .urlfix import fix_url
+from .outcomes import (outbox_enabled, send_outcome, post_grades_bulk,
+    POX_CONTENT_TYPE, LTI2_CONTENT_TYPE)
 from pylti.common import ( LTINotInSessionException, LTIException,
     LTIRoleException,
     LTIPostMessageException,
     LTI_PROPERTY_LIST,
     LTI_ROLES,
-    post_message,
-    post_message2,
     generate_request_xml,
     verify_request_common
     )
@@ -40,6 +54,37 @@ LTI_ROLES['student'].append('urn:lti:instrole:ims/lis/Learner')
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# LTI_ROLES compiled to frozensets; rebuilt by compile_roles() when the app
+# is ready, after every module had a chance to extend LTI_ROLES
+ROLE_SETS = {}
+_matched_roles = LRUCache(maxsize=256)
+
+def compile_roles():
+    """
+    Freeze LTI_ROLES into ROLE_SETS and drop previously parsed role strings
+    """
+    ROLE_SETS.clear()
+    ROLE_SETS.update((name, frozenset(roles)) for name, roles in LTI_ROLES.items())
+    _matched_roles.clear()
+
+compile_roles()
+
+def matched_roles(roles):
+    """
+    Names of the LTI_ROLES entries matched by a launch's roles string
+
+    :param: roles: comma separated roles, as sent by the consumer
+    :return: frozenset of role names, e.g. {'instructor', 'staff'}
+    """
+    roles = roles or ''
+    matched = _matched_roles.get(roles)
+    if matched is None:
+        launch_roles = frozenset(role.strip() for role in roles.split(','))
+        matched = frozenset(name for name, role_set in ROLE_SETS.items()
+                            if not role_set.isdisjoint(launch_roles))
+        _matched_roles.set(roles, matched)
+    return matched
+
 def session_roles(request):
     """
     Return the full session roles which can be in 'roles' and 'ext_roles'
@@ -48,7 +93,7 @@ def session_roles(request):
     #return ",".join((request.session.get('roles', ''), request.session.get('ext_roles', '')))
     #return ",".join((request.session.get('roles', ''), request.session.get('ext_roles', '')))
     #return ",".join((request.session.get('roles', ''),))
-    return request.session.get('roles')
+    return get_claims(request.session).get('roles')
 
 class LTIConsumer(models.Model):
   name = models.CharField(max_length=255)
@@ -70,9 +115,29 @@ class LTIConsumer(models.Model):
         str(self.pk): { 'secret': str(self.secret)}
         }
 
+def load_consumer(key):
+  """Loader for consumer_store: the pylti consumers map for key or None"""
+  try:
+    return LTIConsumer.objects.get(pk=key).for_pylti()
+  except (LTIConsumer.DoesNotExist, ValueError):
+    return None
+
+# Consumer secrets are read on every launch and every grade passback. Keep
+# them in a per-process LRU backed by the shared Django cache.
+consumer_store = TieredCache('consumer', load_consumer,
+    maxsize=pylti_config().get('consumer_cache_size', 256),
+    local_ttl=pylti_config().get('consumer_cache_local_ttl', 60),
+    timeout=pylti_config().get('consumer_cache_timeout', 60 * 60))
+
+@receiver(post_save, sender=LTIConsumer)
+@receiver(post_delete, sender=LTIConsumer)
+def invalidate_consumer(sender, instance, *args, **kwargs):
+  consumer_store.invalidate(instance.key)
+
 # Create your models here.
 class BaseLTIObject(models.Model):
-  custom_attributes = jsonfield.JSONField(default={}) 
+  # decoded on first access, not when the row is loaded
+  custom_attributes = LazyJSONField(default=dict)
 
 class LTIUserProfile(BaseLTIObject):
   user = models.ForeignKey(User, db_column='user_id_int')
@@ -85,26 +150,179 @@ class LTIUserProfile(BaseLTIObject):
   def __unicode__(self):
     return "{0.user}".format(self)
 
-
-@receiver(post_init, sender=LTIUserProfile)
-def json_decode_fields(sender, instance, *args, **kwargs):
-  if not instance.custom_attributes:
-    instance.custom_attributes = '{}'
-  instance.custom_attributes = json.loads(instance.custom_attributes)
+  def _tracked_values(self):
+    # deferred fields are not loaded and can't have changed
+    deferred = self.get_deferred_fields()
+    values = dict((field.attname, getattr(self, field.attname))
+        for field in self._meta.concrete_fields
+        if not field.primary_key and field.attname not in deferred and
+        field.name != 'custom_attributes')
+    # compare custom_attributes as JSON text, without decoding it if it
+    # was never read
+    field = self._meta.get_field('custom_attributes')
+    if field.attname in deferred:
+      pass
+    elif field.is_decoded(self):
+      values['custom_attributes'] = json.dumps(self.custom_attributes, sort_keys=True)
+    else:
+      values['custom_attributes'] = field.raw_value(self)
+    return values
+
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super(LTIUserProfile, cls).from_db(db, field_names, values)
+    # the row as loaded, kept as is: nothing is copied or encoded until
+    # changed_fields() is called
+    instance._loaded_row = (field_names, values)
+    return instance
+
+  def mark_clean(self):
+    """Remember the current values as the ones stored in the database"""
+    self._saved_values = self._tracked_values()
+    self.__dict__.pop('_loaded_row', None)
+
+  def _stored_values(self):
+    saved = self.__dict__.get('_saved_values')
+    if saved is None:
+      row = self.__dict__.get('_loaded_row')
+      saved = dict(zip(*row)) if row is not None else {}
+    return saved
+
+  def changed_fields(self):
+    """Names of the fields changed since the profile was loaded or saved;
+    every field of a profile that was never loaded or saved"""
+    saved = self._stored_values()
+    changed = []
+    for name, value in self._tracked_values().items():
+      if name in saved and saved[name] == value:
+        continue
+      if name == 'custom_attributes' and name in saved and \
+          json.dumps(json.loads(saved[name] or '{}'), sort_keys=True) == value:
+        # read (and decoded) but not modified
+        continue
+      changed.append(name)
+    return changed
+
+  def save_changes(self):
+    """Save only the changed fields; skip the write when nothing changed
+
+    :return: list of the fields written
+    """
+    changed = self.changed_fields()
+    if changed:
+      self.save(update_fields=changed)
+    return changed
+
+
+def profile_fields(params):
+  """LTIUserProfile field values of a launch, as the launch would set them:
+  its person fields, and its custom parameters in custom_attributes"""
+  claims = claims_from_params(params)
+  names = set(field.name for field in LTIUserProfile._meta.concrete_fields)
+  fields = dict((prop, value) for prop, value in claims.items()
+      if prop in names and prop != 'user_id' and not 'custom' in prop)
+  fields['custom_attributes'] = dict((prop, value)
+      for prop, value in claims.items() if 'custom' in prop)
+  return fields
+
+@receiver(post_save, sender=LTIUserProfile)
+def mark_profile_clean(sender, instance, *args, **kwargs):
+  instance.mark_clean()
+
+
+def load_user(pk):
+  """Loader for user_store: the User with its first LTIUserProfile as
+  ``lti_profile`` (None for other users), pickled so that every request
+  gets its own copy; None when there is no such user"""
+  try:
+    profile = LTIUserProfile.objects.select_related('user').filter(
+        user_id=pk).order_by('pk').first()
+    user = profile.user if profile is not None else User.objects.get(pk=pk)
+  except (User.DoesNotExist, ValueError):
+    return None
+  user.lti_profile = profile
+  return pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+
+# Django's auth middleware looks the user up on every request. Keep users
+# briefly, so that a page firing many AJAX calls after a launch does not
+# query for each of them. The entry holds the whole user, is_active and the
+# password (the session hash) included; saving, deleting or logging out the
+# user invalidates it.
+user_store = TieredCache('user', load_user,
+    maxsize=pylti_config().get('user_cache_size', 1024),
+    local_ttl=pylti_config().get('user_cache_local_ttl', 5),
+    timeout=pylti_config().get('user_cache_timeout', 60))
+
+def cached_user(pk):
+  """The User with primary key pk, with ``lti_profile``, or None"""
+  data = user_store.get(u'{}'.format(pk))
+  return pickle.loads(data) if data is not None else None
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, *args, **kwargs):
+  user_store.invalidate(u'{}'.format(instance.pk))
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, request, user, **kwargs):
+  if user is not None:
+    user_store.invalidate(u'{}'.format(user.pk))
+
+@receiver(post_save, sender=LTIUserProfile)
+@receiver(post_delete, sender=LTIUserProfile)
+def invalidate_profile_user(sender, instance, *args, **kwargs):
+  user_store.invalidate(u'{}'.format(instance.user_id))
 
 
 class LTIResource(BaseLTIObject):
   """A resource represents link in a context. This can take the form of a module,
   a course navigation link item, an assignment link, etc"""
-  resource_link_id = models.CharField(max_length=255)
+  # resource_link_id is only unique within the consumer that sent it
+  consumer = models.ForeignKey(LTIConsumer, related_name='resources')
+  resource_link_id = models.CharField(max_length=255, db_index=True)
   resource_link_title = models.CharField(max_length=255)
+
+  class Meta:
+    unique_together = (('consumer', 'resource_link_id'),)
+
   def __unicode__(self):
     return r'{}:{}'.format(self.resource_link_id, self.resource_link_title)
 
 class LTIContext(BaseLTIObject):
   "A context is usually a course."
-  context_id = models.CharField(max_length=255) # "context_id": "fd197bddc79a576f47376cd9665657dff8e5d90e",
+  consumer = models.ForeignKey(LTIConsumer, related_name='contexts')
+  context_id = models.CharField(max_length=255, db_index=True) # "context_id": "fd197bddc79a576f47376cd9665657dff8e5d90e",
   context_label = models.CharField(max_length=255) #"context_label": "Reading Ancient Greek",
+  # LTI Membership service of the course (custom_context_memberships_url),
+  # and the ETag of its roster when that was a single page, see
+  # dj_pylti.roster
+  memberships_url = models.TextField(blank=True)
+  roster_etag = models.CharField(max_length=255, blank=True)
+  roster_synced_at = models.DateTimeField(null=True, blank=True)
+
+  class Meta:
+    unique_together = (('consumer', 'context_id'),)
+
+class LTIMembership(models.Model):
+  """A user's enrollment in a context, as reported by the memberships
+  service"""
+  ACTIVE = 'Active'
+  INACTIVE = 'Inactive'
+  DELETED = 'Deleted'
+
+  context = models.ForeignKey(LTIContext, related_name='memberships')
+  profile = models.ForeignKey(LTIUserProfile, related_name='memberships')
+  roles = models.TextField(blank=True)
+  status = models.CharField(max_length=10, default=ACTIVE)
+  # sha1 of the member as last synced; unchanged members are not written
+  digest = models.CharField(max_length=40, blank=True)
+  synced_at = models.DateTimeField(default=timezone.now)
+
+  class Meta:
+    unique_together = (('context', 'profile'),)
+
+  def __unicode__(self):
+    return u'{0.profile_id}@{0.context_id}:{0.roles}'.format(self)
 
 class PropertyName(models.Model):
   name = models.CharField(max_length=50)
@@ -126,10 +344,44 @@ class OptionList(models.Model):
   name = models.CharField(max_length=50, choices=OPTION_NAME_CHOICES) 
   parent = models.ForeignKey('OptionList', null=True, blank=True, related_name='children')
   config = models.ForeignKey('Configuration', null=True, blank=True, related_name='options')
+  # Materialized path (see dj_pylti.trees) and the configuration of the
+  # tree's root, maintained by save()
+  path = models.CharField(max_length=PATH_MAX_LENGTH, blank=True, editable=False)
+  depth = models.PositiveIntegerField(default=0, editable=False)
+  root_config = models.ForeignKey('Configuration', null=True, blank=True,
+      editable=False, related_name='tree_options')
+
+  class Meta:
+    index_together = (('root_config', 'path'),)
 
   def __unicode__(self):
     return u'{}'.format(self.name)
 
+  def save(self, *args, **kwargs):
+    parent = self.parent
+    if parent is not None and self.path and parent.path.startswith(self.path):
+      raise ValueError('An OptionList cannot be nested under itself')
+    old_path, old_root = self.path, self.root_config_id
+    self.root_config_id = parent.root_config_id if parent else self.config_id
+    self.depth = parent.depth + 1 if parent else 0
+    super(OptionList, self).save(*args, **kwargs)
+    path = (parent.path if parent else '') + path_segment(self.pk)
+    if path != self.path:
+      self.path = path
+      OptionList.objects.filter(pk=self.pk).update(path=path)
+    if old_path and (old_path != path or old_root != self.root_config_id):
+      self._move_descendants(old_path)
+
+  def _move_descendants(self, old_path):
+    """Re-root the subtree after this node moved or changed config"""
+    descendants = OptionList.objects.filter(path__startswith=old_path
+        ).exclude(pk=self.pk).values_list('pk', 'path')
+    for pk, path in descendants:
+      relative = path[len(old_path):]
+      OptionList.objects.filter(pk=pk).update(path=self.path + relative,
+          depth=self.depth + relative.count('/'),
+          root_config=self.root_config_id)
+
   def num_properties(self):
     return self.properties.count()
 
@@ -166,6 +418,86 @@ class Configuration(models.Model):
   def build_launch_url(self):
     return self.launch_url
 
+  def option_tree(self):
+    """Every OptionList under this configuration, parents first, in one
+    query"""
+    return OptionList.objects.filter(root_config=self).order_by('path')
+
+  def options_xml(self):
+    """The <lticm:options> elements of the cartridge, at any depth"""
+    properties = OptionProperty.objects.filter(option_list__root_config=self
+        ).select_related('option').order_by('pk')
+    return render_options(list(self.option_tree()), properties)
+
+OUTCOME_STATUSES = (
+    ('pending', 'pending'),
+    ('sent', 'sent'),
+    ('failed', 'failed'),
+    )
+
+class OutcomeMessage(models.Model):
+  """A grade passback waiting in the outbox for the lti_outcome_worker
+  management command"""
+  PENDING = 'pending'
+  SENT = 'sent'
+  FAILED = 'failed'
+
+  consumer_key = models.CharField(max_length=255)
+  url = models.TextField()
+  method = models.CharField(max_length=10, default='POST')
+  content_type = models.CharField(max_length=100, default=POX_CONTENT_TYPE)
+  body = models.TextField()
+  status = models.CharField(max_length=10, choices=OUTCOME_STATUSES, default=PENDING)
+  attempts = models.PositiveIntegerField(default=0)
+  available_at = models.DateTimeField(default=timezone.now)
+  lease_owner = models.CharField(max_length=32, blank=True, null=True)
+  lease_expires = models.DateTimeField(blank=True, null=True)
+  last_error = models.TextField(blank=True)
+  created = models.DateTimeField(auto_now_add=True)
+  sent_at = models.DateTimeField(blank=True, null=True)
+
+  class Meta:
+    index_together = (('status', 'available_at'),)
+
+  def __unicode__(self):
+    return u'{0.pk}:{0.status}:{0.url}'.format(self)
+
+def config_version():
+  """
+  Version of the tool configuration data, bumped whenever a
+  Configuration, OptionList, OptionProperty or PropertyName changes
+
+  :return: (version token, last modified timestamp)
+  """
+  version = shared_cache().get(CONFIG_VERSION_KEY)
+  if version is None:
+    version = bump_config_version()
+  return version
+
+def bump_config_version():
+  version = (uuid.uuid4().hex, int(time.time()))
+  shared_cache().set(CONFIG_VERSION_KEY, version, None)
+  return version
+
+CONFIG_VERSION_KEY = 'dj_pylti:config:version'
+
+@receiver(post_save, sender=Configuration)
+@receiver(post_save, sender=OptionList)
+@receiver(post_save, sender=OptionProperty)
+@receiver(post_save, sender=PropertyName)
+@receiver(post_delete, sender=Configuration)
+@receiver(post_delete, sender=OptionList)
+@receiver(post_delete, sender=OptionProperty)
+@receiver(post_delete, sender=PropertyName)
+def invalidate_config(sender, instance, using=None, **kwargs):
+  bump_config_version()
+  # a render running while the change is not committed yet reads the old
+  # rows and may cache them under the version above: bump again once they
+  # are visible (Django 1.8 has no on_commit; the first bump has to do)
+  on_commit = getattr(transaction, 'on_commit', None)
+  if on_commit is not None:
+    on_commit(bump_config_version, using=using)
+
 class LTI(object):
     """
     LTI Object represents abstraction of current LTI session. It provides
@@ -183,24 +515,91 @@ class LTI(object):
 
         self.request = request
         self.__consumers = None
-
-    def verify(self):
+        self._resource = None
+        self._context = None
+        self._matched_roles = None
+        # (claims, user pk, name) of a verified launch token, see
+        # dj_pylti.tokens
+        self._token = None
+        # token to hand to the browser: set by a launch, '' to remove it
+        self.token = None
+        # request type of the current or last verify()
+        self.request_type = lti_kwargs.get('request')
+        # {request type: True or the LTIException it raised}
+        self._verified = {}
+
+    def verify(self, request_type=None):
         """
         Verify if LTI request is valid, validation
         depends on @lti wrapper arguments
 
+        :param: request_type: 'session', 'initial' or 'any' (default: the
+            wrapper's request argument)
         :raises: LTIException
         """
-        if self.lti_kwargs.get('request') == 'session':
-            self._verify_session()
-        elif self.lti_kwargs.get('request') == 'initial':
-            self.verify_request()
-        elif self.lti_kwargs.get('request') == 'any':
-            self._verify_any()
-        else:
+        request_type = request_type or self.lti_kwargs.get('request')
+        if request_type not in ('session', 'initial', 'any'):
             raise LTIException("Unknown request type")
+        self.request_type = request_type
+        with self._timer('verify'):
+            self._verify_once(request_type)
         return True
 
+    def _verify_once(self, request_type):
+        """
+        Run the check for ``request_type`` unless this object already has;
+        stacked decorators, middleware and mixins share one LTI object per
+        request, and a launch must not be verified (nonce checked) twice
+
+        :raises: LTIException, again if the first check raised it
+        """
+        if request_type == 'any' and (self._verified.get('initial') is True or
+                                      self._verified.get('session') is True):
+            return
+        if request_type in self._verified:
+            if self._verified[request_type] is not True:
+                raise self._verified[request_type]
+            return
+        try:
+            if request_type == 'session':
+                self._verify_session()
+            elif request_type == 'initial':
+                self.verify_request()
+            else:
+                self._verify_any()
+        except LTIException as exception:
+            self._verified[request_type] = exception
+            raise
+        self._verified[request_type] = True
+        if request_type == 'initial':
+            # the launch logged the user in
+            self._verified.pop('session', None)
+
+    def averify(self, request_type=None):
+        """
+        Awaitable ``verify`` for async views; the checks run in a worker
+        thread, see dj_pylti.aio
+        """
+        return run_sync(self.verify, request_type)
+
+    def _consumer_label(self):
+        """
+        Consumer key for metrics labels, once it is known to be genuine
+        """
+        if self.__consumers is None and self._token is None:
+            return 'unknown'
+        try:
+            return u'{}'.format(self.key)
+        except ValueError:
+            return 'unknown'
+
+    def _timer(self, phase):
+        """
+        PhaseTimer for one phase of this request, see dj_pylti.metrics
+        """
+        return PhaseTimer(phase, consumer=self._consumer_label,
+                          request_type=self.request_type or '')
+
     def _verify_any(self):
         """
         Verify that request is in session or initial request
@@ -208,9 +607,9 @@ class LTI(object):
         :raises: LTIException
         """
         try:
-            self._verify_session()
+            self._verify_once('session')
         except LTINotInSessionException:
-            self.verify_request()
+            self._verify_once('initial')
 
     def _verify_session(self):
         """
@@ -218,6 +617,13 @@ class LTI(object):
 
         :raises: LTIException
         """
+        # A signed launch token needs no session, user or database lookup
+        if tokens_enabled():
+            token = request_token(self.request)
+            self._token = read_token(token) if token else None
+            if self._token is not None:
+                return
+
         # Use django's builtin user session
         # authentication. 
 
@@ -228,30 +634,15 @@ class LTI(object):
     @property
     def consumers(self):
         """
-        Gets consumer's map from settings 
+        Gets consumer's map from the consumer store
         :return: consumers map
         """
-        # TODO moving from static settings to consumers in the db
-        config = getattr(settings, 'PYLTI_CONFIG', {})
-        # If 'consumers' is a callable, call it at this point
-        # i.e. app_name.utils.get_consumers
-        #consumers = config.get('consumers', {})
-        #return consumers
-        found_consumers = {}
-        if not self.__consumers:
-          try:
-            consumer = LTIConsumer.objects.get(pk=self.key)
-
-            ''' consumers needs to look like this: 
-            consumers = {
-                "uvu-khansen": {"secret": "khansen-123"},
-            }
-            '''
-            found_consumers = consumer.for_pylti()
-          except LTIConsumer.DoesNotExist:
+        if self.__consumers is None:
+          with self._timer('consumer_lookup'):
+            self.__consumers = consumer_store.get(u'{}'.format(self.key))
+          if self.__consumers is None:
             log.debug('consumer does not exist key:{}'.format(self.key))
-            found_consumers = None
-        return found_consumers
+        return self.__consumers
 
     @property
     def name(self):  # pylint: disable=no-self-use
@@ -259,14 +650,17 @@ class LTI(object):
         Name returns user's name or user's email or user_id
         :return: best guess of name to use to greet user
         """
-        s = dict(self.request.session)
+        if self._token is not None:
+          return self._token[2] or self.claim('user_id', '')
+        s = self.claims
         user = self.request.user
         if user and user.get_full_name():
           return user.get_full_name() 
         elif 'lis_person_sourcedid' in s:
           return s['lis_person_sourcedid']
-        elif 'lis_person_contact_email_primary' in s:
-          return s['lis_person_contact_email_primary']
+        elif getattr(user, 'email', ''):
+          # the launch's lis_person_contact_email_primary
+          return user.email
         elif 'user_id' in s:
           return s['user_id']
         else:
@@ -280,12 +674,41 @@ class LTI(object):
         """
         #k = self.request.POST.get('oauth_consumer_key')
 
-        try:
-          key = self.request.POST['oauth_consumer_key']
-        except Exception as exc:
-          key = None
+        key = self.request.POST.get('oauth_consumer_key',
+            self.claim('oauth_consumer_key'))
+        if key is None:
+          return None
         return int(key)
 
+    @property
+    def claims(self):
+        """
+        Parameters of the launch that started this session, see
+        dj_pylti.claims
+
+        :return: dict
+        """
+        if self._token is not None:
+          return self._token[0]
+        return get_claims(self.request.session)
+
+    def claim(self, name, default=None):
+        """
+        One launch parameter kept in the session, e.g. claim('context_id'),
+        see dj_pylti.claims.SESSION_CLAIMS
+        """
+        return self.claims.get(name, default)
+
+    @property
+    def user_pk(self):
+        """
+        Primary key of the launching user, read from the launch token when
+        there is one so that request.user need not be loaded
+        """
+        if self._token is not None:
+          return self._token[1]
+        return self.request.user.pk
+
     @staticmethod
     def message_identifier_id():
         """
@@ -302,7 +725,7 @@ class LTI(object):
 
         :return: LTI lis_result_sourcedid
         """
-        return self.request.session['lis_result_sourcedid']
+        return self.claims['lis_result_sourcedid']
 
     @property
     def role(self):  # pylint: disable=no-self-use
@@ -311,7 +734,7 @@ class LTI(object):
 
         :return: roles
         """
-        return session_roles(self.request)
+        return self.claims.get('roles')
 
     #@staticmethod
     def is_role(self, role):
@@ -322,26 +745,25 @@ class LTI(object):
         :return: if user is in role
         :exception: LTIException if role is unknown
         """
-        roles = session_roles(self.request).split(',')
-        if role in LTI_ROLES:
-            role_list = LTI_ROLES[role]
-            # find the intersection of the roles
-            roles = set(role_list) & set(roles)
-            is_user_role_there = len(roles) >= 1
-            log.debug('roles %s', roles)
-            return is_user_role_there
-        else:
+        if role not in ROLE_SETS:
             raise LTIException("Unknown role {}.".format(role))
+        if self._matched_roles is None:
+            # parse the session roles once per request
+            self._matched_roles = matched_roles(self.role)
+        return role in self._matched_roles
 
-    def _check_role(self):
+    def _check_role(self, role=None):
         """
         Check that user is in role specified as wrapper attribute
 
+        :param: role: role to check (default: the wrapper's role argument)
         :exception: LTIRoleException if user is not in roles
         """
         role_required = u'any'
         log.debug('lti_kwargs: %s', self.lti_kwargs)
-        if 'role' in self.lti_kwargs:
+        if role is not None:
+            role_required = role
+        elif 'role' in self.lti_kwargs:
             role_required = self.lti_kwargs['role']
         log.debug(
             "check_role lti_role=%s decorator_role=%s", self.role, role_required
@@ -349,6 +771,13 @@ class LTI(object):
         if not (role_required == u'any' or self.is_role(role_required)):
             raise LTIRoleException('Not authorized.')
 
+    def _acheck_role(self, role=None):
+        """
+        Awaitable ``_check_role``: the roles may have to be read from the
+        session store
+        """
+        return run_sync(self._check_role, role)
+
     @property
     def response_url(self):
         """
@@ -357,24 +786,92 @@ class LTI(object):
 
         :return: remapped lis_outcome_service_url
         """
-        url = self.request.session['lis_outcome_service_url']
-        app_config = getattr(settings, 'PYLTI_CONFIG', {})
-        urls = app_config.get('PYLTI_URL_FIX', dict())
-        for prefix, mapping in urls.iteritems():
-            if url.startswith(prefix):
-                for _from, _to in mapping.iteritems():
-                    url = url.replace(_from, _to)
-        return url
+        return fix_url(self.claims['lis_outcome_service_url'])
 
     @property
     def resource(self):
-      resource, created = LTIResource.objects.get_or_create(resource_link_id=self.request.session['resource_link_id'])
-      return resource
+      if self._resource is None:
+        self._resource, created = LTIResource.objects.get_or_create(
+            consumer_id=self.key,
+            resource_link_id=self.claims['resource_link_id'])
+      return self._resource
 
     @property
     def context(self):
-      context, created = LTIContext.objects.get_or_create(context_id=self.request.session['context_id'])
-      return context
+      if self._context is None:
+        self._context, created = LTIContext.objects.get_or_create(
+            consumer_id=self.key,
+            context_id=self.claims['context_id'])
+      return self._context
+
+    def _persist_launch(self, params):
+        """
+        Get or create the LTIResource and LTIContext of a launch, one
+        indexed query each when they already exist. Concurrent first
+        launches are resolved by the (consumer, id) unique constraints.
+        """
+        if params.get('resource_link_id'):
+          self._resource, created = LTIResource.objects.get_or_create(
+              consumer_id=self.key,
+              resource_link_id=params['resource_link_id'],
+              defaults={'resource_link_title': params.get('resource_link_title', '')})
+        if params.get('context_id'):
+          memberships_url = params.get('custom_context_memberships_url', '')
+          self._context, created = LTIContext.objects.get_or_create(
+              consumer_id=self.key,
+              context_id=params['context_id'],
+              defaults={'context_label': params.get('context_label', ''),
+                        'memberships_url': memberships_url})
+          if memberships_url and self._context.memberships_url != memberships_url:
+            self._context.memberships_url = memberships_url
+            self._context.save(update_fields=['memberships_url'])
+
+    def _logged_in_as(self, user):
+        """
+        True if the session is already authenticated as user, by the same
+        backend and with the same password hash
+        """
+        session = self.request.session
+        return (session.get(auth.SESSION_KEY) ==
+                    user._meta.pk.value_to_string(user) and
+                session.get(auth.BACKEND_SESSION_KEY) == user.backend and
+                session.get(auth.HASH_SESSION_KEY) ==
+                    user.get_session_auth_hash())
+
+    def _save_launch(self, params):
+        """
+        Everything the launch writes, in one transaction: the resource and
+        context, the user and its profile, and the login
+
+        :return: (user, claims)
+        """
+        with transaction.atomic():
+          with self._timer('persist'):
+            self._persist_launch(params)
+          user = authenticate(params=params)
+          # the backend hands over the profile it already loaded
+          user_profile = getattr(user, 'lti_profile', None)
+          if user_profile is None:
+            user_profile = user.ltiuserprofile_set.first()
+          with self._timer('login') as timer:
+            if self._logged_in_as(user):
+              # a relaunch: logging in again would rewrite the session
+              self.request.user = user
+              timer.outcome = 'skipped'
+            else:
+              login(self.request, user)
+          with self._timer('profile'):
+            claims = claims_from_params(params)
+            store_claims(self.request.session, claims)
+            for prop, value in claims.items():
+                if prop !='user_id': # Don't need to add it again
+                  if not 'custom' in prop:
+                    setattr(user_profile, prop, value)
+                  else:
+                    user_profile.custom_attributes[prop] = value
+            # relaunches rarely change anything; write only what did
+            user_profile.save_changes()
+        return user, claims
 
     def verify_request(self):
         """
@@ -382,10 +879,9 @@ class LTI(object):
 
         :raises: LTIException is request validation failed
         """
-        if self.request.method == 'POST':
-            params = self.request.POST.dict()
-        #else:
-        #    params = self.request.GET.dict()
+        if self.request.method != 'POST':
+            raise LTIException('LTI launches must be POSTed')
+        params = self.request.POST.dict()
 
         url = self.request.build_absolute_uri()
         log.debug('verify_request url: %s', url)
@@ -395,61 +891,64 @@ class LTI(object):
         log.debug('verify_request url: %s', url)
         try:
             #self._key = params['oauth_consumer_key']
-            verify_request_common(self.consumers, 
-                url,
-                self.request.method, 
-                dict(self.request.META),
-                params)
-
-            # get or create LTIResource
-            if params.get('resource_link_id'):
-              resource, created = LTIResource.objects.get_or_create(resource_link_id=params['resource_link_id'])
-              if created and params.get('resource_link_title'):
-                resource.resource_link_title = params['resource_link_title']
-                resource.save()
-              #self.resource = resource
-  
-            if params.get('context_id'):
-              context, created = LTIContext.objects.get_or_create(context_id=params['context_id'])
-              if created and params.get('context_label'):
-                context.context_label = params['context_label']
-                context.save()
-              #self.context = context
-
-            # get_or_create LTIUserProfile
-            # Authenticate user
-            user = authenticate(params=params)
-            user_profile = user.ltiuserprofile_set.first()
-            login(self.request, user_profile.user)
-            for prop in LTI_PROPERTY_LIST:
-                if params.get(prop, None):
-                    #log.debug("params %s=%s", prop, params.get(prop, None))
-                    self.request.session[prop] = params[prop]
-                    if prop !='user_id': # Don't need to add it again
-                      if not 'custom' in prop:
-                        setattr(user_profile, prop, params.get(prop, None))
-                      else:
-                        user_profile.custom_attributes[prop] = params.get(prop, None)
-            user_profile.save()
-
+            with self._timer('oauth'):
+              verify_request_common(self.consumers, 
+                  url,
+                  self.request.method, 
+                  dict(self.request.META),
+                  params)
+
+            # The signature is good; refuse replays of this launch
+            with self._timer('nonce') as timer:
+              replay = check_nonce(params.get('oauth_consumer_key'),
+                  params.get('oauth_nonce'), params.get('oauth_timestamp'))
+              if replay:
+                timer.outcome = 'replay'
+                raise LTIException(replay)
+
+            # A concurrent first launch of the same user, resource or
+            # context makes the launch fail on a unique constraint. The rows
+            # it conflicted with may only be visible to a new transaction
+            # (MySQL's REPEATABLE READ), so the whole launch is tried again.
+            try:
+              user, claims = self._save_launch(params)
+            except IntegrityError:
+              user, claims = self._save_launch(params)
+            self._matched_roles = None
+            if tokens_enabled():
+              self.token = make_token(claims, user.pk, self.name)
 
             return user is not None
         except LTIException as exc:
             log.debug('verify_request failed %s' % exc)
-            for prop in LTI_PROPERTY_LIST:
-                if self.request.session.get(prop, None):
-                    del self.request.session[prop]
+            clear_claims(self.request.session)
 
             # Do django logout instead
             logout(self.request)
             raise
 
+    def _send_outcome(self, url, body, method='POST',
+                      content_type=POX_CONTENT_TYPE):
+        """
+        Send an outcome message now, or queue it in the outbox when
+        PYLTI_CONFIG['outcome_delivery'] is 'outbox'
+
+        :return: True if the message was delivered or queued
+        """
+        key = u'{}'.format(self.key)
+        if outbox_enabled():
+            OutcomeMessage.objects.create(consumer_key=key, url=url,
+                body=body, method=method, content_type=content_type)
+            return True
+        return send_outcome(self.consumers, key, url, body, method=method,
+                            content_type=content_type)
+
     def post_grade(self, grade):
         """
         Post grade to LTI consumer using XML
 
         :param: grade: 0 <= grade <= 1
-        :return: True if post successful and grade valid
+        :return: True if post successful (or queued) and grade valid
         :exception: LTIPostMessageException if call failed
         """
         message_identifier_id = self.message_identifier_id()
@@ -457,17 +956,20 @@ class LTI(object):
         lis_result_sourcedid = self.lis_result_sourcedid
         # # edX devbox fix
         score = float(grade)
-        if 0 <= score <= 1.0:
-            xml = generate_request_xml(
-                message_identifier_id, operation, lis_result_sourcedid,
-                score)
-            ret = post_message(self.consumers, self.key,
-                               self.response_url, xml)
-            if not ret:
-                raise LTIPostMessageException("Post Message Failed")
-            return True
-
-        return False
+        with self._timer('post_grade') as timer:
+          if 0 <= score <= 1.0:
+              xml = generate_request_xml(
+                  message_identifier_id, operation, lis_result_sourcedid,
+                  score)
+              ret = self._send_outcome(self.response_url, xml)
+              if not ret:
+                  raise LTIPostMessageException("Post Message Failed")
+              if outbox_enabled():
+                  timer.outcome = 'queued'
+              return True
+
+          timer.outcome = 'invalid'
+          return False
 
     def post_grade2(self, grade, user=None, comment=''):
         """
@@ -476,31 +978,69 @@ class LTI(object):
         https://openedx.atlassian.net/browse/PLAT-281
 
         :param: grade: 0 <= grade <= 1
-        :return: True if post successful and grade valid
+        :return: True if post successful (or queued) and grade valid
         :exception: LTIPostMessageException if call failed
         """
-        content_type = 'application/vnd.ims.lis.v2.result+json'
+        content_type = LTI2_CONTENT_TYPE
         if user is None:
-          user = self.request.session['user_id']
+          user = self.claims['user_id']
         lti2_url = self.response_url.replace(
           "/grade_handler",
           "/lti_2_0_result_rest_handler/user/{}".format(user))
         score = float(grade)
-        if 0 <= score <= 1.0:
-          body = json.dumps({
-              "@context": "http://purl.imsglobal.org/ctx/lis/v2/Result",
-              "@type": "Result",
-              "resultScore": score,
-              "comment": comment
-          })
-          ret = post_message2(self.consumers, self.key, lti2_url, body,
-                              method='PUT',
-                              content_type=content_type)
-          if not ret:
-              raise LTIPostMessageException("Post Message Failed")
-          return True
-
-        return False
+        with self._timer('post_grade2') as timer:
+          if 0 <= score <= 1.0:
+            body = json.dumps({
+                "@context": "http://purl.imsglobal.org/ctx/lis/v2/Result",
+                "@type": "Result",
+                "resultScore": score,
+                "comment": comment
+            })
+            ret = self._send_outcome(lti2_url, body, method='PUT',
+                                     content_type=content_type)
+            if not ret:
+                raise LTIPostMessageException("Post Message Failed")
+            if outbox_enabled():
+                timer.outcome = 'queued'
+            return True
+
+          timer.outcome = 'invalid'
+          return False
+
+    def sync_roster(self, **kwargs):
+        """
+        Sync the launch context's members from the memberships service,
+        see dj_pylti.roster.sync_roster
+
+        :return: dict of counts
+        :exception: RosterError if the service could not be read
+        """
+        from .roster import sync_roster
+        return sync_roster(self.context, **kwargs)
+
+    def apost_grade(self, grade):
+        """
+        Awaitable ``post_grade``: the outcome request (or the outbox insert)
+        runs in a worker thread, leaving the event loop free
+        """
+        return run_sync(self.post_grade, grade)
+
+    def apost_grade2(self, grade, user=None, comment=''):
+        """
+        Awaitable ``post_grade2``, see ``apost_grade``
+        """
+        return run_sync(self.post_grade2, grade, user=user, comment=comment)
+
+    @staticmethod
+    def post_grades_bulk(items, **kwargs):
+        """
+        Post many scores at once, e.g. an instructor's "sync all grades"
+
+        :param: items: (lis_result_sourcedid, score, outcome url,
+            consumer key) tuples
+        :return: list of GradeResult
+        """
+        return post_grades_bulk(items, **kwargs)
 
     def is_instructor(self):
       return self.is_role('instructor')
@@ -513,8 +1053,11 @@ class LTI(object):
         """
         Invalidates session
         """
-        for prop in LTI_PROPERTY_LIST:
-            if self.request.session.get(prop, None):
-                del self.request.session[prop]
+        clear_claims(self.request.session)
         #self.request.session[LTI_SESSION_KEY] = False
+        self._matched_roles = None
+        if self._token is not None or tokens_enabled():
+          # tokens are not revocable; drop the cookie, let others expire
+          self._token = None
+          self.token = ''
         logout(self.request)
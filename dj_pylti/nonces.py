@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+OAuth nonce replay protection.
+
+pylti only checks the signature and the ``oauth_timestamp`` window, so a
+captured launch can be replayed for as long as its timestamp is accepted.
+``NonceStore`` remembers every (consumer key, nonce) pair for that long and
+rejects repeats.
+
+Two backends are available through ``PYLTI_CONFIG['nonce_backend']``:
+
+``'local'`` (default)
+    a bounded in-process ``TTLSet``; enough for a single process. A nonce
+    is never forgotten before it expires: when the set is full of live
+    nonces, launches are rejected until some expire.
+``'cache'``
+    the Django cache (``cache.add`` is atomic on memcached and redis), for
+    deployments with several processes or nodes.
+"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import six
+
+from .cache import pylti_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# oauth2.Server accepts timestamps up to 300 seconds old
+DEFAULT_WINDOW = 300
+
+
+class TTLSetFull(Exception):
+    """
+    Every member of a TTLSet is still live
+    """
+    pass
+
+
+class TTLSet(object):
+    """
+    Bounded set whose members expire ``ttl`` seconds after being added.
+
+    Every member lives for the same ``ttl``, so insertion order is also
+    expiry order and expired members are always at the front. ``add`` pops
+    them from there, which keeps it O(1) amortized. Live members are never
+    evicted.
+    """
+
+    def __init__(self, ttl, maxsize=100000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        data = self._data
+        while data:
+            member, expires = next(six.iteritems(data))
+            if expires > now:
+                break
+            del data[member]
+
+    def add(self, member, now=None):
+        """
+        Add ``member``
+
+        :return: False if it was already present, True otherwise
+        :raises: TTLSetFull when ``maxsize`` members are live
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._evict(now)
+            if member in self._data:
+                return False
+            if len(self._data) >= self.maxsize:
+                raise TTLSetFull()
+            self._data[member] = now + self.ttl
+            return True
+
+    def __len__(self):
+        return len(self._data)
+
+
+class NonceStore(object):
+    """
+    Remembers nonces for ``ttl`` seconds, locally or in the Django cache.
+    """
+
+    def __init__(self, backend='local', ttl=2 * DEFAULT_WINDOW,
+                 maxsize=100000, cache_alias='default', max_rate=None):
+        if backend == 'local' and max_rate and maxsize < max_rate * ttl:
+            raise ImproperlyConfigured(
+                'nonce_cache_size {} cannot hold {} launches per second for '
+                '{} seconds'.format(maxsize, max_rate, ttl))
+        self.backend = backend
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.local = TTLSet(ttl, maxsize)
+
+    def _cache_key(self, member):
+        # nonces are client supplied; hash them into a safe, bounded key
+        digest = hashlib.sha1(member.encode('utf-8')).hexdigest()
+        return 'dj_pylti:nonce:{}'.format(digest)
+
+    def add(self, consumer_key, nonce, now=None):
+        """
+        Record a nonce for a consumer
+
+        :return: False if the nonce was already used, True otherwise
+        :raises: TTLSetFull when the local set has no room for it
+        """
+        member = '{}:{}'.format(consumer_key, nonce)
+        if self.backend == 'cache':
+            return caches[self.cache_alias].add(self._cache_key(member), 1,
+                                                self.ttl)
+        return self.local.add(member, now=now)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_nonce_store():
+    """
+    The process-wide NonceStore built from PYLTI_CONFIG, or None when
+    ``nonce_backend`` is set to None
+    """
+    global _store  # pylint: disable=global-statement
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = pylti_config()
+                backend = config.get('nonce_backend', 'local')
+                if backend is None:
+                    return None
+                _store = NonceStore(
+                    backend=backend,
+                    ttl=2 * config.get('nonce_window', DEFAULT_WINDOW),
+                    maxsize=config.get('nonce_cache_size', 100000),
+                    cache_alias=config.get('cache_alias', 'default'),
+                    max_rate=config.get('nonce_max_rate'))
+    return _store
+
+
+def check_nonce(consumer_key, nonce, timestamp, now=None):
+    """
+    Check the nonce and timestamp of an already verified launch
+
+    :return: None if the launch is fresh, otherwise the reason to reject it
+    """
+    store = get_nonce_store()
+    if store is None:
+        return None
+    now = time.time() if now is None else now
+    window = pylti_config().get('nonce_window', DEFAULT_WINDOW)
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        return 'Missing or invalid oauth_timestamp'
+    if abs(now - timestamp) > window:
+        return 'Expired oauth_timestamp'
+    if not nonce:
+        return 'Missing oauth_nonce'
+    try:
+        if not store.add(consumer_key, nonce, now=now):
+            return 'OAuth nonce has already been used'
+    except TTLSetFull:
+        # forgetting a live nonce would let its launch be replayed
+        log.warning('Nonce store is full (nonce_cache_size %s); rejecting '
+                    'launches until nonces expire', store.local.maxsize)
+        return 'Too many launches, try again later'
+    return None
+
+
+def reset_nonce_store():
+    global _store  # pylint: disable=global-statement
+    with _store_lock:
+        _store = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(sender, setting, **kwargs):
+    if setting == 'PYLTI_CONFIG':
+        reset_nonce_store()
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Delivery of outcome (grade passback) messages to LTI consumers.
+
+``send_outcome`` posts a signed message straight away. When
+``PYLTI_CONFIG['outcome_delivery']`` is ``'outbox'`` the ``LTI`` grade
+methods store the message as an :class:`OutcomeMessage` instead, and the
+``lti_outcome_worker`` management command delivers it with
+``deliver_pending``.
+"""
+from __future__ import unicode_literals
+
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.db.models import Q
+from django.utils import timezone
+
+from pylti.common import LTIPostMessageException, generate_request_xml
+
+from .cache import pylti_config
+from .transport import get_transport
+from .urlfix import fix_url
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+POX_CONTENT_TYPE = 'application/xml'
+LTI2_CONTENT_TYPE = 'application/vnd.ims.lis.v2.result+json'
+
+GradeResult = namedtuple('GradeResult',
+                         'sourcedid score consumer_key success error')
+
+
+def outbox_enabled():
+    """
+    True when grade passback should go through the outbox
+    """
+    return pylti_config().get('outcome_delivery', 'immediate') == 'outbox'
+
+
+def send_outcome(consumers, key, url, body, method='POST',
+                 content_type=POX_CONTENT_TYPE):
+    """
+    Post a signed outcome message to the consumer over the pooled
+    transport
+
+    LTI 1.1 POX messages succeed when the response reports ``success``,
+    LTI 2.0 REST messages when the consumer answers 200.
+
+    :return: success
+    :exception: LTIPostMessageException if the consumer is unknown
+    """
+    # pylint: disable=too-many-arguments
+    consumer = (consumers or {}).get(key)
+    if not consumer or not consumer.get('secret'):
+        raise LTIPostMessageException('Unknown consumer {}'.format(key))
+    response, content = get_transport().request(
+        key, consumer['secret'], url, body, method=method,
+        content_type=content_type, cert=consumer.get('cert'))
+    if content_type == POX_CONTENT_TYPE:
+        is_success = b'<imsx_codeMajor>success</imsx_codeMajor>' in content
+    else:
+        is_success = response.status == 200
+    log.debug("is success %s", is_success)
+    return is_success
+
+
+def post_grades_bulk(items, max_workers=None, per_consumer=None):
+    """
+    Post many LTI 1.1 scores concurrently
+
+    ``items`` is an iterable of ``(lis_result_sourcedid, score,
+    lis_outcome_service_url, consumer_key)`` tuples; the URLs go through
+    PYLTI_URL_FIX like ``LTI.response_url``. Requests run on a
+    thread pool of ``max_workers`` threads (``bulk_grade_workers``, default
+    16) with at most ``per_consumer`` in flight per consumer key
+    (``bulk_grade_per_consumer``, default 4). In outbox mode the messages
+    are queued in a single insert instead.
+
+    Each consumer's items are drained by at most ``per_consumer`` pool
+    tasks, so a slow consumer occupies that many threads and the others
+    keep theirs. A score that is not a number in [0, 1] fails its own item
+    only.
+
+    :return: list of GradeResult, in the order of ``items``
+    """
+    from .models import LTI, OutcomeMessage, consumer_store
+
+    config = pylti_config()
+    if max_workers is None:
+        max_workers = config.get('bulk_grade_workers', 16)
+    if per_consumer is None:
+        per_consumer = config.get('bulk_grade_per_consumer', 4)
+
+    prepared = []
+    for sourcedid, score, url, key in items:
+        key = '{}'.format(key)
+        url = fix_url(url)
+        xml = None
+        try:
+            score = float(score)
+        except (TypeError, ValueError):
+            pass
+        else:
+            if 0 <= score <= 1.0:
+                xml = generate_request_xml(LTI.message_identifier_id(),
+                                           'replaceResult', sourcedid, score)
+        prepared.append((sourcedid, score, url, key, xml))
+    if not prepared:
+        return []
+
+    def result(item, success, error=''):
+        return GradeResult(item[0], item[1], item[3], success, error)
+
+    if outbox_enabled():
+        OutcomeMessage.objects.bulk_create(
+            OutcomeMessage(consumer_key=key, url=url, body=xml)
+            for _, _, url, key, xml in prepared if xml is not None)
+        return [result(item, item[4] is not None,
+                       '' if item[4] is not None else 'Invalid score')
+                for item in prepared]
+
+    results = [None] * len(prepared)
+    queues = OrderedDict()
+    for index, item in enumerate(prepared):
+        if item[4] is None:
+            results[index] = result(item, False, 'Invalid score')
+        else:
+            queues.setdefault(item[3], deque()).append(index)
+
+    # Resolve secrets here; pool threads then never touch the database
+    consumers = dict((key, consumer_store.get(key)) for key in queues)
+
+    def post(item):
+        _, _, url, key, xml = item
+        try:
+            if send_outcome(consumers[key], key, url, xml):
+                return result(item, True)
+            return result(item, False, 'Consumer rejected outcome')
+        except Exception as exc:  # pylint: disable=broad-except
+            return result(item, False, '{}: {}'.format(
+                exc.__class__.__name__, exc))
+
+    def drain(key):
+        queue = queues[key]
+        while True:
+            try:
+                index = queue.popleft()
+            except IndexError:
+                return
+            results[index] = post(prepared[index])
+
+    # round robin: every consumer's first lane is scheduled before any
+    # consumer's second one
+    lanes = [key for lane in range(max(1, per_consumer)) for key in queues
+             if lane < len(queues[key])]
+    if lanes:
+        pool = ThreadPool(max(1, min(max_workers, len(lanes))))
+        try:
+            pool.map(drain, lanes, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return results
+
+
+def backoff_delay(attempts):
+    """
+    Seconds to wait before retrying a message that failed ``attempts`` times
+    """
+    config = pylti_config()
+    base = config.get('outbox_backoff', 30)
+    ceiling = config.get('outbox_backoff_max', 60 * 60)
+    delay = min(base * (2 ** (attempts - 1)), ceiling)
+    # jitter keeps workers from retrying a whole burst in lock step
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(batch_size=10, lease_seconds=None, owner=None):
+    """
+    Lease up to ``batch_size`` due messages for this worker
+
+    Rows are taken with a conditional UPDATE, so concurrent workers never
+    claim the same message twice. A lease that is not released before it
+    expires (e.g. the worker died) makes the message claimable again.
+
+    :return: list of claimed OutcomeMessage
+    """
+    from .models import OutcomeMessage
+
+    if lease_seconds is None:
+        lease_seconds = pylti_config().get('outbox_lease', 5 * 60)
+    owner = owner or uuid.uuid4().hex
+    now = timezone.now()
+    claimable = (Q(status=OutcomeMessage.PENDING, available_at__lte=now) &
+                 (Q(lease_expires__isnull=True) | Q(lease_expires__lte=now)))
+    candidates = list(OutcomeMessage.objects.filter(claimable)
+                      .order_by('available_at')
+                      .values_list('pk', flat=True)[:batch_size])
+    if not candidates:
+        return []
+    OutcomeMessage.objects.filter(claimable, pk__in=candidates).update(
+        lease_owner=owner,
+        lease_expires=now + timedelta(seconds=lease_seconds))
+    return list(OutcomeMessage.objects.filter(pk__in=candidates,
+                                              lease_owner=owner))
+
+
+def deliver(message, max_attempts=None):
+    """
+    Send one claimed message and record the result
+
+    :return: OutcomeMessage status after the attempt
+    """
+    from .models import OutcomeMessage, consumer_store
+
+    if max_attempts is None:
+        max_attempts = pylti_config().get('outbox_max_attempts', 8)
+    try:
+        consumers = consumer_store.get(message.consumer_key)
+        success = send_outcome(consumers, message.consumer_key, message.url,
+                               message.body, method=message.method,
+                               content_type=message.content_type)
+        error = '' if success else 'Consumer rejected outcome'
+    except Exception as exc:  # pylint: disable=broad-except
+        success = False
+        error = '{}: {}'.format(exc.__class__.__name__, exc)
+
+    now = timezone.now()
+    attempts = message.attempts + 1
+    changes = {'attempts': attempts, 'lease_owner': None,
+               'lease_expires': None, 'last_error': error}
+    if success:
+        changes.update(status=OutcomeMessage.SENT, sent_at=now)
+    elif attempts >= max_attempts:
+        changes.update(status=OutcomeMessage.FAILED)
+    else:
+        changes.update(available_at=now + timedelta(
+            seconds=backoff_delay(attempts)))
+    if error:
+        log.info('outcome %s attempt %s failed: %s', message.pk, attempts,
+                 error)
+    # Only record the result if we still hold the lease
+    OutcomeMessage.objects.filter(
+        pk=message.pk, lease_owner=message.lease_owner).update(**changes)
+    return changes.get('status', OutcomeMessage.PENDING)
+
+
+def deliver_pending(batch_size=10, lease_seconds=None, max_attempts=None,
+                    owner=None):
+    """
+    Claim one batch of due messages and deliver them
+
+    :return: dict with the number of sent, retried and failed messages
+    """
+    from .models import OutcomeMessage
+
+    counts = {'sent': 0, 'retried': 0, 'failed': 0}
+    for message in claim(batch_size, lease_seconds, owner):
+        status = deliver(message, max_attempts)
+        if status == OutcomeMessage.SENT:
+            counts['sent'] += 1
+        elif status == OutcomeMessage.FAILED:
+            counts['failed'] += 1
+        else:
+            counts['retried'] += 1
+    return counts
+
+
+def run_worker(batch_size=10, lease_seconds=None, max_attempts=None,
+               idle_sleep=1.0, once=False, stop=None):
+    """
+    Deliver outbox messages until ``stop()`` is true, or until the outbox
+    has nothing due when ``once`` is set
+
+    :return: dict with totals and elapsed seconds
+    """
+    totals = {'sent': 0, 'retried': 0, 'failed': 0}
+    owner = uuid.uuid4().hex
+    started = time.time()
+    while not (stop and stop()):
+        counts = deliver_pending(batch_size, lease_seconds, max_attempts,
+                                 owner=owner)
+        for name, value in counts.items():
+            totals[name] += value
+        if not any(counts.values()):
+            if once:
+                break
+            time.sleep(idle_sleep)
+    totals['elapsed'] = time.time() - started
+    return totals
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Pagination for tables too large to ``COUNT(*)`` on every page view.
+
+``EstimatedCountPaginator`` takes the row count of an unfiltered queryset
+from the database statistics (PostgreSQL ``pg_class.reltuples``, MySQL
+``information_schema.TABLES``) instead of counting. Filtered querysets,
+small tables and other backends are counted as usual.
+"""
+from __future__ import unicode_literals
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .cache import pylti_config
+
+ESTIMATE_QUERIES = {
+    'postgresql': 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+    'mysql': 'SELECT table_rows FROM information_schema.tables '
+             'WHERE table_schema = DATABASE() AND table_name = %s',
+}
+
+
+def estimated_count(queryset):
+    """
+    Estimated number of rows of an unfiltered queryset
+
+    :return: int, or None when ``queryset`` is a list or filtered, or the
+        database keeps no usable statistics
+    """
+    query = getattr(queryset, 'query', None)
+    if query is None or query.where or query.distinct or query.low_mark or query.high_mark:
+        return None
+    connection = connections[queryset.db]
+    sql = ESTIMATE_QUERIES.get(connection.vendor)
+    if sql is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using ``estimated_count`` once a table holds more than
+    PYLTI_CONFIG['admin_estimate_threshold'] (10000) rows
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if (estimate is not None and
+                estimate >= pylti_config().get('admin_estimate_threshold',
+                                               10000)):
+            return estimate
+        return super(EstimatedCountPaginator, self).count
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Roster sync from the LMS memberships service.
+
+Users and profiles normally appear on a student's first launch. A roster
+sync reads a course's members from its memberships service and creates or
+updates their ``User``, ``LTIUserProfile`` and ``LTIMembership`` rows in
+advance, so that instructor views list the whole class.
+
+Only the LTI 1.1 Membership service extension is supported
+(``pageOf.membershipSubject.membership`` with a ``nextPage`` URL): its
+requests are signed with the consumer's OAuth 1 secret. Names and Roles
+Provisioning (LTI 1.3) needs OAuth 2 bearer tokens, which this package does
+not obtain. Pages are processed as they arrive, in chunks of bulk inserts.
+
+Resyncs are incremental. A roster that fit on one page is requested with
+the ETag of the last sync, and a ``304 Not Modified`` ends the sync without
+a write. Longer rosters are read in full, since an ETag only covers its own
+page. Every member's data is hashed, and members whose hash has not changed
+are skipped. Members missing from a complete sync are marked ``Deleted``.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from pylti.common import LTIException
+
+from .cache import pylti_config
+from .models import LTIMembership, LTIUserProfile, consumer_store
+from .transport import get_transport
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MEMBERSHIP_CONTENT_TYPE = ('application/vnd.ims.lis.v2.membershipcontainer'
+                           '+json')
+ACCEPT = ', '.join((MEMBERSHIP_CONTENT_TYPE, 'application/json'))
+
+# (profile field, member field)
+PROFILE_FIELDS = (
+    ('lis_person_name_given', 'given_name'),
+    ('lis_person_name_family', 'family_name'),
+    ('lis_person_name_full', 'name'),
+    ('lis_person_contact_email_primary', 'email'),
+)
+# (user field, member field)
+USER_FIELDS = (
+    ('first_name', 'given_name'),
+    ('last_name', 'family_name'),
+    ('email', 'email'),
+)
+
+
+class RosterError(LTIException):
+    """
+    The memberships service could not be read
+    """
+    pass
+
+
+def _member(user_id, name, given_name, family_name, email, roles, status):
+    return {
+        'user_id': user_id,
+        'name': name or '',
+        'given_name': given_name or '',
+        'family_name': family_name or '',
+        'email': email or '',
+        'roles': ','.join(roles or ()),
+        'status': status or LTIMembership.ACTIVE,
+    }
+
+
+def parse_page(payload):
+    """
+    Members of one page of a membership container, and the next page's URL
+
+    :return: ([member dicts], next url or None)
+    """
+    page = payload.get('pageOf', {})
+    memberships = page.get('membershipSubject', {}).get('membership', [])
+    members = []
+    for item in memberships:
+        member = item.get('member', {})
+        members.append(_member(
+            member.get('userId') or member.get('user_id'),
+            member.get('name'), member.get('givenName'),
+            member.get('familyName'), member.get('email'),
+            item.get('role') or member.get('roles'), item.get('status')))
+    return members, payload.get('nextPage') or None
+
+
+def digest(member):
+    return hashlib.sha1(json.dumps(member, sort_keys=True).encode(
+        'utf-8')).hexdigest()
+
+
+def fetch_pages(url, key, secret, etag=None):
+    """
+    Signed GETs of every page of the roster, as they arrive
+
+    :param: etag: ETag of the roster when it was a single page
+    :return: iterator of (response, payload); nothing when the roster is
+        still that single page
+    :raises: RosterError
+    """
+    transport = get_transport()
+    headers = {'Accept': ACCEPT}
+    if etag:
+        headers['If-None-Match'] = etag
+    fetched = set()
+    # a next link back to a fetched page ends the roster
+    while url and url not in fetched:
+        conditional = 'If-None-Match' in headers
+        response, content = transport.request(
+            key, secret, url, b'', method='GET',
+            content_type='application/json', headers=headers)
+        headers = {'Accept': ACCEPT}
+        if response.status == 304 and conditional:
+            return
+        fetched.add(url)
+        if response.status != 200:
+            raise RosterError('Memberships service returned {} for {}'
+                              .format(response.status, url))
+        try:
+            payload = json.loads(content.decode('utf-8'))
+        except ValueError:
+            raise RosterError('Memberships service sent invalid JSON')
+        yield response, payload
+        url = parse_page(payload)[1]
+
+
+def _provision(members):
+    """
+    Profiles (with users) for members, creating the missing users with a
+    bulk insert
+
+    :return: {lti user id: LTIUserProfile}
+    """
+    ids = [member['user_id'] for member in members]
+    profiles = dict((profile.lti_user_id, profile) for profile in
+                    LTIUserProfile.objects.select_related('user').filter(
+                        lti_user_id__in=ids))
+    missing = [member for member in members
+               if member['user_id'] not in profiles]
+    if not missing:
+        return profiles
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username=member['user_id'], password=make_password(None),
+                     **dict((field, member[name])
+                            for field, name in USER_FIELDS))
+                for member in missing])
+            users = dict(User.objects.filter(username__in=[
+                member['user_id'] for member in missing]).values_list(
+                    'username', 'pk'))
+            # profiles inherit from BaseLTIObject, which bulk_create can't
+            # insert: one by one, in the same transaction
+            for member in missing:
+                LTIUserProfile.objects.create(
+                    lti_user_id=member['user_id'],
+                    user_id=users[member['user_id']], **dict(
+                        (field, member[name])
+                        for field, name in PROFILE_FIELDS))
+    except IntegrityError:
+        # some of them launched in the meantime, or have a local account's
+        # username: one by one, like a launch
+        from .auth_backend import DjangoLTIAuthBackend
+        backend = DjangoLTIAuthBackend()
+        for member in missing:
+            backend.provision(dict(
+                ((param, member[name]) for param, name in PROFILE_FIELDS),
+                user_id=member['user_id']))
+    profiles.update((profile.lti_user_id, profile) for profile in
+                    LTIUserProfile.objects.select_related('user').filter(
+                        lti_user_id__in=[member['user_id']
+                                         for member in missing]))
+    return profiles
+
+
+def _save_changed(instance, values):
+    changed = [field for field, value in values.items()
+               if getattr(instance, field) != value]
+    for field in changed:
+        setattr(instance, field, values[field])
+    if changed:
+        instance.save(update_fields=changed)
+
+
+def sync_chunk(context, members, stats, now=None):
+    """
+    Upsert the users, profiles and memberships of a chunk of members,
+    skipping the ones whose digest has not changed; every membership of the
+    chunk gets ``now`` as its sync time
+    """
+    now = now or timezone.now()
+    digests = dict((member['user_id'], digest(member)) for member in members)
+    current = dict((user_id, (pk, member_digest))
+                   for pk, user_id, member_digest in
+                   LTIMembership.objects.filter(
+                       context=context,
+                       profile__lti_user_id__in=list(digests)).values_list(
+                           'pk', 'profile__lti_user_id', 'digest'))
+    changed, unchanged = [], []
+    for member in members:
+        pk, member_digest = current.get(member['user_id'], (None, None))
+        if member_digest == digests[member['user_id']]:
+            unchanged.append(pk)
+        else:
+            changed.append(member)
+    stats['unchanged'] += len(unchanged)
+    if unchanged:
+        # still listed: not removed at the end of the sync
+        LTIMembership.objects.filter(pk__in=unchanged).update(synced_at=now)
+    if not changed:
+        return
+
+    profiles = _provision(changed)
+    new = []
+    for member in changed:
+        profile = profiles[member['user_id']]
+        # no queries for rows that were just inserted with these values
+        _save_changed(profile.user, dict(
+            (field, member[name]) for field, name in USER_FIELDS))
+        _save_changed(profile, dict(
+            (field, member[name]) for field, name in PROFILE_FIELDS))
+        if member['user_id'] in current:
+            LTIMembership.objects.filter(
+                context=context, profile=profile).update(
+                    roles=member['roles'], status=member['status'],
+                    digest=digests[member['user_id']], synced_at=now)
+            stats['updated'] += 1
+        else:
+            new.append(LTIMembership(
+                context=context, profile=profile, roles=member['roles'],
+                status=member['status'], digest=digests[member['user_id']],
+                synced_at=now))
+    if not new:
+        return
+    try:
+        with transaction.atomic():
+            LTIMembership.objects.bulk_create(new)
+        stats['created'] += len(new)
+    except IntegrityError:
+        # another sync of the context inserted some of them meanwhile: one
+        # by one
+        for membership in new:
+            membership, created = LTIMembership.objects.update_or_create(
+                context=context, profile=membership.profile, defaults={
+                    'roles': membership.roles, 'status': membership.status,
+                    'digest': membership.digest, 'synced_at': now})
+            stats['created' if created else 'updated'] += 1
+
+
+def sync_roster(context, url=None, full=False, chunk_size=None):
+    """
+    Sync a context's members from its memberships service
+
+    :param: context: LTIContext, with a consumer
+    :param: url: memberships service URL (default: the one the last launch
+        into the context sent)
+    :param: full: ignore the stored ETag and member digests
+    :param: chunk_size: members upserted per round of bulk queries
+        (default PYLTI_CONFIG['roster_chunk_size'] or 500)
+    :return: dict with pages, members, created, updated, unchanged, removed
+        and not_modified
+    :raises: RosterError
+    """
+    url = url or context.memberships_url
+    if not url:
+        raise RosterError('No memberships service for context {}'.format(
+            context.context_id))
+    key = u'{}'.format(context.consumer_id)
+    consumers = consumer_store.get(key)
+    if not consumers:
+        raise RosterError('Unknown consumer {}'.format(key))
+    chunk_size = chunk_size or pylti_config().get('roster_chunk_size', 500)
+    if full:
+        LTIMembership.objects.filter(context=context).update(digest='')
+
+    stats = {'pages': 0, 'members': 0, 'created': 0, 'updated': 0,
+             'unchanged': 0, 'removed': 0, 'not_modified': False}
+    sync_start = timezone.now()
+    seen = set()
+    etag = ''
+    for response, payload in fetch_pages(
+            url, key, consumers[key]['secret'],
+            etag=None if full else context.roster_etag):
+        if not stats['pages']:
+            etag = response.get('etag', '')
+        stats['pages'] += 1
+        members = [member for member in parse_page(payload)[0]
+                   if member['user_id'] and member['user_id'] not in seen]
+        seen.update(member['user_id'] for member in members)
+        stats['members'] += len(members)
+        for start in range(0, len(members), chunk_size):
+            sync_chunk(context, members[start:start + chunk_size], stats,
+                       now=sync_start)
+
+    if not stats['pages']:
+        stats['not_modified'] = True
+        return stats
+
+    # members the service no longer lists were not synced this time
+    stats['removed'] = LTIMembership.objects.filter(
+        context=context, synced_at__lt=sync_start).exclude(
+            status=LTIMembership.DELETED).update(
+                status=LTIMembership.DELETED, digest='',
+                synced_at=timezone.now())
+    context.memberships_url = url
+    # the ETag of the first page only stands for a single-page roster
+    context.roster_etag = etag if stats['pages'] == 1 else ''
+    context.roster_synced_at = timezone.now()
+    context.save(update_fields=['memberships_url', 'roster_etag',
+                                'roster_synced_at'])
+    return stats
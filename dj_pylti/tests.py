@@ -6,9 +6,9 @@ from django.test import TestCase, Client
 from django.conf import settings
 #from django.urls import reverse
 from django.core.urlresolvers import reverse
+from django.utils import six
+from django.utils.six.moves.urllib.parse import parse_qs, urlencode
 
-import urllib
-import urlparse
 import logging
 log = logging.getLogger(__name__)
 
@@ -19,7 +19,8 @@ from oauthlib.oauth1.rfc5849 import SIGNATURE_TYPE_BODY
 from pylti.common import LTIException
 from .auth_backend import LTI
 from .models import LTIResource, LTIConsumer
-from .models import LTIContext
+from .models import LTIContext, LTIUserProfile
+from .claims import get_claims
 
 """
 Setting up app test settings.
@@ -36,6 +37,58 @@ def abs_reverse(path, *args, **kwargs):
 
 #SERVER_NAME = 'testserver'
 SERVER_NAME = 'testserver'
+
+def generate_launch_request(consumer, url,
+                            lis_outcome_service_url=None,
+                            roles=u'Instructor',
+                            add_params=None):
+    """
+    Generate valid basic-lti-launch-request request with options.
+    :param consumer: LTIConsumer signing the request
+    :param url: URL to sign
+    :param lit_outcome_service_url: LTI callback
+    :param roles: LTI role
+    :return: signed request
+    """
+    # pylint: disable=unused-argument, too-many-arguments
+    params = {'resource_link_id': u'edge.edx.org-i4x-MITx-ODL_ENG-lti-'
+                                  u'94173d3e79d145fd8ec2e83f15836ac8',
+              'user_id': u'008437924c9852377e8994829aaac7a1',
+              'lis_result_sourcedid': u'MITx/ODL_ENG/2014_T1:'
+                                      u'edge.edx.org-i4x-MITx-ODL_ENG-lti-'
+                                      u'94173d3e79d145fd8ec2e83f15836ac8:'
+                                      u'008437924c9852377e8994829aaac7a1',
+              'context_id': u'MITx/ODL_ENG/2014_T1',
+              'lti_version': u'LTI-1p0',
+              'launch_presentation_return_url': u'emptyhere',
+              'lis_outcome_service_url': (lis_outcome_service_url or
+                                          u'https://example.edu/'
+                                          u'courses/MITx/ODL_ENG/'
+                                          u'2014_T1/xblock/i4x:;_;'
+                                          u'_MITx;_ODL_ENG;_lti;'
+                                          u'_94173d3e79d145fd8ec2e'
+                                          u'83f15836ac8'
+                                          u'/handler_noauth/'
+                                          u'grade_handler'),
+              'lti_message_type': u'basic-lti-launch-request'}
+
+    if roles is not None:
+        params['roles'] = roles
+
+    if add_params is not None:
+        params.update(add_params)
+
+    urlparams = urlencode(params)
+
+    client = oauthlib.oauth1.Client(consumer.key,
+                                    client_secret=six.text_type(consumer.secret),
+                                    signature_method=oauthlib.oauth1.SIGNATURE_HMAC,
+                                    signature_type=SIGNATURE_TYPE_BODY)
+    headers = {'Content-Type':u'application/x-www-form-urlencoded'}
+    uri, headers, body = client.sign(url, http_method='POST', body=params, headers=headers)
+    body = parse_qs(body)
+    return uri, body
+
 @override_settings(
     DEBUG = True,
     SERVER_NAME = SERVER_NAME,
@@ -48,56 +101,12 @@ SERVER_NAME = 'testserver'
 )
 class BaseLTITestClass(TestCase):
 
-    def generate_launch_request(self, url,
-                                lis_outcome_service_url=None,
-                                roles=u'Instructor',
-                                add_params=None):
+    def generate_launch_request(self, url, **kwargs):
         """
-        Generate valid basic-lti-launch-request request with options.
-        :param consumers: consumer map
-        :param url: URL to sign
-        :param lit_outcome_service_url: LTI callback
-        :param roles: LTI role
-        :return: signed request
+        Generate valid basic-lti-launch-request request signed by
+        self.consumer, see generate_launch_request
         """
-        # pylint: disable=unused-argument, too-many-arguments
-        params = {'resource_link_id': u'edge.edx.org-i4x-MITx-ODL_ENG-lti-'
-                                      u'94173d3e79d145fd8ec2e83f15836ac8',
-                  'user_id': u'008437924c9852377e8994829aaac7a1',
-                  'lis_result_sourcedid': u'MITx/ODL_ENG/2014_T1:'
-                                          u'edge.edx.org-i4x-MITx-ODL_ENG-lti-'
-                                          u'94173d3e79d145fd8ec2e83f15836ac8:'
-                                          u'008437924c9852377e8994829aaac7a1',
-                  'context_id': u'MITx/ODL_ENG/2014_T1',
-                  'lti_version': u'LTI-1p0',
-                  'launch_presentation_return_url': u'emptyhere',
-                  'lis_outcome_service_url': (lis_outcome_service_url or
-                                              u'https://example.edu/'
-                                              u'courses/MITx/ODL_ENG/'
-                                              u'2014_T1/xblock/i4x:;_;'
-                                              u'_MITx;_ODL_ENG;_lti;'
-                                              u'_94173d3e79d145fd8ec2e'
-                                              u'83f15836ac8'
-                                              u'/handler_noauth/'
-                                              u'grade_handler'),
-                  'lti_message_type': u'basic-lti-launch-request'}
-
-        if roles is not None:
-            params['roles'] = roles
-
-        if add_params is not None:
-            params.update(add_params)
-
-        urlparams = urllib.urlencode(params)
-
-        client = oauthlib.oauth1.Client(self.consumer.key,
-                                        client_secret=unicode(self.consumer.secret),
-                                        signature_method=oauthlib.oauth1.SIGNATURE_HMAC,
-                                        signature_type=SIGNATURE_TYPE_BODY)
-        headers = {'Content-Type':u'application/x-www-form-urlencoded'}
-        uri, headers, body = client.sign(url, http_method='POST', body=params, headers=headers)
-        body = urlparse.parse_qs(body)
-        return uri, body
+        return generate_launch_request(self.consumer, url, **kwargs)
 
 class TestDjangoPylti(BaseLTITestClass):
     """
@@ -176,10 +185,14 @@ edge.edx.org-i4x-StarX-StarX_DEMO-lti-40559041895b4065b2818c23b9cd9da8\
 
         #ret = self.app.get(new_url)
         ret = self.app.post(new_url, body)
-        assert 'custom_canvas_user_id' in self.app.session
-        assert 'lis_person_contact_email_primary' in self.app.session
-        assert 'lis_person_name_given' in self.app.session
-        assert 'lis_person_name_family' in self.app.session
+        claims = get_claims(self.app.session)
+        assert 'custom_canvas_user_id' in claims
+        # kept on the profile, not in the session
+        assert 'lis_person_contact_email_primary' not in claims
+        assert 'lis_person_name_given' not in claims
+        profile = LTIUserProfile.objects.get()
+        assert profile.lis_person_name_given == 'Gomer'
+        assert profile.lis_person_name_family == 'Pile'
         self.assertEqual(200, ret.status_code)
         lti_context = LTIContext.objects.get(context_id=context_id)
 
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Signed launch tokens for ``@lti(request='session')`` views.
+
+With ``PYLTI_CONFIG['launch_token']`` set, a successful launch issues a
+short-lived token signed with ``SECRET_KEY`` (``django.core.signing``)
+that carries who launched and from where: the user, roles, context,
+resource and outcome binding. The token is set as a cookie and is
+available as ``lti.token`` so that pages can send it back in the
+``X-LTI-Token`` header, e.g. from scripts in an iframe where third-party
+cookies are blocked.
+
+Session-type views accept a valid token instead of the Django session, and
+verify it without touching the database, the cache or the session store.
+"""
+from __future__ import unicode_literals
+
+from django.core import signing
+
+from .cache import pylti_config
+
+SALT = 'dj_pylti.launch_token'
+HEADER = 'HTTP_X_LTI_TOKEN'
+
+# claim name -> key in the token
+TOKEN_FIELDS = (
+    ('oauth_consumer_key', 'k'),
+    ('user_id', 'i'),
+    ('roles', 'r'),
+    ('context_id', 'c'),
+    ('resource_link_id', 'l'),
+    ('lis_result_sourcedid', 's'),
+    ('lis_outcome_service_url', 'o'),
+)
+
+
+def tokens_enabled():
+    return bool(pylti_config().get('launch_token'))
+
+
+def token_max_age():
+    return pylti_config().get('launch_token_max_age', 60 * 60)
+
+
+def token_cookie_name():
+    return pylti_config().get('launch_token_cookie', 'dj_pylti_token')
+
+
+def make_token(claims, user_pk, name=''):
+    """
+    Sign a launch token
+
+    :param: claims: launch claims, see dj_pylti.claims
+    :param: user_pk: primary key of the authenticated user
+    :param: name: display name, see LTI.name
+    :return: URL-safe token string
+    """
+    payload = dict((short, claims[claim]) for claim, short in TOKEN_FIELDS
+                   if claims.get(claim))
+    payload['u'] = user_pk
+    if name:
+        payload['n'] = name
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def read_token(token):
+    """
+    Verify a launch token
+
+    :return: (claims, user_pk, name), or None if the token is invalid or
+        expired
+    """
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=token_max_age())
+    except signing.BadSignature:
+        return None
+    claims = dict((claim, payload[short]) for claim, short in TOKEN_FIELDS
+                  if short in payload)
+    return claims, payload.get('u'), payload.get('n', '')
+
+
+def request_token(request):
+    """
+    The token sent with ``request``, from the header or the cookie
+    """
+    return (request.META.get(HEADER) or
+            request.COOKIES.get(token_cookie_name()))
+
+
+def set_token_cookie(response, token, secure=False):
+    response.set_cookie(token_cookie_name(), token, max_age=token_max_age(),
+                        secure=secure, httponly=True)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled, keep-alive HTTP transport for signed outcome service calls.
+
+pylti's ``post_message`` builds a new ``oauth2.Client`` (and with it a new
+TCP/TLS connection) for every grade. ``OutcomeTransport`` keeps a small pool
+of ``httplib2.Http`` objects per host instead; each one holds its
+connection open between requests, so a burst of grade posts to the same LMS
+pays for the handshake once per pooled connection.
+
+Pool size and socket timeout come from ``PYLTI_CONFIG``
+(``outcome_pool_size``, ``outcome_timeout``).
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.six.moves import queue
+from django.utils.six.moves.urllib.parse import urlparse, urlunparse
+
+import httplib2
+import oauth2
+
+from .cache import pylti_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class OutcomeHttp(httplib2.Http):
+    """
+    ``httplib2.Http`` that sends the ``Authorization`` header capitalized;
+    some LTI consumers reject the lower-case form httplib2 produces.
+    """
+
+    def _normalize_headers(self, headers):
+        ret = super(OutcomeHttp, self)._normalize_headers(headers)
+        if 'authorization' in ret:
+            ret['Authorization'] = ret.pop('authorization')
+        return ret
+
+
+class OutcomeTransport(object):
+    """
+    Per-host pools of keep-alive connections used to send OAuth-signed
+    outcome requests.
+
+    ``pool_size`` bounds the idle connections kept per host; busy periods
+    may open more, and the extra ones are closed when returned.
+    """
+
+    def __init__(self, pool_size=10, timeout=30):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.signature_method = oauth2.SignatureMethod_HMAC_SHA1()
+
+    def _pool(self, pool_key):
+        with self._lock:
+            pool = self._pools.get(pool_key)
+            if pool is None:
+                pool = self._pools[pool_key] = queue.LifoQueue(self.pool_size)
+            return pool
+
+    def _acquire(self, pool_key, cert=None):
+        try:
+            return self._pool(pool_key).get_nowait()
+        except queue.Empty:
+            http = OutcomeHttp(timeout=self.timeout)
+            if cert:
+                http.add_certificate(key=cert, cert=cert, domain='')
+            return http
+
+    def _release(self, pool_key, http):
+        try:
+            self._pool(pool_key).put_nowait(http)
+        except queue.Full:
+            self._close(http)
+
+    @staticmethod
+    def _close(http):
+        for conn in list(http.connections.values()):
+            conn.close()
+        http.connections.clear()
+
+    def request(self, key, secret, url, body, method='POST',
+                content_type='application/xml', cert=None, headers=None):
+        """
+        Sign ``body`` with the consumer's key and secret (OAuth body hash)
+        and send it to ``url`` over a pooled connection
+
+        :param: headers: extra request headers
+        :return: (response, content) as returned by httplib2
+        """
+        # pylint: disable=too-many-arguments
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        extra_headers = headers
+        consumer = oauth2.Consumer(key=key, secret=secret)
+        req = oauth2.Request.from_consumer_and_token(
+            consumer, token=None, http_method=method, http_url=url,
+            body=body, is_form_encoded=False)
+        req.sign_request(self.signature_method, consumer, None)
+
+        scheme, netloc = urlparse(url)[:2]
+        headers = {'Content-Type': content_type}
+        headers.update(req.to_header(
+            realm=urlunparse((scheme, netloc, '', None, None, None))))
+        headers.update(extra_headers or {})
+
+        pool_key = (scheme, netloc, cert)
+        http = self._acquire(pool_key, cert)
+        try:
+            response, content = http.request(url, method, body=body or None,
+                                             headers=headers)
+        except Exception:
+            # don't hand a connection in an unknown state to the next caller
+            self._close(http)
+            raise
+        self._release(pool_key, http)
+        log.debug("url %s response %s", url, response)
+        return response, content
+
+    def close(self):
+        """
+        Close every pooled connection
+        """
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while True:
+                try:
+                    self._close(pool.get_nowait())
+                except queue.Empty:
+                    break
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    The process-wide OutcomeTransport, built from PYLTI_CONFIG on first use
+    """
+    global _transport  # pylint: disable=global-statement
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                config = pylti_config()
+                _transport = OutcomeTransport(
+                    pool_size=config.get('outcome_pool_size', 10),
+                    timeout=config.get('outcome_timeout', 30))
+    return _transport
+
+
+def reset_transport():
+    """
+    Close pooled connections; the next call builds a fresh transport
+    """
+    global _transport  # pylint: disable=global-statement
+    with _transport_lock:
+        transport, _transport = _transport, None
+    if transport is not None:
+        transport.close()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(sender, setting, **kwargs):
+    if setting == 'PYLTI_CONFIG':
+        reset_transport()
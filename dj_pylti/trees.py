@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Materialized-path helpers for OptionList trees.
+
+Every OptionList stores ``path``: the fixed-width base 36 ids of its
+ancestors and itself, e.g. ``00000f/00001a/``. Ordering a configuration's
+nodes by ``path`` lists every parent before its children, so a whole tree
+comes back from one query and can be rendered without further ORM calls.
+"""
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.utils.html import escape
+from django.utils.http import int_to_base36
+from django.utils.safestring import mark_safe
+
+# 6 base 36 digits cover ids up to 2,176,782,335; with the separator that
+# is 36 levels in a 255 character path
+SEGMENT_WIDTH = 6
+PATH_MAX_LENGTH = 255
+
+
+def path_segment(pk):
+    return '{}/'.format(int_to_base36(pk).zfill(SEGMENT_WIDTH))
+
+
+def render_options(nodes, properties, indent='      '):
+    """
+    Render ``<lticm:options>`` elements for a tree of OptionList nodes
+
+    :param: nodes: OptionList objects ordered by path
+    :param: properties: their OptionProperty objects, with ``option``
+        already loaded
+    :return: safe XML string
+    """
+    known = set(node.pk for node in nodes)
+    roots = []
+    children = defaultdict(list)
+    for node in nodes:
+        if node.parent_id in known:
+            children[node.parent_id].append(node)
+        else:
+            roots.append(node)
+    props = defaultdict(list)
+    for prop in properties:
+        props[prop.option_list_id].append(prop)
+
+    # explicit stack: tree depth is not bounded by the recursion limit
+    lines = []
+    stack = [(node, 0, False) for node in reversed(roots)]
+    while stack:
+        node, depth, closing = stack.pop()
+        pad = indent + '  ' * depth
+        if closing:
+            lines.append('{}</lticm:options>'.format(pad))
+            continue
+        lines.append('{}<lticm:options name="{}">'.format(pad,
+                                                          escape(node.name)))
+        for prop in props[node.pk]:
+            lines.append('{}  <lticm:property name="{}">{}</lticm:property>'
+                         .format(pad, escape(prop.option.name),
+                                 escape(prop.value)))
+        stack.append((node, depth, True))
+        stack.extend((child, depth + 1, False)
+                     for child in reversed(children[node.pk]))
+    return mark_safe('\n'.join(lines))
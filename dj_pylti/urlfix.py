@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled PYLTI_URL_FIX rewriting of outcome service URLs.
+
+``PYLTI_URL_FIX`` maps URL prefixes to ``{from: to}`` replacements, e.g. to
+send grades for an edX dev-stack through a proxy::
+
+    PYLTI_CONFIG = {
+        'PYLTI_URL_FIX': {
+            'https://localhost:8000/': {
+                'https://localhost:8000/': 'http://localhost:8000/',
+            },
+        },
+    }
+
+The rules are compiled once into a single regex over the prefixes and one
+regex per mapping. A URL is rewritten by the mapping of its longest
+matching prefix, in a single pass, so the cost does not grow with the
+number of configured hosts.
+"""
+from __future__ import unicode_literals
+
+import re
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .cache import pylti_config
+
+
+class URLRewriter(object):
+    """
+    Longest-prefix, single-pass URL rewriter
+    """
+
+    def __init__(self, rules):
+        self._mappings = {}
+        for prefix, mapping in (rules or {}).items():
+            if not mapping:
+                continue
+            sources = sorted(mapping, key=len, reverse=True)
+            pattern = re.compile('|'.join(re.escape(s) for s in sources))
+            self._mappings[prefix] = (pattern, dict(mapping))
+        # alternatives are tried in order: longest prefix first
+        prefixes = sorted(self._mappings, key=len, reverse=True)
+        self._prefix_re = (re.compile('|'.join(re.escape(p) for p in prefixes))
+                           if prefixes else None)
+
+    def rewrite(self, url):
+        if self._prefix_re is None:
+            return url
+        match = self._prefix_re.match(url)
+        if match is None:
+            return url
+        pattern, mapping = self._mappings[match.group(0)]
+        return pattern.sub(lambda found: mapping[found.group(0)], url)
+
+    __call__ = rewrite
+
+
+_rewriter = None
+_rewriter_lock = threading.Lock()
+
+
+def url_fix_rules():
+    """
+    PYLTI_CONFIG['PYLTI_URL_FIX'], falling back to a top level
+    PYLTI_URL_FIX setting
+    """
+    rules = pylti_config().get('PYLTI_URL_FIX')
+    if rules is None:
+        rules = getattr(settings, 'PYLTI_URL_FIX', None)
+    return rules or {}
+
+
+def reload_url_fix():
+    """
+    Compile the current settings; called at startup and whenever the
+    settings change in tests
+    """
+    global _rewriter  # pylint: disable=global-statement
+    with _rewriter_lock:
+        _rewriter = URLRewriter(url_fix_rules())
+    return _rewriter
+
+
+def fix_url(url):
+    """
+    Rewrite ``url`` with the compiled PYLTI_URL_FIX rules
+    """
+    rewriter = _rewriter or reload_url_fix()
+    return rewriter.rewrite(url)
+
+
+@receiver(setting_changed)
+def _reload_on_setting_changed(sender, setting, **kwargs):
+    if setting in ('PYLTI_CONFIG', 'PYLTI_URL_FIX'):
+        reload_url_fix()
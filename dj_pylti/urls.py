@@ -1,8 +1,10 @@
 from django.conf.urls import url
 from django.views.generic.base import TemplateView
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 
 from . import views 
+from .export import export_view
+from .metrics import metrics_view
 
 urlpatterns = [ 
     url(r'^any/', views.any, name='any'),
@@ -14,7 +16,11 @@ urlpatterns = [
     url(r'^post_grade/([\d.]+)/', views.post_grade, name='post_grade'),
     url(r'^post_grade2/([\d.]+)/', views.post_grade2, name='post_grade2'),
     url(r'^unknown_protection/', views.unknown_protection, name='unknown_protection'),
+    url(r'^metrics$', metrics_view, name='metrics'),
+    url(r'^export/(?P<name>profiles|contexts|resources)$', export_view,
+        name='lti_export'),
     #url(r'^default_lti/', views.default_lti, name='default_lti'),
     # Add config URL
-    url(r'^config/(?P<pk>[\d]+)', cache_page(60*15)(views.ConfigurationView.as_view()), name='lti_config'),
+    url(r'^config/(?P<pk>[\d]+)', condition(etag_func=views.config_etag,
+        last_modified_func=views.config_last_modified)(views.ConfigurationView.as_view()), name='lti_config'),
 ]
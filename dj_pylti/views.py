@@ -2,7 +2,8 @@ from django.shortcuts import render
 from django.http import HttpResponse
 
 from pylti.common import LTI_SESSION_KEY
-from auth_backend import lti
+from .auth_backend import lti
+from .claims import store_claims
 # Create your views here.
 from django.views.decorators.csrf import csrf_exempt
 
@@ -52,8 +53,8 @@ def setup_session(request, *args, **kwargs):
     :return: string "session set"
     """
     request.session[LTI_SESSION_KEY] = True
-    request.session['oauth_consumer_key'] = '__consumer_key__'
-    request.session['roles'] = 'Student'
+    store_claims(request.session, {'oauth_consumer_key': '__consumer_key__',
+                                   'roles': 'Student'})
     return HttpResponse('session set', status=200)
 
 
@@ -159,9 +160,42 @@ def unknown_protection(request, *args, **kwargs):
     """
     return HttpResponse('hi', status=200)
 
+import hashlib
+from datetime import datetime
+
+from django.utils import timezone
 from django.views.generic.detail import DetailView
-from .models import Configuration
+from .cache import pylti_config, shared_cache
+from .models import Configuration, config_version
+
+def config_cache_key(request, pk):
+  """Cache key of a rendered cartridge; changes with the config version"""
+  version, _ = config_version()
+  return 'dj_pylti:config:{}:{}:{}'.format(version, pk,
+      hashlib.md5(request.get_host().encode('utf-8')).hexdigest())
+
+def config_etag(request, pk, *args, **kwargs):
+  return hashlib.md5(config_cache_key(request, pk).encode('utf-8')).hexdigest()
+
+def config_last_modified(request, *args, **kwargs):
+  _, timestamp = config_version()
+  return datetime.fromtimestamp(timestamp, timezone.utc)
+
 class ConfigurationView(DetailView):
+  """Tool configuration cartridge
+
+  The option tree is loaded in one query (see Configuration.options_xml)
+  and the rendered XML is cached until any configuration object changes."""
   model = Configuration
   template_name = 'config.xml'
   content_type='application/xml'
+
+  def get(self, request, *args, **kwargs):
+    key = config_cache_key(request, kwargs['pk'])
+    content = shared_cache().get(key)
+    if content is None:
+      response = super(ConfigurationView, self).get(request, *args, **kwargs)
+      content = response.render().content
+      shared_cache().set(key, content,
+          pylti_config().get('config_cache_timeout', 24 * 60 * 60))
+    return HttpResponse(content, content_type=self.content_type)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8
 from __future__ import unicode_literals, absolute_import
 
+import os
+
 import django
 
 DEBUG = True
@@ -16,11 +18,33 @@ DATABASES = {
     }
 }
 
+# The concurrency tests need a database that takes concurrent writes, e.g.
+# TEST_DB_ENGINE=postgresql TEST_DB_NAME=dj_pylti python runtests.py
+# (or tox -e py27-django-110-postgres / py27-django-110-mysql)
+if os.environ.get("TEST_DB_ENGINE"):
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends." + os.environ["TEST_DB_ENGINE"],
+        "NAME": os.environ.get("TEST_DB_NAME", "dj_pylti"),
+        "USER": os.environ.get("TEST_DB_USER", ""),
+        "PASSWORD": os.environ.get("TEST_DB_PASSWORD", ""),
+        "HOST": os.environ.get("TEST_DB_HOST", ""),
+        "PORT": os.environ.get("TEST_DB_PORT", ""),
+    }
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
 ROOT_URLCONF = "tests.urls"
 
 INSTALLED_APPS = [
+    "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
+    "django.contrib.messages",
+    "django.contrib.sessions",
     "django.contrib.sites",
     "dj_pylti",
 ]
@@ -28,6 +52,41 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 if django.VERSION >= (1, 10):
-    MIDDLEWARE = ()
+    MIDDLEWARE = (
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+    )
 else:
-    MIDDLEWARE_CLASSES = ()
+    MIDDLEWARE_CLASSES = (
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+    )
+
+AUTHENTICATION_BACKENDS = (
+    "dj_pylti.auth_backend.DjangoLTIAuthBackend",
+    "django.contrib.auth.backends.ModelBackend",
+)
+
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.contrib.auth.context_processors.auth",
+                "django.contrib.messages.context_processors.messages",
+            ],
+        },
+    },
+]
+
+CUST_HOSTNAME = "testserver"
+
+PYLTI_CONFIG = {
+    "lti_properties": [
+        "custom_canvas_user_id",
+        "custom_canvas_user_login_id",
+    ],
+}
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_admin
+------------
+
+Tests for `dj-pylti` admin.
+"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from dj_pylti.models import (Configuration, LTIUserProfile, OptionList,
+                             OptionProperty, PropertyName)
+from dj_pylti.pagination import EstimatedCountPaginator
+
+
+class TestAdmin(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'a@example.com', 'pw')
+        self.client.force_login(
+            admin, backend='django.contrib.auth.backends.ModelBackend')
+        self.config = Configuration.objects.create(launch_url='/launch')
+        self.name = PropertyName.objects.create(name='url')
+
+    def add_profiles(self, count):
+        for i in range(len(LTIUserProfile.objects.all()), count):
+            user = User.objects.create(username='user{}'.format(i))
+            LTIUserProfile.objects.create(user=user,
+                                          lti_user_id='lti{}'.format(i))
+
+    def add_options(self, count):
+        for i in range(OptionList.objects.count(), count):
+            option = OptionList.objects.create(name='labels',
+                                               config=self.config)
+            OptionProperty.objects.create(option=self.name, value=str(i),
+                                          option_list=option)
+
+    def assertFlat(self, url, grow):
+        # the number of queries must not depend on the number of rows
+        grow(2)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        grow(20)
+        with self.assertNumQueries(len(small)):
+            self.client.get(url)
+
+    def test_profile_changelist(self):
+        self.assertFlat(reverse('admin:dj_pylti_ltiuserprofile_changelist'),
+                        self.add_profiles)
+
+    def test_profile_search_is_exact(self):
+        self.add_profiles(3)
+        url = reverse('admin:dj_pylti_ltiuserprofile_changelist')
+        response = self.client.get(url, {'q': 'lti1'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [LTIUserProfile.objects.get(lti_user_id='lti1')])
+        response = self.client.get(url, {'q': 'lti'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_optionlist_changelist(self):
+        url = reverse('admin:dj_pylti_optionlist_changelist')
+        self.assertFlat(url, self.add_options)
+        self.assertContains(self.client.get(url),
+                            '<td class="field-num_properties">1</td>',
+                            count=20)
+
+    def test_paginator_falls_back_to_count(self):
+        self.add_profiles(3)
+        paginator = EstimatedCountPaginator(LTIUserProfile.objects.all(), 2)
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(EstimatedCountPaginator([1, 2], 1).count, 2)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_async
+------------
+
+Tests for `dj-pylti` async views and awaitable grade passback.
+"""
+
+from unittest import skipIf
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+import httpretty
+
+from dj_pylti import aio, views
+from dj_pylti.auth_backend import lti
+from dj_pylti.claims import store_claims
+from dj_pylti.models import LTI, LTIConsumer, consumer_store
+
+OUTCOME_URL = 'https://lms.example.edu/grade_handler'
+SUCCESS = b'<imsx_codeMajor>success</imsx_codeMajor>'
+
+
+def async_view(render):
+    """
+    A coroutine-function view answering ``render(lti)``, written without
+    ``async def`` so this module still parses on Python 2
+    """
+    def view(request, lti=None):
+        future = aio.asyncio.get_event_loop().create_future()
+        future.set_result(HttpResponse(render(lti)))
+        return future
+    return aio.mark_coroutine_function(view)
+
+
+@skipIf(aio.asyncio is None, 'async views need Python 3.5+')
+class TestAsyncViews(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.loop = aio.asyncio.new_event_loop()
+        aio.asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+
+    def request(self, user=None, **claims):
+        request = RequestFactory().get('/')
+        request.session = {}
+        request.user = user or User(username='gomer')
+        store_claims(request.session, dict({'roles': 'Learner'}, **claims))
+        return request
+
+    def run_view(self, view, request):
+        return self.loop.run_until_complete(view(request))
+
+    def test_async_view_is_wrapped_as_coroutine_function(self):
+        view = lti(request='session')(async_view(lambda lti: 'ok'))
+        self.assertTrue(aio.is_async_view(view))
+        self.assertFalse(aio.is_async_view(views.initial))
+
+    def test_async_view_gets_lti(self):
+        view = lti(request='session')(async_view(lambda lti: lti.role))
+        response = self.run_view(view, self.request())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'Learner')
+
+    def test_wrong_role_is_an_error(self):
+        view = lti(request='session', role='staff')(
+            async_view(lambda lti: 'ok'))
+        response = self.run_view(view, self.request())
+        self.assertEqual(response.status_code, 500)
+
+    def test_no_session_is_an_error(self):
+        view = lti(request='session')(async_view(lambda lti: 'ok'))
+        response = self.run_view(view, self.request(user=AnonymousUser()))
+        self.assertEqual(response.status_code, 500)
+
+
+class TestWithoutAsyncio(TestCase):
+    """
+    Python 2 and 3.4, where every view is wrapped as a plain function
+    """
+
+    def setUp(self):
+        cache.clear()
+        asyncio, aio.asyncio = aio.asyncio, None
+        self.addCleanup(setattr, aio, 'asyncio', asyncio)
+
+    def test_views_are_sync(self):
+        def view(request, lti=None):
+            return HttpResponse(lti.role)
+        wrapped = lti(request='session')(view)
+        self.assertFalse(aio.is_async_view(view))
+        self.assertFalse(aio.is_async_view(wrapped))
+        request = RequestFactory().get('/')
+        request.session = {}
+        request.user = User(username='gomer')
+        store_claims(request.session, {'roles': 'Learner'})
+        self.assertEqual(wrapped(request).content, b'Learner')
+
+
+@skipIf(aio.asyncio is None, 'async views need Python 3.5+')
+class TestAsyncPassback(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+        # load the consumer here: worker threads have their own connection
+        consumer_store.get(self.consumer.key)
+        self.loop = aio.asyncio.new_event_loop()
+        aio.asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+
+    def lti(self):
+        request = RequestFactory().get('/')
+        request.session = {}
+        store_claims(request.session, {
+            'oauth_consumer_key': self.consumer.key,
+            'lis_result_sourcedid': 'abc',
+            'lis_outcome_service_url': OUTCOME_URL,
+            'user_id': 'gomer'})
+        return LTI((), {}, request)
+
+    @httpretty.activate
+    def test_apost_grade(self):
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, body=SUCCESS)
+        grades = aio.asyncio.gather(*[self.lti().apost_grade(0.5)
+                                      for _ in range(5)])
+        self.assertEqual(self.loop.run_until_complete(grades), [True] * 5)
+
+    @httpretty.activate
+    def test_apost_grade2(self):
+        httpretty.register_uri(
+            httpretty.PUT, 'https://lms.example.edu/lti_2_0_result_rest_'
+            'handler/user/gomer', body='')
+        self.assertTrue(self.loop.run_until_complete(
+            self.lti().apost_grade2(0.5)))
+
+    def test_invalid_grade(self):
+        self.assertFalse(self.loop.run_until_complete(
+            self.lti().apost_grade(2)))
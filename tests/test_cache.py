@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+------------
+
+Tests for `dj-pylti` cache module and the consumer store.
+"""
+
+from django.contrib.auth import logout
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+
+from dj_pylti.cache import LRUCache, TieredCache
+from django.contrib.auth.models import User
+
+from dj_pylti.auth_backend import DjangoLTIAuthBackend
+from dj_pylti.models import (LTIConsumer, LTIUserProfile, consumer_store,
+                             user_store)
+
+from .test_launch import LaunchTestCase
+
+
+class TestLRUCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(len(lru), 2)
+
+    def test_expired_entries_are_misses(self):
+        lru = LRUCache(maxsize=2, ttl=-1)
+        lru.set('a', 1)
+        self.assertNotIn('a', lru)
+
+
+class TestTieredCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.loads = []
+
+        def loader(key):
+            self.loads.append(key)
+            return {'value': key} if key != 'missing' else None
+        self.store = TieredCache('test', loader)
+
+    def test_tiers(self):
+        self.assertEqual(self.store.get('k'), {'value': 'k'})
+        self.store.get('k')
+        self.store.clear_local()
+        self.store.get('k')
+        self.assertEqual(self.loads, ['k'])
+        self.assertEqual(self.store.stats(),
+                         {'local_hits': 1, 'shared_hits': 1, 'misses': 1})
+
+    def test_not_found_is_not_cached(self):
+        self.assertIsNone(self.store.get('missing'))
+        self.assertIsNone(self.store.get('missing'))
+        self.assertEqual(self.loads, ['missing', 'missing'])
+
+
+class TestConsumerStore(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+
+    def test_cached_lookup_skips_database(self):
+        expected = self.consumer.for_pylti()
+        self.assertEqual(consumer_store.get(self.consumer.key), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(consumer_store.get(self.consumer.key), expected)
+
+    def test_signals_invalidate(self):
+        key = self.consumer.key
+        consumer_store.get(key)
+        self.consumer.delete()
+        self.assertIsNone(consumer_store.get(key))
+
+
+class TestUserStore(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_store.clear_local()
+        self.backend = DjangoLTIAuthBackend()
+        self.user = User.objects.create(username='gomer')
+        self.profile = LTIUserProfile.objects.create(
+            user=self.user, lti_user_id='gomer',
+            lis_person_name_given='Gomer')
+
+    def test_cached_lookup_carries_profile(self):
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+            self.assertEqual(user, self.user)
+            self.assertEqual(user.lti_profile, self.profile)
+            self.assertEqual(user.lti_profile.lis_person_name_given, 'Gomer')
+
+    def test_every_call_gets_its_own_copy(self):
+        first = self.backend.get_user(self.user.pk)
+        first.first_name = 'changed'
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, '')
+
+    def test_user_without_profile(self):
+        other = User.objects.create(username='admin')
+        self.assertIsNone(self.backend.get_user(other.pk).lti_profile)
+
+    def test_unknown_user(self):
+        self.assertIsNone(self.backend.get_user(12345))
+        self.assertIsNone(self.backend.get_user('x'))
+
+    def test_user_save_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.backend.get_user(self.user.pk).is_active)
+
+    def test_user_delete_invalidates(self):
+        pk = self.user.pk
+        self.backend.get_user(pk)
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(pk))
+
+    def test_password_change_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertTrue(self.backend.get_user(self.user.pk).check_password(
+            'changed'))
+
+    def test_logout_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.user = self.user
+        logout(request)
+        self.assertFalse(self.backend.get_user(self.user.pk).is_active)
+
+    def test_profile_save_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        self.profile.lis_person_name_given = 'Vince'
+        self.profile.save()
+        self.assertEqual(self.backend.get_user(
+            self.user.pk).lti_profile.lis_person_name_given, 'Vince')
+
+
+class TestSessionRequests(LaunchTestCase):
+
+    def test_user_is_not_queried_after_the_first_request(self):
+        self.launch()
+        self.app.get('/lti/any/')
+        # only the session is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.app.get('/lti/any/').status_code, 200)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_claims
+------------
+
+Tests for `dj-pylti` session claims.
+"""
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TestCase
+
+from dj_pylti.claims import (SESSION_KEY, claims_from_params, clear_claims,
+                             get_claims, store_claims)
+
+
+class TestClaims(TestCase):
+
+    def test_from_params(self):
+        self.assertEqual(claims_from_params({
+            'user_id': 'u', 'roles': '', 'oauth_nonce': 'n',
+            'custom_canvas_user_id': '599', 'not_a_claim': 'x'}),
+            {'user_id': 'u', 'custom_canvas_user_id': '599'})
+
+    def test_store_only_when_changed(self):
+        session = SessionStore()
+        self.assertTrue(store_claims(session, {'roles': 'Learner'}))
+        session.save()
+        session = SessionStore(session.session_key)
+        self.assertFalse(store_claims(session, {'roles': 'Learner'}))
+        self.assertFalse(session.modified)
+        self.assertTrue(store_claims(session, {'roles': 'Instructor'}))
+        self.assertEqual(get_claims(session), {'roles': 'Instructor'})
+
+    def test_only_session_claims_are_stored(self):
+        session = {}
+        store_claims(session, {'user_id': 'u', 'roles': 'Learner',
+                               'lis_person_name_full': 'Gomer Pile',
+                               'context_label': 'Greek',
+                               'custom_canvas_user_id': '599'})
+        self.assertEqual(get_claims(session), {
+            'user_id': 'u', 'roles': 'Learner',
+            'custom_canvas_user_id': '599'})
+
+    def test_legacy_session(self):
+        session = {'roles': 'Learner', 'user_id': 'u', 'other': 1}
+        self.assertEqual(get_claims(session),
+                         {'roles': 'Learner', 'user_id': 'u'})
+        store_claims(session, get_claims(session))
+        self.assertEqual(sorted(session), sorted(['other', SESSION_KEY]))
+        clear_claims(session)
+        self.assertEqual(session, {'other': 1})
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_export
+------------
+
+Tests for `dj-pylti` streaming CSV and JSONL exports.
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import six
+from django.utils.six import StringIO
+
+from dj_pylti.export import ExportError, export_lines
+from dj_pylti.models import (LTIConsumer, LTIContext, LTIMembership,
+                             LTIResource, LTIUserProfile)
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+        self.other = LTIConsumer.objects.create(name='other')
+        self.context = LTIContext.objects.create(
+            consumer=self.consumer, context_id='ctx',
+            context_label=u'Reading Ancient Gr\xe6k')
+        LTIContext.objects.create(consumer=self.other, context_id='elsewhere')
+        for index in range(5):
+            user = User.objects.create(username='user{}'.format(index))
+            profile = LTIUserProfile.objects.create(
+                lti_user_id='user{}'.format(index), user=user,
+                lis_person_name_given=u'G\xf3mer',
+                custom_attributes={'index': index})
+            if index % 2 == 0:
+                LTIMembership.objects.create(context=self.context,
+                                             profile=profile)
+        LTIResource.objects.create(consumer=self.consumer,
+                                   resource_link_id='week1')
+
+    def export(self, name, output_format='csv', **kwargs):
+        return ''.join(export_lines(name, output_format, **kwargs))
+
+    def csv_rows(self, text):
+        if six.PY2:
+            text = text.encode('utf-8')
+            return [[value.decode('utf-8') for value in row]
+                    for row in csv.reader(io.BytesIO(text))]
+        return list(csv.reader(io.StringIO(text)))
+
+
+class TestExportLines(ExportTestCase):
+
+    def test_csv(self):
+        rows = self.csv_rows(self.export('profiles'))
+        self.assertEqual(rows[0][:2], ['id', 'lti_user_id'])
+        self.assertEqual([row[1] for row in rows[1:]],
+                         ['user{}'.format(index) for index in range(5)])
+        self.assertEqual(rows[1][4], u'G\xf3mer')
+        self.assertEqual(json.loads(rows[2][-1]), {'index': 1})
+
+    def test_jsonl(self):
+        lines = self.export('contexts', 'jsonl').splitlines()
+        self.assertEqual(len(lines), 2)
+        row = json.loads(lines[0])
+        self.assertEqual(row['context_label'], u'Reading Ancient Gr\xe6k')
+        self.assertEqual(row['custom_attributes'], {})
+        self.assertIsNone(row['roster_synced_at'])
+
+    def test_filters(self):
+        lines = self.export('profiles', 'jsonl', context='ctx').splitlines()
+        self.assertEqual([json.loads(line)['lti_user_id'] for line in lines],
+                         ['user0', 'user2', 'user4'])
+        self.assertEqual(self.export('profiles', 'jsonl',
+                                     consumer=self.other.key), '')
+        lines = self.export('contexts', 'jsonl',
+                            consumer=self.other.key).splitlines()
+        self.assertEqual(json.loads(lines[0])['context_id'], 'elsewhere')
+
+    def test_chunks(self):
+        # one query per chunk, each starting after the previous one's last
+        # key; the last chunk is short
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(export_lines('profiles', 'jsonl', chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+
+    def test_unsupported(self):
+        with self.assertRaises(ExportError):
+            export_lines('resources', context='ctx')
+        with self.assertRaises(ExportError):
+            export_lines('users')
+        with self.assertRaises(ExportError):
+            export_lines('profiles', 'xml')
+        for name in ('profiles', 'contexts', 'resources'):
+            with self.assertRaises(ExportError):
+                export_lines(name, consumer='consumer')
+
+
+class TestExportCommand(ExportTestCase):
+
+    def test_stdout(self):
+        out = StringIO()
+        call_command('lti_export', 'resources', stdout=out)
+        rows = self.csv_rows(out.getvalue())
+        self.assertEqual(rows[1][1:4], [self.consumer.key, 'week1', ''])
+
+    def test_output_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'profiles.jsonl')
+        call_command('lti_export', 'profiles', '--format', 'jsonl',
+                     '--chunk-size', '2', '--output', path)
+        with io.open(path, encoding='utf-8') as output:
+            self.assertEqual(len(output.readlines()), 5)
+
+    def test_error(self):
+        with self.assertRaises(CommandError):
+            call_command('lti_export', 'resources', context='ctx')
+        with self.assertRaises(CommandError):
+            call_command('lti_export', 'contexts', consumer='x')
+
+
+class TestExportView(ExportTestCase):
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/export/profiles').status_code,
+                         403)
+        User.objects.create_user('teacher', password='pw')
+        self.client.login(username='teacher', password='pw')
+        self.assertEqual(self.client.get('/export/profiles').status_code,
+                         403)
+
+    def test_download(self):
+        User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.login(username='admin', password='pw')
+        response = self.client.get('/export/profiles',
+                                   {'format': 'jsonl', 'context': 'ctx'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('profiles.jsonl', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        response = self.client.get('/export/resources', {'context': 'ctx'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/export/profiles', {'consumer': 'x'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fields
+------------
+
+Tests for `dj-pylti` model fields.
+"""
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from dj_pylti.models import LTIConsumer, LTIResource, LTIUserProfile
+
+
+class TestLazyJSONField(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='gomer')
+        LTIUserProfile.objects.create(
+            user=user, lti_user_id='1',
+            custom_attributes={'custom_canvas_user_id': '599'})
+        self.field = LTIUserProfile._meta.get_field('custom_attributes')
+
+    def test_decoded_on_first_access(self):
+        profile = LTIUserProfile.objects.get()
+        self.assertFalse(self.field.is_decoded(profile))
+        self.assertEqual(profile.custom_attributes,
+                         {'custom_canvas_user_id': '599'})
+        self.assertTrue(self.field.is_decoded(profile))
+
+    def test_read_is_not_a_change(self):
+        profile = LTIUserProfile.objects.get()
+        profile.custom_attributes.get('custom_canvas_user_id')
+        self.assertEqual(profile.changed_fields(), [])
+
+    def test_untouched_value_saved_as_loaded(self):
+        profile = LTIUserProfile.objects.get()
+        profile.lis_person_name_given = 'Gomer'
+        profile.save()
+        self.assertFalse(self.field.is_decoded(profile))
+        self.assertEqual(LTIUserProfile.objects.get().custom_attributes,
+                         {'custom_canvas_user_id': '599'})
+
+    def test_string_values_are_encoded(self):
+        profile = LTIUserProfile.objects.get()
+        profile.custom_attributes = 'abc'
+        self.assertEqual(profile.custom_attributes, 'abc')
+        profile.save()
+        self.assertEqual(LTIUserProfile.objects.get().custom_attributes,
+                         'abc')
+        # a string that happens to be JSON is a string too
+        profile.custom_attributes = '{"a": 1}'
+        profile.save()
+        self.assertEqual(LTIUserProfile.objects.get().custom_attributes,
+                         '{"a": 1}')
+
+    def test_to_python(self):
+        self.assertEqual(self.field.to_python('{"a": 1}'), {'a': 1})
+        with self.assertRaises(ValidationError):
+            self.field.to_python('abc')
+
+    def test_deferred(self):
+        profile = LTIUserProfile.objects.defer('custom_attributes').get()
+        self.assertEqual(profile.custom_attributes,
+                         {'custom_canvas_user_id': '599'})
+
+    def test_other_models(self):
+        LTIResource.objects.create(consumer=LTIConsumer.objects.create(),
+                                   resource_link_id='r',
+                                   custom_attributes={'a': [1, 2]})
+        self.assertEqual(LTIResource.objects.get().custom_attributes,
+                         {'a': [1, 2]})
+        self.assertEqual(LTIResource(resource_link_id='s').custom_attributes,
+                         {})
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_launch
+------------
+
+Tests for the `dj-pylti` launch write path.
+"""
+
+from multiprocessing.pool import ThreadPool
+from unittest import skipIf
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from dj_pylti.auth_backend import DjangoLTIAuthBackend
+from dj_pylti.models import (LTIConsumer, LTIContext, LTIResource,
+                             LTIUserProfile, consumer_store, user_store)
+from dj_pylti.tests import (BaseLTITestClass, abs_reverse,
+                            generate_launch_request)
+
+PERSON = {
+    'lis_person_name_family': 'Pile',
+    'lis_person_name_given': 'Gomer',
+    'lis_person_contact_email_primary': 'gomer@gmail.com',
+    'context_label': 'Reading Ancient Greek',
+    'resource_link_title': 'Week 1',
+}
+
+
+class LaunchTestCase(BaseLTITestClass):
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        user_store.clear_local()
+        self.app = Client()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+
+    def launch(self, **params):
+        add_params = dict(PERSON, **params)
+        new_url, body = self.generate_launch_request(
+            abs_reverse('lti-tests:initial'), add_params=add_params)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.app.post(new_url, body)
+        self.assertEqual(200, response.status_code)
+        self.session_writes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE')) and
+            'django_session' in query['sql']]
+        return [query['sql'] for query in queries
+                if 'SAVEPOINT' not in query['sql'] and
+                'django_session' not in query['sql']]
+
+
+class TestLaunchQueries(LaunchTestCase):
+    """
+    Query budget of the launch write path, not counting savepoints and the
+    session backend
+    """
+
+    def test_first_launch(self):
+        queries = self.launch(custom_canvas_user_id='599')
+        self.assertEqual(len(queries), 12)
+        # the profile is inserted with the launch's fields, not updated
+        self.assertEqual([sql for sql in queries if sql.startswith('UPDATE')
+                          and 'dj_pylti_ltiuserprofile' in sql], [])
+        profile = LTIUserProfile.objects.get()
+        self.assertEqual(profile.lis_person_name_given, 'Gomer')
+        self.assertEqual(profile.custom_attributes,
+                         {'custom_canvas_user_id': '599'})
+
+    def test_repeat_launch(self):
+        self.launch()
+        # resource, context, profile+user; the user is already logged in
+        # and the profile is unchanged, neither is written
+        self.assertEqual(len(self.launch()), 3)
+
+    def test_session_written_only_on_change(self):
+        self.launch()
+        self.launch()
+        self.assertEqual(self.session_writes, [])
+        self.launch(roles='Learner')
+        self.assertEqual(len(self.session_writes), 1)
+
+    def test_changed_profile_updates_changed_columns(self):
+        self.launch()
+        queries = self.launch(lis_person_name_given='Gomer Jr')
+        updates = [sql for sql in queries if 'dj_pylti_' in sql and
+                   sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('lis_person_name_given', updates[0])
+        self.assertNotIn('lis_person_name_family', updates[0])
+        self.assertEqual(LTIUserProfile.objects.get().lis_person_name_given,
+                         'Gomer Jr')
+
+
+class TestProvisioning(LaunchTestCase):
+    """
+    Users are keyed on the LTI user_id alone
+    """
+
+    def test_changed_names_update_the_user(self):
+        self.launch()
+        self.launch(lis_person_name_given='Vince',
+                    lis_person_contact_email_primary='vince@example.com')
+        user = User.objects.get()
+        self.assertEqual((user.first_name, user.email),
+                         ('Vince', 'vince@example.com'))
+
+    def test_local_user_with_the_same_username(self):
+        user = User.objects.create_user('008437924c9852377e8994829aaac7a1',
+                                        password='secret', first_name='Old')
+        self.launch()
+        profile = LTIUserProfile.objects.select_related('user').get()
+        self.assertNotEqual(profile.user, user)
+        self.assertTrue(profile.user.username.startswith('lti-'))
+        self.assertEqual(profile.user.first_name, 'Gomer')
+        self.assertEqual(User.objects.get(pk=user.pk).first_name, 'Old')
+
+    def test_staff_user_with_the_same_username(self):
+        user = User.objects.create(username='008437924c9852377e8994829aaac7a1',
+                                   is_staff=True)
+        user.set_unusable_password()
+        user.save()
+        self.launch()
+        self.assertNotEqual(LTIUserProfile.objects.get().user, user)
+
+    def test_provisioned_user_without_profile(self):
+        # left behind by an older release, with outdated names
+        user = User.objects.create(username='008437924c9852377e8994829aaac7a1',
+                                   first_name='Old')
+        self.launch()
+        profile = LTIUserProfile.objects.get()
+        self.assertEqual(profile.user, user)
+        self.assertEqual(User.objects.get().first_name, 'Gomer')
+
+    def test_provisioned_users_have_no_password(self):
+        self.launch()
+        self.assertFalse(User.objects.get().has_usable_password())
+
+    def test_another_launch_won_the_race(self):
+        params = dict(PERSON, user_id='gomer')
+        backend = DjangoLTIAuthBackend()
+        first = backend.provision(params)
+        # the profile lookup missed, but a concurrent launch has since
+        # created both rows
+        self.assertEqual(backend.provision(params), first)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(LTIUserProfile.objects.count(), 1)
+
+    def test_missing_names(self):
+        uri, body = self.generate_launch_request(
+            abs_reverse('lti-tests:initial'))
+        self.assertEqual(self.app.post(uri, body).status_code, 200)
+        self.assertEqual(User.objects.get().first_name, '')
+
+
+@skipIf(connection.vendor == 'sqlite',
+        'needs a database that takes concurrent writes: set TEST_DB_ENGINE '
+        '(see tests/settings.py) or run tox -e py27-django-110-postgres')
+class TestConcurrentFirstLaunches(TransactionTestCase):
+    """
+    Hundreds of students open the same course link at once
+    """
+    students = 150
+    launches_per_student = 2
+    # launches in flight, well below the database's connection limit
+    # (max_connections is 100 on a default PostgreSQL, 151 on MySQL)
+    workers = 20
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        user_store.clear_local()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+
+    def test_simultaneous_first_launches(self):
+        # each student's launches next to each other, so that they race
+        launches = [
+            generate_launch_request(
+                self.consumer, abs_reverse('lti-tests:initial'),
+                add_params=dict(PERSON, user_id='student-{}'.format(i),
+                                lis_result_sourcedid='grade-{}'.format(i)))
+            for i in range(self.students)
+            for _ in range(self.launches_per_student)]
+
+        def launch(args):
+            try:
+                return Client().post(*args).status_code
+            finally:
+                # one connection per launch, like a request
+                connection.close()
+
+        pool = ThreadPool(self.workers)
+        try:
+            statuses = pool.map(launch, launches, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(statuses, [200] * len(launches))
+        self.assertEqual(User.objects.count(), self.students)
+        self.assertEqual(LTIUserProfile.objects.count(), self.students)
+        self.assertEqual(LTIContext.objects.count(), 1)
+        self.assertEqual(LTIResource.objects.count(), 1)
+
+
+class TestConsumerScopedIds(LaunchTestCase):
+
+    def test_same_ids_from_two_consumers(self):
+        first = self.consumer
+        self.launch()
+        self.consumer = LTIConsumer.objects.create(name='other')
+        self.launch()
+        self.launch()
+        self.assertEqual(
+            sorted(LTIResource.objects.values_list('consumer', flat=True)),
+            [first.pk, self.consumer.pk])
+        self.assertEqual(LTIContext.objects.filter(
+            context_id='MITx/ODL_ENG/2014_T1').count(), 2)
+
+
+class TestConsumerMigrations(TransactionTestCase):
+    """
+    0007 deduplicates and assigns rows from before the consumer column
+    existed, 0010 makes the column required
+    """
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        if target is None:
+            targets = executor.loader.graph.leaf_nodes('dj_pylti')
+        else:
+            targets = [('dj_pylti', target)]
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def old_rows(self, consumers):
+        old_apps = self.migrate('0006_consumer_scoped_ids')
+        self.addCleanup(self.migrate, None)
+        for index in range(consumers):
+            old_apps.get_model('dj_pylti', 'LTIConsumer').objects.create(
+                name='consumer{}'.format(index))
+        resource = old_apps.get_model('dj_pylti', 'LTIResource')
+        for title in ('first', 'second', 'third'):
+            resource.objects.create(resource_link_id='r',
+                                    resource_link_title=title)
+        old_apps.get_model('dj_pylti', 'LTIContext').objects.create(
+            context_id='c')
+        return old_apps
+
+    def test_single_consumer(self):
+        self.old_rows(1)
+        self.migrate(None)
+        consumer = LTIConsumer.objects.get()
+        resource = LTIResource.objects.get()
+        self.assertEqual(resource.resource_link_title, 'first')
+        self.assertEqual(resource.consumer, consumer)
+        self.assertEqual(LTIContext.objects.get().consumer, consumer)
+
+    def test_orphans_stop_the_migration(self):
+        old_apps = self.old_rows(2)
+        with self.assertRaises(RuntimeError):
+            self.migrate(None)
+        # the manual cleanup
+        consumer = old_apps.get_model('dj_pylti', 'LTIConsumer').objects.first()
+        for name in ('LTIResource', 'LTIContext'):
+            old_apps.get_model('dj_pylti', name).objects.filter(
+                consumer=None).update(consumer=consumer)
+        self.migrate(None)
+        self.assertEqual(LTIResource.objects.get().consumer_id, consumer.pk)
+
+
+class TestProfileChanges(TestCase):
+
+    def test_changed_fields(self):
+        user = User.objects.create(username='gomer')
+        profile = LTIUserProfile.objects.create(user=user, lti_user_id='1')
+        self.assertEqual(profile.changed_fields(), [])
+        profile = LTIUserProfile.objects.get()
+        self.assertEqual(profile.save_changes(), [])
+        profile.custom_attributes['custom_canvas_user_id'] = '599'
+        self.assertEqual(profile.changed_fields(), ['custom_attributes'])
+        self.assertEqual(profile.save_changes(), ['custom_attributes'])
+        self.assertEqual(profile.changed_fields(), [])
+        self.assertEqual(LTIUserProfile.objects.get().custom_attributes,
+                         {'custom_canvas_user_id': '599'})
+
+    def test_loading_does_not_snapshot(self):
+        user = User.objects.create(username='gomer')
+        LTIUserProfile.objects.create(user=user, lti_user_id='1',
+                                      lis_person_name_given='Gomer')
+        profile = LTIUserProfile.objects.select_related('user').get()
+        self.assertNotIn('_saved_values', profile.__dict__)
+        self.assertEqual(profile.changed_fields(), [])
+        profile.lis_person_name_given = 'Gomer Jr'
+        self.assertEqual(profile.changed_fields(), ['lis_person_name_given'])
+        # never loaded nor saved: everything is a change
+        self.assertIn('lti_user_id', LTIUserProfile(user=user).changed_fields())
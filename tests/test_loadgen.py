@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_loadgen
+------------
+
+Tests for the `dj-pylti` launch load generator.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from dj_pylti.loadgen import (LoadReport, generate_launches, percentile,
+                              read_launches)
+from dj_pylti.models import (LTIConsumer, LTIContext, LTIUserProfile,
+                             consumer_store)
+
+
+class TestLaunchGeneration(TestCase):
+
+    def test_generated_launches_are_repeatable(self):
+        first = generate_launches(['1', '2'], 20, users=5, contexts=2,
+                                  roles=['Learner', 'Instructor'], seed=3)
+        self.assertEqual(first, generate_launches(
+            ['1', '2'], 20, users=5, contexts=2,
+            roles=['Learner', 'Instructor'], seed=3))
+        self.assertTrue(set(launch.params['user_id'] for launch in first) <=
+                        set('loadgen-user-{}'.format(i) for i in range(5)))
+        self.assertEqual(set(['1', '2']),
+                         set(launch.consumer_key for launch in first))
+
+    def test_replayed_launches_drop_oauth_fields(self):
+        launches = read_launches([
+            '{"oauth_consumer_key": "7", "oauth_nonce": "n", '
+            '"oauth_signature": "s", "user_id": "u"}',
+            '',
+            '{"user_id": "v"}',
+        ], default_consumer='1')
+        self.assertEqual([('7', {'user_id': 'u'}), ('1', {'user_id': 'v'})],
+                         [tuple(launch) for launch in launches])
+
+    def test_report(self):
+        report = LoadReport()
+        for status in (200, 200, 302, 500):
+            report.add(status, 0.01)
+        report.add(0, 1.0)
+        report.elapsed = 2.0
+        summary = report.summary()
+        self.assertEqual(5, summary['requests'])
+        self.assertEqual(2, summary['errors'])
+        self.assertEqual(0.4, summary['error_rate'])
+        self.assertEqual(2.5, summary['rps'])
+        self.assertEqual(1000.0, summary['max_ms'])
+        self.assertEqual({'0': 1, '200': 2, '302': 1, '500': 1},
+                         summary['statuses'])
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(50, percentile(ordered, 0.5))
+        self.assertEqual(99, percentile(ordered, 0.99))
+        self.assertEqual(0.0, percentile([], 0.5))
+
+
+class TestLoadgenCommand(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def loadgen(self, *args):
+        out = StringIO()
+        call_command('lti_loadgen', '--json', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_launches_go_through_the_launch_path(self):
+        summary = self.loadgen('--requests', '12', '--users', '4',
+                               '--contexts', '3', '--seed', '1')
+        self.assertEqual(12, summary['requests'])
+        self.assertEqual(0, summary['errors'])
+        self.assertEqual({'200': 12}, summary['statuses'])
+        self.assertEqual(4, LTIUserProfile.objects.filter(
+            lti_user_id__startswith='loadgen-user-').count())
+        self.assertEqual(3, LTIContext.objects.filter(
+            consumer=self.consumer).count())
+
+    def test_record_and_replay(self):
+        path = os.path.join(self.tmp, 'launches.jsonl')
+        self.loadgen('--requests', '5', '--record', path)
+        with open(path) as recorded:
+            self.assertEqual(5, len(recorded.readlines()))
+        summary = self.loadgen('--replay', path)
+        # replays are signed again, so their nonces are fresh
+        self.assertEqual({'200': 5}, summary['statuses'])
+
+    def test_wrong_secret_is_reported_as_errors(self):
+        summary = self.loadgen('--requests', '3', '--consumers',
+                               '{}:wrong'.format(self.consumer.key))
+        self.assertEqual(3, summary['errors'])
+
+    def test_unknown_consumer(self):
+        with self.assertRaises(CommandError):
+            self.loadgen('--consumers', '999')
+
+    def test_default_url_uses_an_allowed_host(self):
+        with self.settings(ALLOWED_HOSTS=['.example.edu']):
+            summary = self.loadgen('--requests', '2')
+        self.assertEqual({'200': 2}, summary['statuses'])
+
+    def test_disallowed_host_fails_fast(self):
+        with self.settings(ALLOWED_HOSTS=['tool.example.edu']):
+            with self.assertRaises(CommandError):
+                self.loadgen('--url', 'http://testserver/initial/')
+        self.assertFalse(LTIUserProfile.objects.exists())
+
+    def test_http_target_needs_a_url(self):
+        with self.assertRaises(CommandError):
+            self.loadgen('--target', 'http')
+
+    def test_unknown_view(self):
+        with self.assertRaises(CommandError):
+            self.loadgen('--view', 'nowhere')
+
+    def test_text_report(self):
+        out = StringIO()
+        call_command('lti_loadgen', '--requests', '2', stdout=out)
+        self.assertIn('requests=2 errors=0', out.getvalue())
+        self.assertIn('statuses: 200=2', out.getvalue())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+------------
+
+Tests for `dj-pylti` phase timings and the metrics view.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from dj_pylti import metrics
+
+from .test_launch import LaunchTestCase
+
+
+class TestLaunchTimings(LaunchTestCase):
+
+    def setUp(self):
+        super(TestLaunchTimings, self).setUp()
+        metrics.reset_registry()
+
+    def test_phases(self):
+        self.launch()
+        series = metrics.get_registry().collect()
+        phases = dict((labels[0], labels) for labels in series)
+        for phase in ('verify', 'consumer_lookup', 'oauth', 'nonce',
+                      'persist', 'authenticate', 'login', 'profile',
+                      'session_save'):
+            self.assertIn(phase, phases)
+        self.assertEqual(phases['oauth'],
+                         ('oauth', self.consumer.key, 'initial', 'ok'))
+        self.assertEqual(phases['authenticate'][3], 'created')
+        self.launch()
+        self.assertIn(('login', self.consumer.key, 'initial', 'skipped'),
+                      metrics.get_registry().collect())
+
+    def test_rejected(self):
+        new_url, body = self.generate_launch_request(
+            'http://testserver/lti/initial/?')
+        body['oauth_signature'] = ['forged']
+        self.app.post(new_url, body)
+        outcomes = dict((labels[0], labels[3])
+                        for labels in metrics.get_registry().collect())
+        self.assertEqual(outcomes['oauth'], 'rejected')
+        self.assertEqual(outcomes['verify'], 'rejected')
+
+
+class TestRegistries(TestCase):
+
+    def test_exposition(self):
+        registry = metrics.LocalRegistry(buckets=(0.1, 1))
+        labels = ('oauth', '1', 'initial', 'ok')
+        registry.observe(labels, 0.05)
+        registry.observe(labels, 0.5)
+        registry.observe(labels, 5)
+        text = metrics.exposition(registry.collect(), registry.buckets)
+        prefix = ('dj_pylti_phase_seconds_bucket{phase="oauth",consumer="1",'
+                  'request_type="initial",outcome="ok",')
+        self.assertIn(prefix + 'le="0.1"} 1\n', text)
+        self.assertIn(prefix + 'le="1.0"} 2\n', text)
+        self.assertIn(prefix + 'le="+Inf"} 3\n', text)
+        self.assertIn('_count{phase="oauth",consumer="1",'
+                      'request_type="initial",outcome="ok"} 3\n', text)
+        self.assertIn('# TYPE dj_pylti_phase_seconds histogram', text)
+
+    def test_cache_registry_adds_up_processes(self):
+        cache.clear()
+        labels = ('nonce', '1', 'initial', 'ok')
+        first = metrics.CacheRegistry(flush_interval=0)
+        second = metrics.CacheRegistry(flush_interval=0)
+        first.observe(labels, 0.001)
+        second.observe(labels, 0.002)
+        second.observe(labels, 0.003)
+        counts, total, count = first.collect()[labels]
+        self.assertEqual(count, 3)
+        self.assertAlmostEqual(total, 0.006)
+
+    @override_settings(PYLTI_CONFIG=dict(settings.PYLTI_CONFIG,
+                                         metrics=False))
+    def test_disabled(self):
+        self.assertIsNone(metrics.get_registry())
+        metrics.observe(1, phase='oauth')
+
+
+@override_settings(PYLTI_CONFIG=dict(settings.PYLTI_CONFIG,
+                                     metrics_token='s3cret'))
+class TestMetricsView(TestCase):
+
+    def test_token(self):
+        metrics.observe(0.01, phase='oauth', outcome='ok')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics',
+                                   HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'phase="oauth"', response.content)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_middleware
+------------
+
+Tests for `dj-pylti` LTIMiddleware, shared LTI objects and LTIMixin.
+"""
+
+from django.conf.urls import url
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import engines
+from django.test import Client, modify_settings
+from django.test.utils import override_settings
+from django.views.generic import View
+
+from dj_pylti.auth_backend import LTIMixin, lti
+from dj_pylti.context_processors import lti_context
+from dj_pylti.models import LTIConsumer, consumer_store, user_store
+from dj_pylti.tests import BaseLTITestClass, generate_launch_request
+
+from .test_launch import PERSON
+
+
+def plain(request):
+    the_lti = request.lti
+    return HttpResponse(the_lti.claim('user_id') if the_lti else 'none')
+
+
+def templated(request):
+    template = engines['django'].from_string(
+        '{% if lti %}{{ lti.claims.user_id }}{% endif %}')
+    return HttpResponse(template.render(lti_context(request)))
+
+
+@lti(request='initial')
+@lti(request='initial')
+def stacked(request, lti=None):
+    return HttpResponse(lti.claim('user_id'))
+
+
+@lti(request='any')
+def helper(request, lti=None):
+    return lti
+
+
+@lti(request='initial')
+def nested(request, lti=None):
+    assert helper(request) is lti
+    return HttpResponse(str(request.lti is lti))
+
+
+class StaffView(LTIMixin, View):
+    lti_request = 'any'
+    lti_role = 'staff'
+
+    def get(self, request):
+        return HttpResponse(self.lti.claim('roles'))
+
+    post = get
+
+
+urlpatterns = [
+    url(r'^plain/$', plain),
+    url(r'^templated/$', templated),
+    url(r'^stacked/$', stacked),
+    url(r'^nested/$', nested),
+    url(r'^staff/$', StaffView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF='tests.test_middleware')
+class MiddlewareTestCase(BaseLTITestClass):
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        user_store.clear_local()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+        self.app = Client()
+
+    def launch(self, path, **params):
+        uri, body = generate_launch_request(
+            self.consumer, 'http://testserver{}?'.format(path),
+            add_params=dict(PERSON, **params))
+        return self.app.post(uri, body)
+
+
+class TestSharedLTI(MiddlewareTestCase):
+
+    def test_stacked_decorators_verify_once(self):
+        # a second check of the launch would see its nonce replayed
+        response = self.launch('/stacked/', user_id='gomer')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'gomer')
+
+    def test_helpers_share_the_object(self):
+        response = self.launch('/nested/')
+        self.assertEqual(response.content, b'True')
+
+    def test_get_to_launch_view_is_an_lti_error(self):
+        response = self.app.get('/stacked/')
+        self.assertEqual(response.status_code, 500)
+
+
+@modify_settings(MIDDLEWARE={'append': 'dj_pylti.middleware.LTIMiddleware'})
+class TestLTIMiddleware(MiddlewareTestCase):
+
+    def test_no_lti(self):
+        self.assertEqual(self.app.get('/plain/').content, b'none')
+
+    def test_launch_to_plain_view(self):
+        response = self.launch('/plain/', user_id='gomer')
+        self.assertEqual(response.content, b'gomer')
+        # the launch started an LTI session
+        self.assertEqual(self.app.get('/plain/').content, b'gomer')
+
+    def test_bad_launch(self):
+        self.consumer.secret = '00000000-0000-0000-0000-000000000000'
+        uri, body = generate_launch_request(
+            self.consumer, 'http://testserver/plain/?', add_params=PERSON)
+        self.assertEqual(self.app.post(uri, body).content, b'none')
+
+    def test_context_processor(self):
+        self.assertEqual(self.app.get('/templated/').content, b'')
+        self.launch('/plain/', user_id='gomer')
+        self.assertEqual(self.app.get('/templated/').content, b'gomer')
+
+
+class TestLTIMixin(MiddlewareTestCase):
+
+    def test_allowed(self):
+        response = self.launch('/staff/', roles='Instructor')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'Instructor')
+        self.assertEqual(self.app.get('/staff/').status_code, 200)
+
+    def test_wrong_role(self):
+        response = self.launch('/staff/', roles='Learner')
+        self.assertEqual(response.status_code, 500)
+
+    def test_no_session(self):
+        self.assertEqual(Client().get('/staff/').status_code, 500)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_nonces
+------------
+
+Tests for `dj-pylti` nonce replay protection.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import Client, TestCase, override_settings
+
+from dj_pylti.models import LTIConsumer
+from dj_pylti.nonces import (NonceStore, TTLSet, TTLSetFull, check_nonce,
+                             reset_nonce_store)
+from dj_pylti.tests import BaseLTITestClass, abs_reverse
+
+
+class TestTTLSet(TestCase):
+
+    def test_add_and_expire(self):
+        members = TTLSet(ttl=10)
+        self.assertTrue(members.add('a', now=0))
+        self.assertFalse(members.add('a', now=5))
+        self.assertTrue(members.add('b', now=6))
+        self.assertTrue(members.add('a', now=11))
+        # 'a' was evicted and re-added, 'b' is still live
+        self.assertEqual(len(members), 2)
+
+    def test_bounded(self):
+        members = TTLSet(ttl=10, maxsize=2)
+        members.add('a', now=0)
+        members.add('b', now=1)
+        with self.assertRaises(TTLSetFull):
+            members.add('c', now=2)
+        self.assertEqual(len(members), 2)
+        # room again once 'a' has expired
+        self.assertTrue(members.add('c', now=10))
+        self.assertEqual(len(members), 2)
+
+    def test_live_members_are_never_forgotten(self):
+        members = TTLSet(ttl=10, maxsize=2)
+        members.add('a', now=0)
+        members.add('b', now=0)
+        for member in 'cdef':
+            with self.assertRaises(TTLSetFull):
+                members.add(member, now=5)
+        self.assertFalse(members.add('a', now=9))
+
+
+class TestNonceStore(TestCase):
+
+    def test_cache_backend(self):
+        cache.clear()
+        store = NonceStore(backend='cache')
+        self.assertTrue(store.add('1', 'nonce'))
+        self.assertFalse(store.add('1', 'nonce'))
+        self.assertTrue(store.add('2', 'nonce'))
+
+    def test_check_nonce(self):
+        now = time.time()
+        self.assertIsNone(check_nonce('1', 'fresh', now, now=now))
+        self.assertEqual(check_nonce('1', 'fresh', now, now=now),
+                         'OAuth nonce has already been used')
+        self.assertEqual(check_nonce('1', 'other', now - 3600, now=now),
+                         'Expired oauth_timestamp')
+
+    @override_settings(PYLTI_CONFIG={'nonce_cache_size': 2})
+    def test_full_store_rejects_launches(self):
+        reset_nonce_store()
+        self.addCleanup(reset_nonce_store)
+        now = time.time()
+        self.assertIsNone(check_nonce('1', 'a', now, now=now))
+        self.assertIsNone(check_nonce('1', 'b', now, now=now))
+        self.assertEqual(check_nonce('1', 'c', now, now=now),
+                         'Too many launches, try again later')
+        self.assertEqual(check_nonce('1', 'a', now, now=now),
+                         'OAuth nonce has already been used')
+
+    def test_capacity_must_cover_the_window(self):
+        with self.assertRaises(ImproperlyConfigured):
+            NonceStore(ttl=600, maxsize=1000, max_rate=10)
+        NonceStore(ttl=600, maxsize=6000, max_rate=10)
+
+
+class TestReplayedLaunch(BaseLTITestClass):
+
+    def setUp(self):
+        self.app = Client()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+
+    @override_settings(PYLTI_CONFIG={'lti_properties': [],
+                                     'nonce_backend': 'cache'})
+    def test_replay_is_rejected(self):
+        new_url, body = self.generate_launch_request(
+            abs_reverse('lti-tests:initial'), add_params={
+                'lis_person_name_family': 'Pile',
+                'lis_person_name_given': 'Gomer',
+                'lis_person_contact_email_primary': 'gomer@gmail.com'})
+        self.assertEqual(200, self.app.post(new_url, body).status_code)
+        self.assertEqual(500, self.app.post(new_url, body).status_code)
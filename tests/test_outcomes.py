@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_outcomes
+------------
+
+Tests for `dj-pylti` outcome delivery and the outbox worker.
+"""
+
+import threading
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils.six import StringIO
+
+import httpretty
+
+from dj_pylti import outcomes
+from dj_pylti.models import LTI, LTIConsumer, OutcomeMessage
+from dj_pylti.transport import OutcomeTransport, get_transport
+
+OUTCOME_URL = 'https://lms.example.edu/grade_handler'
+SUCCESS = b'<imsx_codeMajor>success</imsx_codeMajor>'
+OUTBOX_CONFIG = {'lti_properties': [], 'outcome_delivery': 'outbox',
+                 'outbox_backoff': 10}
+
+
+class OutcomeTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+
+    def lti(self):
+        request = RequestFactory().get('/')
+        request.session = {'oauth_consumer_key': self.consumer.key,
+                           'lis_result_sourcedid': 'abc',
+                           'lis_outcome_service_url': OUTCOME_URL}
+        return LTI((), {}, request)
+
+    def queue(self, count=1):
+        for _ in range(count):
+            OutcomeMessage.objects.create(consumer_key=self.consumer.key,
+                                          url=OUTCOME_URL, body='<xml/>')
+
+
+@override_settings(PYLTI_CONFIG=OUTBOX_CONFIG)
+class TestOutbox(OutcomeTestCase):
+
+    def test_post_grade_is_queued(self):
+        self.assertTrue(self.lti().post_grade(0.5))
+        message = OutcomeMessage.objects.get()
+        self.assertEqual(message.consumer_key, self.consumer.key)
+        self.assertIn('abc', message.body)
+
+    def test_claims_do_not_overlap(self):
+        self.queue(3)
+        first = outcomes.claim(batch_size=2)
+        second = outcomes.claim(batch_size=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(m.pk for m in first) & set(m.pk for m in second))
+
+    def test_expired_lease_is_reclaimed(self):
+        self.queue()
+        outcomes.claim(lease_seconds=-1)
+        self.assertEqual(len(outcomes.claim()), 1)
+
+    @httpretty.activate
+    def test_worker_delivers(self):
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, body=SUCCESS)
+        self.queue(3)
+        out = StringIO()
+        call_command('lti_outcome_worker', once=True, stdout=out)
+        self.assertIn('sent=3', out.getvalue())
+        self.assertEqual(
+            OutcomeMessage.objects.filter(status=OutcomeMessage.SENT).count(),
+            3)
+
+    @httpretty.activate
+    def test_failure_backs_off_then_fails(self):
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, status=500,
+                               body='')
+        self.queue()
+        self.assertEqual(outcomes.deliver_pending(max_attempts=2),
+                         {'sent': 0, 'retried': 1, 'failed': 0})
+        message = OutcomeMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNone(message.lease_owner)
+        # not due again until the backoff has passed
+        self.assertEqual(outcomes.claim(), [])
+        OutcomeMessage.objects.update(available_at=message.created)
+        outcomes.deliver_pending(max_attempts=2)
+        self.assertEqual(OutcomeMessage.objects.get().status,
+                         OutcomeMessage.FAILED)
+
+
+class TestTransport(OutcomeTestCase):
+
+    @httpretty.activate
+    def test_post_grade_uses_pooled_connection(self):
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, body=SUCCESS)
+        the_lti = self.lti()
+        self.assertTrue(the_lti.post_grade(0.5))
+        self.assertTrue(the_lti.post_grade(0.7))
+        headers = httpretty.last_request().headers
+        self.assertIn('oauth_body_hash', headers['Authorization'])
+        pool = get_transport()._pools[('https', 'lms.example.edu', None)]
+        self.assertEqual(pool.qsize(), 1)
+
+    def test_pool_is_bounded(self):
+        transport = OutcomeTransport(pool_size=1)
+        key = ('https', 'lms.example.edu', None)
+        first, second = transport._acquire(key), transport._acquire(key)
+        self.assertIsNot(first, second)
+        transport._release(key, first)
+        transport._release(key, second)
+        self.assertEqual(transport._pool(key).qsize(), 1)
+        self.assertIs(transport._acquire(key), first)
+
+
+class TestBulkGrades(OutcomeTestCase):
+
+    def items(self, count, key=None):
+        key = key or self.consumer.key
+        return [('source-{}'.format(i), 0.5, OUTCOME_URL, key)
+                for i in range(count)]
+
+    @httpretty.activate
+    def test_bulk_post(self):
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, body=SUCCESS)
+        items = self.items(20) + [('bad', 2, OUTCOME_URL, self.consumer.key),
+                                  ('nobody', 0.5, OUTCOME_URL, '0')]
+        results = LTI.post_grades_bulk(items, max_workers=4, per_consumer=2)
+        self.assertEqual([r.sourcedid for r in results],
+                         [item[0] for item in items])
+        self.assertTrue(all(r.success for r in results[:20]))
+        self.assertEqual(results[20].error, 'Invalid score')
+        self.assertIn('Unknown consumer', results[21].error)
+
+    @httpretty.activate
+    def test_non_numeric_score_fails_its_item(self):
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, body=SUCCESS)
+        items = self.items(2) + [('bad', 'n/a', OUTCOME_URL,
+                                  self.consumer.key),
+                                 ('none', None, OUTCOME_URL,
+                                  self.consumer.key)]
+        results = outcomes.post_grades_bulk(items)
+        self.assertEqual([r.success for r in results],
+                         [True, True, False, False])
+        self.assertEqual(results[2].error, 'Invalid score')
+        self.assertEqual(results[2].score, 'n/a')
+
+    @httpretty.activate
+    def test_slow_consumer_does_not_hold_every_worker(self):
+        slow_url = 'https://slow.example.edu/grade_handler'
+        other = LTIConsumer.objects.create(name='other')
+        fast_done = threading.Event()
+        order = []
+
+        def slow(request, uri, headers):
+            # answers once the other consumer's grades went through
+            fast_done.wait(5)
+            order.append('slow')
+            return 200, headers, SUCCESS
+
+        def fast(request, uri, headers):
+            order.append('fast')
+            if order.count('fast') == 3:
+                fast_done.set()
+            return 200, headers, SUCCESS
+
+        httpretty.register_uri(httpretty.POST, slow_url, body=slow)
+        httpretty.register_uri(httpretty.POST, OUTCOME_URL, body=fast)
+        items = ([('s{}'.format(i), 0.5, slow_url, self.consumer.key)
+                  for i in range(6)] + self.items(3, key=other.key))
+        results = outcomes.post_grades_bulk(items, max_workers=3,
+                                            per_consumer=2)
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual(order[:3], ['fast'] * 3)
+
+    @override_settings(PYLTI_CONFIG=OUTBOX_CONFIG)
+    def test_bulk_outbox(self):
+        results = outcomes.post_grades_bulk(self.items(5))
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual(OutcomeMessage.objects.count(), 5)
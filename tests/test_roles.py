@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_roles
+------------
+
+Tests for `dj-pylti` role checks.
+"""
+
+from django.test import RequestFactory, TestCase
+
+from pylti.common import LTIException
+
+from dj_pylti.models import LTI, matched_roles
+
+
+class TestRoles(TestCase):
+
+    def lti(self, roles):
+        request = RequestFactory().get('/')
+        request.session = {'roles': roles}
+        return LTI((), {}, request)
+
+    def test_matched_roles(self):
+        self.assertEqual(matched_roles('Instructor'),
+                         frozenset(['instructor', 'staff']))
+        self.assertEqual(
+            matched_roles('urn:lti:instrole:ims/lis/Learner, Observer'),
+            frozenset(['student']))
+        self.assertEqual(matched_roles(None), frozenset())
+
+    def test_is_role(self):
+        the_lti = self.lti('Learner,urn:lti:instrole:ims/lis/Administrator')
+        self.assertTrue(the_lti.is_student())
+        self.assertTrue(the_lti.is_admin())
+        self.assertFalse(the_lti.is_instructor())
+        self.assertRaises(LTIException, the_lti.is_role, 'nope')
+
+    def test_roles_parsed_once(self):
+        the_lti = self.lti('Instructor')
+        self.assertTrue(the_lti.is_instructor())
+        the_lti.request.session['roles'] = 'Learner'
+        self.assertTrue(the_lti.is_instructor())
+        self.assertFalse(the_lti.is_student())
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_roster
+------------
+
+Tests for `dj-pylti` roster sync from the memberships service.
+"""
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+import httpretty
+
+from dj_pylti.models import (LTIConsumer, LTIContext, LTIMembership,
+                             LTIUserProfile, consumer_store, user_store)
+from dj_pylti import roster
+from dj_pylti.roster import RosterError, parse_page, sync_roster
+
+from .test_launch import LaunchTestCase
+
+MEMBERSHIPS_URL = 'https://lms.example.edu/memberships/ctx'
+
+
+def member(user_id, role='Learner', given='Gomer', status=None):
+    item = {'member': {'userId': user_id, 'givenName': given,
+                       'familyName': 'Pile', 'name': given + ' Pile',
+                       'email': user_id + '@example.edu'},
+            'role': [role]}
+    if status:
+        item['status'] = status
+    return item
+
+
+def page(members, next_page=None):
+    payload = {'pageOf': {'membershipSubject': {'membership': members}}}
+    if next_page:
+        payload['nextPage'] = next_page
+    return payload
+
+
+class FakeMemberships(object):
+    """
+    A memberships service serving ``pages`` (path suffix -> payload), each
+    with an ETag that changes with its content
+    """
+
+    def __init__(self, pages, headers=None):
+        self.pages = pages
+        self.headers = headers or {}
+        self.requests = []
+        for suffix in pages:
+            httpretty.register_uri(httpretty.GET, MEMBERSHIPS_URL + suffix,
+                                   body=self.respond)
+
+    def etag(self, suffix):
+        return '"{}"'.format(abs(hash(json.dumps(self.pages[suffix],
+                                                 sort_keys=True))))
+
+    def respond(self, request, uri, headers):
+        self.requests.append(request)
+        suffix = uri.split('?')[0][len(MEMBERSHIPS_URL):]
+        headers = dict(headers, etag=self.etag(suffix))
+        headers.update(self.headers)
+        if request.headers.get('If-None-Match') == headers['etag']:
+            return 304, headers, ''
+        return 200, headers, json.dumps(self.pages[suffix])
+
+
+class RosterTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        consumer_store.clear_local()
+        user_store.clear_local()
+        self.consumer = LTIConsumer.objects.create(name='consumer')
+        self.context = LTIContext.objects.create(
+            consumer=self.consumer, context_id='ctx',
+            memberships_url=MEMBERSHIPS_URL)
+
+    def statuses(self):
+        return dict(LTIMembership.objects.values_list(
+            'profile__lti_user_id', 'status'))
+
+
+class TestParsePage(TestCase):
+
+    def test_membership_format(self):
+        members, next_page = parse_page(
+            page([member('gomer', role='Instructor')], next_page='http://n'))
+        self.assertEqual(next_page, 'http://n')
+        self.assertEqual(members[0]['user_id'], 'gomer')
+        self.assertEqual(members[0]['roles'], 'Instructor')
+        self.assertEqual(members[0]['status'], 'Active')
+        self.assertEqual(members[0]['email'], 'gomer@example.edu')
+
+
+class TestSyncRoster(RosterTestCase):
+
+    @httpretty.activate
+    def test_pages_are_followed(self):
+        FakeMemberships({
+            '': page([member('a'), member('b')],
+                     next_page=MEMBERSHIPS_URL + '/2'),
+            '/2': page([member('c', role='Instructor')]),
+        })
+        stats = sync_roster(self.context, chunk_size=2)
+        self.assertEqual((stats['pages'], stats['members'], stats['created']),
+                         (2, 3, 3))
+        self.assertEqual(self.statuses(),
+                         {'a': 'Active', 'b': 'Active', 'c': 'Active'})
+        profile = LTIUserProfile.objects.select_related('user').get(
+            lti_user_id='c')
+        self.assertEqual(profile.lis_person_name_full, 'Gomer Pile')
+        self.assertEqual(profile.user.username, 'c')
+        self.assertEqual(profile.user.email, 'c@example.edu')
+        self.assertEqual(LTIMembership.objects.get(profile=profile).roles,
+                         'Instructor')
+
+    @httpretty.activate
+    def test_requests_are_signed(self):
+        fake = FakeMemberships({'': page([member('a')])})
+        sync_roster(self.context)
+        headers = fake.requests[0].headers
+        self.assertIn('oauth_signature', headers['Authorization'])
+        self.assertIn('membershipcontainer', headers['Accept'])
+
+    @httpretty.activate
+    def test_not_modified(self):
+        FakeMemberships({'': page([member('a')])})
+        sync_roster(self.context)
+        self.context.refresh_from_db()
+        self.assertTrue(self.context.roster_etag)
+        with CaptureQueriesContext(connection) as queries:
+            stats = sync_roster(self.context)
+        self.assertTrue(stats['not_modified'])
+        self.assertEqual(len(queries), 0)
+
+    @httpretty.activate
+    def test_unchanged_members_are_not_written(self):
+        fake = FakeMemberships({'': page([member('a'), member('b')])})
+        sync_roster(self.context)
+        # the ETag changes, the members don't
+        fake.headers['etag'] = '"other"'
+        with CaptureQueriesContext(connection) as queries:
+            stats = sync_roster(self.context)
+        self.assertEqual(stats['unchanged'], 2)
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        # the members' sync time, the removal sweep and the context's
+        self.assertEqual(len(writes), 3)
+
+    @httpretty.activate
+    def test_changed_and_removed_members(self):
+        fake = FakeMemberships({'': page([member('a'), member('b')])})
+        sync_roster(self.context)
+        fake.pages[''] = page([member('a', role='TeachingAssistant',
+                                      given='Gomer Jr')])
+        stats = sync_roster(self.context)
+        self.assertEqual((stats['updated'], stats['removed']), (1, 1))
+        self.assertEqual(self.statuses(), {'a': 'Active', 'b': 'Deleted'})
+        user = User.objects.get(username='a')
+        self.assertEqual(user.first_name, 'Gomer Jr')
+        self.assertEqual(LTIUserProfile.objects.get(
+            user=user).lis_person_name_given, 'Gomer Jr')
+
+    @httpretty.activate
+    def test_later_pages_are_always_read(self):
+        fake = FakeMemberships({
+            '': page([member('a')], next_page=MEMBERSHIPS_URL + '/2'),
+            '/2': page([member('b')]),
+        })
+        sync_roster(self.context)
+        self.context.refresh_from_db()
+        # the first page's ETag does not cover the second
+        self.assertEqual(self.context.roster_etag, '')
+        fake.pages['/2'] = page([member('b', role='Instructor')])
+        del fake.requests[:]
+        stats = sync_roster(self.context)
+        self.assertEqual((stats['pages'], stats['updated']), (2, 1))
+        self.assertFalse([request for request in fake.requests
+                          if request.headers.get('If-None-Match')])
+
+    @httpretty.activate
+    def test_removal_does_not_list_the_roster(self):
+        fake = FakeMemberships({'': page([member('m{}'.format(i))
+                                          for i in range(30)])})
+        sync_roster(self.context)
+        fake.pages[''] = page([member('m{}'.format(i)) for i in range(1, 30)])
+        with CaptureQueriesContext(connection) as queries:
+            stats = sync_roster(self.context)
+        self.assertEqual((stats['unchanged'], stats['removed']), (29, 1))
+        self.assertEqual(LTIMembership.objects.get(
+            status=LTIMembership.DELETED).profile.lti_user_id, 'm0')
+        # no IN list of every member: SQLite and Oracle cap query parameters
+        sweep = [query['sql'] for query in queries
+                 if query['sql'].startswith('UPDATE') and 'Deleted' in
+                 query['sql']]
+        self.assertEqual(len(sweep), 1)
+        self.assertNotIn('lti_user_id', sweep[0])
+
+    @httpretty.activate
+    def test_existing_users_are_reused(self):
+        user = User.objects.create(username='a')
+        LTIUserProfile.objects.create(lti_user_id='a', user=user)
+        FakeMemberships({'': page([member('a'), member('b')])})
+        stats = sync_roster(self.context)
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(User.objects.get(pk=user.pk).first_name, 'Gomer')
+
+    @httpretty.activate
+    def test_local_users_are_not_taken_over(self):
+        user = User.objects.create_user('a', password='secret')
+        FakeMemberships({'': page([member('a'), member('b')])})
+        stats = sync_roster(self.context)
+        self.assertEqual(stats['created'], 2)
+        profile = LTIUserProfile.objects.select_related('user').get(
+            lti_user_id='a')
+        self.assertNotEqual(profile.user, user)
+        self.assertEqual(profile.user.first_name, 'Gomer')
+        self.assertEqual(User.objects.get(pk=user.pk).first_name, '')
+        self.assertFalse(profile.user.has_usable_password())
+
+    @httpretty.activate
+    def test_next_page_loop(self):
+        FakeMemberships({
+            '': page([member('a')], next_page=MEMBERSHIPS_URL + '/2'),
+            '/2': page([member('b')], next_page=MEMBERSHIPS_URL),
+        })
+        # a link back to a fetched page ends the roster
+        stats = sync_roster(self.context)
+        self.assertEqual((stats['pages'], stats['members']), (2, 2))
+        self.assertEqual(set(self.statuses()), {'a', 'b'})
+
+    @httpretty.activate
+    def test_membership_inserted_during_the_sync(self):
+        FakeMemberships({'': page([member('a'), member('b')])})
+        provision = roster._provision
+
+        def racing_provision(members):
+            profiles = provision(members)
+            # another sync of the context gets there first
+            LTIMembership.objects.create(context=self.context,
+                                         profile=profiles['b'], roles='x')
+            return profiles
+        roster._provision = racing_provision
+        self.addCleanup(setattr, roster, '_provision', provision)
+        stats = sync_roster(self.context)
+        self.assertEqual((stats['created'], stats['updated']), (1, 1))
+        self.assertEqual(self.statuses(), {'a': 'Active', 'b': 'Active'})
+        self.assertEqual(LTIMembership.objects.get(
+            profile__lti_user_id='b').roles, 'Learner')
+
+    @httpretty.activate
+    def test_service_error(self):
+        httpretty.register_uri(httpretty.GET, MEMBERSHIPS_URL, status=500,
+                               body='')
+        with self.assertRaises(RosterError):
+            sync_roster(self.context)
+        self.assertFalse(LTIMembership.objects.exists())
+
+    def test_no_service(self):
+        self.context.memberships_url = ''
+        with self.assertRaises(RosterError):
+            sync_roster(self.context)
+
+
+class TestRosterCommand(RosterTestCase):
+
+    @httpretty.activate
+    def test_command(self):
+        FakeMemberships({'': page([member('a')])})
+        LTIContext.objects.create(consumer=self.consumer, context_id='other')
+        out = StringIO()
+        call_command('lti_roster_sync', stdout=out)
+        self.assertIn('ctx: pages=1 members=1 created=1', out.getvalue())
+        out = StringIO()
+        call_command('lti_roster_sync', context=['ctx'], stdout=out)
+        self.assertEqual(out.getvalue(), 'ctx: not modified\n')
+
+    def test_nothing_to_sync(self):
+        with self.assertRaises(CommandError):
+            call_command('lti_roster_sync', context=['other'])
+
+
+class TestLaunchStoresMembershipsURL(LaunchTestCase):
+
+    def test_launch(self):
+        self.launch(custom_context_memberships_url=MEMBERSHIPS_URL)
+        self.assertEqual(LTIContext.objects.get().memberships_url,
+                         MEMBERSHIPS_URL)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tokens
+------------
+
+Tests for `dj-pylti` signed launch tokens.
+"""
+
+from django.conf import settings
+from django.test import Client
+from django.test.utils import override_settings
+
+from dj_pylti.tokens import make_token, read_token
+
+from .test_launch import LaunchTestCase
+
+TOKEN_CONFIG = dict(settings.PYLTI_CONFIG, launch_token=True)
+
+
+@override_settings(PYLTI_CONFIG=TOKEN_CONFIG)
+class TestLaunchToken(LaunchTestCase):
+
+    def token(self):
+        self.launch()
+        return self.app.cookies['dj_pylti_token'].value
+
+    def test_cookie_without_session(self):
+        client = Client()
+        client.cookies['dj_pylti_token'] = self.token()
+        with self.assertNumQueries(0):
+            response = client.get('/lti/name/')
+        self.assertEqual(response.content, b'Gomer Pile')
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_header(self):
+        token = self.token()
+        with self.assertNumQueries(0):
+            response = Client().get('/lti/any/', HTTP_X_LTI_TOKEN=token)
+        self.assertEqual(response.status_code, 200)
+
+    def test_claims(self):
+        claims, user_pk, name = read_token(self.token())
+        self.assertEqual(claims['context_id'], 'MITx/ODL_ENG/2014_T1')
+        self.assertEqual(claims['roles'], 'Instructor')
+        self.assertEqual(claims['oauth_consumer_key'], self.consumer.key)
+        self.assertEqual(name, 'Gomer Pile')
+
+    def test_tampered_token_falls_back_to_session(self):
+        token = self.token()
+        response = Client().get('/lti/close_session',
+                                HTTP_X_LTI_TOKEN=token + 'x')
+        self.assertEqual(response.status_code, 500)
+
+    def test_close_session_drops_cookie(self):
+        self.token()
+        response = self.app.get('/lti/close_session')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies['dj_pylti_token'].value, '')
+
+    def test_expired(self):
+        token = make_token({'user_id': 'u'}, 1)
+        with override_settings(PYLTI_CONFIG=dict(TOKEN_CONFIG,
+                                                 launch_token_max_age=-1)):
+            self.assertIsNone(read_token(token))
+        self.assertIsNotNone(read_token(token))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_trees
+------------
+
+Tests for `dj-pylti` OptionList trees.
+"""
+
+from django.test import TestCase
+
+from dj_pylti.models import Configuration, OptionList
+from dj_pylti.trees import path_segment
+
+
+class TestOptionListPath(TestCase):
+
+    def setUp(self):
+        self.config = Configuration.objects.create(launch_url='/launch')
+        self.root = OptionList.objects.create(name='course_navigation',
+                                              config=self.config)
+        self.child = OptionList.objects.create(name='labels',
+                                               parent=self.root)
+        self.leaf = OptionList.objects.create(name='labels',
+                                              parent=self.child)
+
+    def test_path_and_depth(self):
+        leaf = OptionList.objects.get(pk=self.leaf.pk)
+        self.assertEqual(leaf.path, path_segment(self.root.pk) +
+                         path_segment(self.child.pk) +
+                         path_segment(self.leaf.pk))
+        self.assertEqual(leaf.depth, 2)
+        self.assertEqual(leaf.root_config, self.config)
+        self.assertEqual(list(self.config.option_tree()),
+                         [self.root, self.child, self.leaf])
+
+    def test_move_subtree(self):
+        other = Configuration.objects.create(launch_url='/other')
+        new_root = OptionList.objects.create(name='editor_button',
+                                             config=other)
+        self.child.parent = new_root
+        self.child.save()
+        leaf = OptionList.objects.get(pk=self.leaf.pk)
+        self.assertEqual(leaf.path, path_segment(new_root.pk) +
+                         path_segment(self.child.pk) +
+                         path_segment(self.leaf.pk))
+        self.assertEqual(leaf.root_config, other)
+        self.assertEqual(list(self.config.option_tree()), [self.root])
+
+    def test_cycle(self):
+        self.root.parent = self.leaf
+        with self.assertRaises(ValueError):
+            self.root.save()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_urlfix
+------------
+
+Tests for `dj-pylti` PYLTI_URL_FIX rewriting.
+"""
+
+from django.test import TestCase, override_settings
+
+from dj_pylti.urlfix import URLRewriter, fix_url
+
+
+class TestURLRewriter(TestCase):
+
+    def test_longest_prefix_wins(self):
+        rewriter = URLRewriter({
+            'https://lms/': {'https://': 'http://'},
+            'https://lms/courses/': {'lms': 'proxy', 'courses': 'c'},
+        })
+        self.assertEqual(rewriter.rewrite('https://lms/courses/1'),
+                         'https://proxy/c/1')
+        self.assertEqual(rewriter.rewrite('https://lms/other'),
+                         'http://lms/other')
+        self.assertEqual(rewriter.rewrite('https://elsewhere/'),
+                         'https://elsewhere/')
+
+    def test_single_pass(self):
+        rewriter = URLRewriter({'http://a/': {'a': 'b', 'b': 'c'}})
+        self.assertEqual(rewriter.rewrite('http://a/b'), 'http://b/c')
+
+    def test_reloads_with_settings(self):
+        self.assertEqual(fix_url('http://edx/'), 'http://edx/')
+        with override_settings(PYLTI_CONFIG={'PYLTI_URL_FIX': {
+                'http://edx/': {'edx': 'proxy'}}}):
+            self.assertEqual(fix_url('http://edx/'), 'http://proxy/')
+        self.assertEqual(fix_url('http://edx/'), 'http://edx/')
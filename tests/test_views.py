@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_views
+------------
+
+Tests for `dj-pylti` views.
+"""
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from dj_pylti.models import (Configuration, OptionList, OptionProperty,
+                             PropertyName, config_version)
+
+
+class TestConfigurationView(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.config = Configuration.objects.create(
+            launch_url='/launch', title='Tool', description='A tool',
+            properties_privacy_level='public')
+        self.url_name = PropertyName.objects.create(name='url')
+        for name in ('course_navigation', 'editor_button'):
+            option = OptionList.objects.create(name=name, config=self.config)
+            OptionProperty.objects.create(option=self.url_name,
+                                          value='/' + name,
+                                          option_list=option)
+            child = OptionList.objects.create(name='labels', parent=option)
+            self.label = OptionProperty.objects.create(
+                option=PropertyName.objects.create(name='en'),
+                value='Tool', option_list=child)
+        self.url = reverse('dj_pylti:lti_config',
+                           kwargs={'pk': self.config.pk})
+
+    def test_fixed_number_of_queries(self):
+        # configuration, option tree, properties
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, '<lticm:property name="url">'
+                                      '/editor_button</lticm:property>')
+        self.assertContains(response, '<lticm:options name="labels">',
+                            count=2)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(
+            self.url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304)
+
+    def test_edit_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        self.label.value = 'Renamed'
+        self.label.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed')
+
+    def test_deep_tree(self):
+        parent = OptionList.objects.get(name='course_navigation')
+        for depth in range(10):
+            parent = OptionList.objects.create(name='labels', parent=parent)
+        OptionProperty.objects.create(option=self.url_name, value='/deep',
+                                      option_list=parent)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, '<lticm:options name="labels">',
+                            count=12)
+        self.assertContains(response, '/deep')
+
+
+class TestConfigVersionOnCommit(TransactionTestCase):
+
+    def test_bumped_again_on_commit(self):
+        cache.clear()
+        with transaction.atomic():
+            Configuration.objects.create(
+                launch_url='/launch', title='Tool', description='A tool')
+            # what a concurrent render would have cached the old rows under
+            during = config_version()
+        self.assertNotEqual(config_version(), during)
+        self.assertEqual(config_version(), config_version())
@@ -2,9 +2,13 @@
 from __future__ import unicode_literals, absolute_import
 
 from django.conf.urls import url, include
+from django.contrib import admin
 
 from dj_pylti.urls import urlpatterns as dj_pylti_urls
 
 urlpatterns = [
+    url(r'^admin/', admin.site.urls),
     url(r'^', include(dj_pylti_urls, namespace='dj_pylti')),
+    # dj_pylti/tests.py reverses against this namespace
+    url(r'^lti/', include(dj_pylti_urls, namespace='lti-tests')),
 ]